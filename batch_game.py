@@ -0,0 +1,340 @@
+import numpy as np
+import card_utils
+from constants import YES, NO, NUM_PLAYERS, DECK_SIZE, HS_SIZE
+from exceptions import GameConfigException
+
+NUM_HS = len(card_utils.ALL_HALFSUITS)
+# CARD_BITS[c] is the card mask of card c
+CARD_BITS = np.uint64(1) << np.arange(DECK_SIZE, dtype=np.uint64)
+HS_MASKS = np.array(card_utils.HS_MASKS, dtype=np.uint64)
+FULL_MASK = np.uint64(card_utils.FULL_MASK)
+CARD_HS = np.array(card_utils.CARD_HS, dtype=np.intp)
+# Card ids grouped by half suit, in the order Player looks through them
+HS_ORDER = np.array([c for cards in card_utils.HS_CARDS for c in cards], dtype=np.intp)
+# TEAMMATES[ID % 2] and OPPONENTS[ID % 2] are the player ids in increasing order
+TEAMMATES = np.array([range(0, NUM_PLAYERS, 2), range(1, NUM_PLAYERS, 2)], dtype=np.intp)
+OPPONENTS = TEAMMATES[::-1]
+
+
+class BatchFishGame:
+    """
+    Many Fish games played in lockstep, with the state of every game stacked in numpy arrays.
+    Each call to step plays one turn of every game that has not finished, the way one
+    pass through the loop in FishGame.run_whole_game does, so the rules, calls and scores
+    are the same as playing each game with FishGame.
+
+    hands[g, ID]: card mask of the cards player ID has in game g
+    yes[g, observer, ID]: card mask of the cards the observer knows player ID has
+    no[g, observer, ID]: card mask of the cards the observer knows player ID does not have
+    hs_info[g, observer, ID, hs]: the observer's minimum for player ID's cards in the half suit
+    remaining[g]: card mask of the half suits that have not been called
+
+    yes, no and hs_info hold the same information as each Player's info and hs_info
+    tables, and are propagated with the same four rules as the Propagator. Storing a
+    row of the info table as two card masks lets the rules be checked for every game,
+    observer and player at once with a few bitwise operations. knowledge() returns the
+    tables in the same YES/NO/UNSURE form as the info tables.
+
+    Games that finish are retired: their results are written to the result arrays
+    (indexed by the game's original number) and they are dropped from the state arrays.
+    """
+
+    def __init__(self, hands, start, team1_score=None, team0_score=None, rng=None):
+        """
+        :param hands: num_games x NUM_PLAYERS array of card masks
+        :param start: array of the player who starts each game
+        :param team1_score: array of starting scores for team 1, 0 if None
+        :param team0_score: array of starting scores for team 0, 0 if None
+        :param rng: numpy Generator used by the policies. A new one is made if None
+        """
+        hands = np.array(hands, dtype=np.uint64)
+        num_games = len(hands)
+        if np.any(hands & ~FULL_MASK):
+            raise GameConfigException("Not a valid card mask!")
+        if np.any(np.bitwise_count(hands).sum(axis=1) != np.bitwise_count(np.bitwise_or.reduce(hands, axis=1))):
+            raise GameConfigException("There is a duplicate card!")
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.num_games = num_games
+        self.ids = np.arange(num_games)
+        self.hands = hands
+        self.turn = np.array(start, dtype=np.intp)
+        self.turns = np.zeros(num_games, dtype=np.int64)
+        self.remaining = np.full(num_games, FULL_MASK, dtype=np.uint64)
+        # Every player starts knowing their own hand, like Player.player_start_of_game
+        self.yes = np.zeros((num_games, NUM_PLAYERS, NUM_PLAYERS), dtype=np.uint64)
+        self.no = np.zeros((num_games, NUM_PLAYERS, NUM_PLAYERS), dtype=np.uint64)
+        self.hs_info = np.zeros((num_games, NUM_PLAYERS, NUM_PLAYERS, NUM_HS), dtype=np.int8)
+        own = np.arange(NUM_PLAYERS)
+        self.yes[:, own, own] = hands
+        self.no[:, own, own] = ~hands & FULL_MASK
+        self.hs_info[:, own, own] = np.bitwise_count(hands[:, :, None] & HS_MASKS)
+
+        self.final_team1_score = np.zeros(num_games, dtype=np.int64) if team1_score is None \
+            else np.array(team1_score, dtype=np.int64)
+        self.final_team0_score = np.zeros(num_games, dtype=np.int64) if team0_score is None \
+            else np.array(team0_score, dtype=np.int64)
+        self.final_turns = np.zeros(num_games, dtype=np.int64)
+        self.timed_out = np.zeros(num_games, dtype=bool)
+        self.team1_score = self.final_team1_score.copy()
+        self.team0_score = self.final_team0_score.copy()
+        self._propagate(np.arange(num_games))
+
+    @classmethod
+    def start_random_games(cls, num_games, rng=None):
+        """
+        Deals 9 random cards to NUM_PLAYERS players in each game and assigns someone at random to start,
+        like FishGame.start_random_game
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        order = rng.random((num_games, DECK_SIZE)).argsort(axis=1)
+        owner = np.empty_like(order)
+        np.put_along_axis(owner, order, np.arange(DECK_SIZE) // (DECK_SIZE // NUM_PLAYERS), axis=1)
+        hands = np.zeros((num_games, NUM_PLAYERS), dtype=np.uint64)
+        for ID in range(NUM_PLAYERS):
+            hands[:, ID] = np.bitwise_or.reduce(np.where(owner == ID, CARD_BITS, np.uint64(0)), axis=1)
+        return cls(hands, rng.integers(0, NUM_PLAYERS, num_games), rng=rng)
+
+    @classmethod
+    def from_games(cls, games, rng=None):
+        """
+        Makes a batch with the starting hands, turns and scores of a list of FishGames
+        """
+        hands = [[card_utils.cards_to_mask(game.player_cards[ID]) for ID in range(NUM_PLAYERS)] for game in games]
+        return cls(hands, [game.turn for game in games], [game.team1_score for game in games],
+                   [game.team0_score for game in games], rng=rng)
+
+    @property
+    def num_cards(self):
+        """
+        num_active x NUM_PLAYERS array of how many cards each player has
+        """
+        return np.bitwise_count(self.hands).astype(np.int64)
+
+    def knowledge(self):
+        """
+        Returns every observer's info table as a num_active x NUM_PLAYERS x NUM_PLAYERS x DECK_SIZE
+        int8 array of YES/NO/UNSURE, indexed [game, observer, player ID, card id]
+        """
+        yes = (self.yes[..., None] & CARD_BITS) != 0
+        no = (self.no[..., None] & CARD_BITS) != 0
+        return yes.astype(np.int8) * YES + no.astype(np.int8) * NO
+
+    def _propagate(self, games):
+        """
+        Resolves entries of the given games until nothing more can be deduced,
+        with the rules of the Propagator:
+        NO if another player has YES for the card (rule 1)
+        YES if every other player has NO for the card (rule 2)
+        YES if the player has no room left for another NO in the half suit (rule 3)
+        YES if the player has no room left for another NO at all (rule 4)
+        Each pass applies the rules to every entry at once, and only games that
+        changed are looked at again.
+        :param games: array of indices into the state arrays
+        """
+        num_cards = self.num_cards
+        while len(games):
+            yes = self.yes[games]
+            no = self.no[games]
+            unsure = ~(yes | no) & FULL_MASK
+            new_no = unsure & np.bitwise_or.reduce(yes, axis=2)[:, :, None]
+            # Cards that at least 2 players are not known not to have.
+            # An UNSURE entry of any other card is the only one left for its card
+            not_no_once = np.zeros(no.shape[:2], dtype=np.uint64)
+            not_no_twice = np.zeros(no.shape[:2], dtype=np.uint64)
+            for ID in range(NUM_PLAYERS):
+                not_no_twice |= not_no_once & ~no[:, :, ID]
+                not_no_once |= ~no[:, :, ID]
+            hs_full = self.hs_info[games] + np.bitwise_count(no[..., None] & HS_MASKS) >= HS_SIZE
+            must_have = np.bitwise_or.reduce(np.where(hs_full, HS_MASKS, np.uint64(0)), axis=3)
+            must_have |= ~not_no_twice[:, :, None]
+            must_have &= self.remaining[games, None, None]
+            no_room = num_cards[games][:, None, :] + np.bitwise_count(no) >= DECK_SIZE
+            must_have |= np.where(no_room, FULL_MASK, np.uint64(0))
+            new_yes = unsure & must_have & ~new_no
+            changed = np.any((new_yes | new_no) != 0, axis=(1, 2))
+            self.yes[games] = yes | new_yes
+            self.no[games] = no | new_no
+            games = games[changed]
+
+    def find_calls(self):
+        """
+        Finds the call each game would make, the way FishGame.check_call does:
+        the first player (by ID) whose info shows their team has all of a half suit calls the first such half suit
+        :return: caller and half suit arrays, -1 for games without a call
+        """
+        observers = np.arange(NUM_PLAYERS)
+        team_yes = np.bitwise_or.reduce(self.yes[:, observers[:, None], TEAMMATES[observers % 2]], axis=2)
+        callable_hs = (team_yes[:, :, None] & HS_MASKS) == HS_MASKS
+        flat = callable_hs.reshape(len(team_yes), NUM_PLAYERS * NUM_HS)
+        has_call = flat.any(axis=1)
+        first = flat.argmax(axis=1)
+        caller = np.where(has_call, first // NUM_HS, -1)
+        hs = np.where(has_call, first % NUM_HS, -1)
+        return caller, hs
+
+    def report_calls(self, games, callers, hs):
+        """
+        Scores and applies calls, like FishGame.check_call_correct and FishGame.report_call
+        :param games: array of indices into the state arrays
+        :param callers: array of the player calling in each game
+        :param hs: array of the half suit being called in each game
+        :return: array of whether each call was correct
+        """
+        masks = HS_MASKS[hs]
+        team = callers % 2
+        teammates = TEAMMATES[team]
+        claimed = self.yes[games[:, None], callers[:, None], teammates] & masks[:, None]
+        success = np.all((claimed & ~self.hands[games[:, None], teammates]) == 0, axis=1)
+        team1_point = success == (team == 1)
+        self.team1_score[games] += team1_point
+        self.team0_score[games] += ~team1_point
+
+        self.hands[games] &= ~masks[:, None]
+        self.remaining[games] &= ~masks
+        self.yes[games] &= ~masks[:, None, None]
+        self.no[games] |= masks[:, None, None]
+        self.hs_info[games, :, :, hs] = 0
+        self._propagate(games)
+        return success
+
+    def report_asks(self, games, askers, targets, cards):
+        """
+        Applies asks, like FishGame.report_ask and Player.update_transaction
+        :param games: array of indices into the state arrays
+        :param askers: array of the player asking in each game
+        :param targets: array of the player being asked in each game
+        :param cards: array of the card id being asked in each game
+        :return: array of whether each ask was successful
+        """
+        bits = CARD_BITS[cards]
+        success = (self.hands[games, targets] & bits) != 0
+        taken = np.where(success, bits, np.uint64(0))
+        self.hands[games, askers] |= taken
+        self.hands[games, targets] &= ~taken
+
+        h = CARD_HS[cards]
+        everyone = np.arange(NUM_PLAYERS)
+        g = games[:, None]
+        ask_hs = self.hs_info[g, everyone, askers[:, None], h[:, None]]
+        target_hs = self.hs_info[g, everyone, targets[:, None], h[:, None]]
+        self.hs_info[g, everyone, askers[:, None], h[:, None]] = np.maximum(ask_hs, 1) + success[:, None]
+        self.hs_info[g, everyone, targets[:, None], h[:, None]] = np.where(
+            success[:, None], np.maximum(target_hs - 1, 0), target_hs)
+
+        # A successful ask overrides whatever the asker and target were known to have
+        ask_yes = self.yes[games, :, askers]
+        ask_no = self.no[games, :, askers]
+        s, b = success[:, None], bits[:, None]
+        self.yes[games, :, askers] = np.where(s, ask_yes | b, ask_yes)
+        self.no[games, :, askers] = np.where(s, ask_no & ~b, ask_no | b)
+        self.yes[games, :, targets] &= ~bits[:, None]
+        self.no[games, :, targets] |= bits[:, None]
+        self._propagate(games)
+        return success
+
+    def step(self, policy):
+        """
+        Plays one turn of every active game: calls, then one ask from the player who has the turn
+        Games that end are retired
+        :param policy: function (batch, asker array) -> (target array, card id array)
+        """
+        finished = np.all(self.hands == 0, axis=1)
+        self._retire(finished)
+
+        games = np.arange(len(self.ids))
+        caller, hs = self.find_calls()
+        while np.any(caller >= 0):
+            called = caller >= 0
+            self.report_calls(games[called], caller[called], hs[called])
+            caller, hs = self.find_calls()
+
+        # When there is 1 team left with cards, the game ends
+        team_cards = np.bitwise_or.reduce(self.hands[:, TEAMMATES], axis=2)
+        self._retire(np.any(team_cards == 0, axis=1))
+        if not len(self.ids):
+            return
+
+        games = np.arange(len(self.ids))
+        # If it's a player's turn and they have no cards, pass to the teammate on their right
+        for _ in range(NUM_PLAYERS // 2):
+            empty = self.hands[games, self.turn] == 0
+            self.turn[empty] = (self.turn[empty] + 2) % NUM_PLAYERS
+        askers = self.turn.copy()
+        targets, cards = policy(self, askers)
+        success = self.report_asks(games, askers, targets, cards)
+        self.turn = np.where(success, askers, targets)
+        self.turns += 1
+
+    def _retire(self, done):
+        """
+        Writes the results of the games in done to the result arrays and removes them from the state arrays
+        """
+        if not np.any(done):
+            return
+        ids = self.ids[done]
+        self.final_team1_score[ids] = self.team1_score[done]
+        self.final_team0_score[ids] = self.team0_score[done]
+        self.final_turns[ids] = self.turns[done]
+        keep = ~done
+        for name in ("ids", "hands", "turn", "turns", "remaining", "yes", "no", "hs_info",
+                     "team1_score", "team0_score"):
+            setattr(self, name, getattr(self, name)[keep])
+
+    def run_all_games(self, policy=None, max_turns=1000):
+        """
+        Plays every game to the end, like FishGame.run_whole_game
+        :param policy: function (batch, asker array) -> (target array, card id array).
+        heuristic_policy if None
+        :param max_turns: longest a game can go on before it is forced to end
+        :return: array of whether each game went on longer than max_turns
+        """
+        if policy is None:
+            policy = heuristic_policy
+        while len(self.ids):
+            over = self.turns > max_turns
+            self.timed_out[self.ids[over]] = True
+            self._retire(over)
+            if len(self.ids):
+                self.step(policy)
+        return self.timed_out
+
+
+def legal_asks(batch, askers):
+    """
+    Returns the card mask of the cards each asker can legally ask for:
+    cards they do not have in a half suit they have a card in
+    """
+    hands = batch.hands[np.arange(len(askers)), askers]
+    has_hs = (hands[:, None] & HS_MASKS) != 0
+    return np.bitwise_or.reduce(np.where(has_hs, HS_MASKS, np.uint64(0)), axis=1) & ~hands
+
+
+def random_policy(batch, askers):
+    """
+    Asks a random opponent for a random legal card
+    """
+    rng = batch.rng
+    targets = OPPONENTS[askers % 2, rng.integers(0, NUM_PLAYERS // 2, len(askers))]
+    legal = (legal_asks(batch, askers)[:, None] & CARD_BITS) != 0
+    cards = np.where(legal, rng.random(legal.shape), -1.0).argmax(axis=1)
+    return targets, cards
+
+
+def heuristic_policy(batch, askers):
+    """
+    The first step of Player.make_optimal_ask: asks for a card an opponent is known to have in a half suit
+    the asker has a card in, looking through half suits, then cards, then opponents in order.
+    Otherwise falls back to random_policy, since card probabilities are not computed in batches
+    """
+    games = np.arange(len(askers))
+    opponents = OPPONENTS[askers % 2]
+    known = batch.yes[games[:, None], askers[:, None], opponents] & legal_asks(batch, askers)[:, None]
+    known = (known[:, :, None] & CARD_BITS[HS_ORDER]) != 0
+    flat = known.transpose(0, 2, 1).reshape(len(askers), DECK_SIZE * len(TEAMMATES[0]))
+    guarenteed = flat.any(axis=1)
+    first = flat.argmax(axis=1)
+    targets, cards = random_policy(batch, askers)
+    targets = np.where(guarenteed, opponents[games, first % (NUM_PLAYERS // 2)], targets)
+    cards = np.where(guarenteed, HS_ORDER[first // (NUM_PLAYERS // 2)], cards)
+    return targets, cards
@@ -0,0 +1,225 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+import card_utils
+import encoding
+from constants import NO, NUM_PLAYERS, SIZE_STATES
+from game import FishGame
+from player import Player
+
+# Each scenario is seeded, so every run measures the same work
+SEED = 2020
+
+
+class Scenario:
+    """
+    A benchmark scenario: a piece of work that is timed many times
+
+    setup() returns the argument for one run of op and is not timed
+    op(arg) is the timed work
+    """
+
+    def __init__(self, setup, op, iterations):
+        self.setup = setup
+        self.op = op
+        self.iterations = iterations
+
+    def run(self, iterations=None):
+        """
+        Times op iterations times
+        :return: dictionary of ops per second, latency percentiles in microseconds and peak memory in KB
+        """
+        iterations = iterations or self.iterations
+        times = np.empty(iterations)
+        self.op(self.setup())
+        for i in range(iterations):
+            arg = self.setup()
+            start = time.perf_counter_ns()
+            self.op(arg)
+            times[i] = time.perf_counter_ns() - start
+        # Memory is measured in a separate pass, since tracemalloc slows everything down
+        tracemalloc.start()
+        for _ in range(min(iterations, 10)):
+            self.op(self.setup())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        times /= 1000
+        return {
+            "iterations": iterations,
+            "ops_per_sec": float(1e6 / times.mean()),
+            "mean_us": float(times.mean()),
+            "p50_us": float(np.percentile(times, 50)),
+            "p99_us": float(np.percentile(times, 99)),
+            "peak_memory_kb": peak / 1024,
+        }
+
+
+def _mid_game_player(num_asks=30):
+    """
+    Returns a player (that owns its public knowledge) after the first num_asks asks of a seeded game,
+    and the next ask of that game
+    """
+    game = FishGame.start_random_game(rng=random.Random(SEED))
+    own_hand = list(game.player_cards[0])
+    asks = []
+    report_ask = game.report_ask
+
+    def record_ask(*ask):
+        asks.append(ask)
+        report_ask(*ask)
+    game.report_ask = record_ask
+    game.run_whole_game(max_turns=num_asks)
+    player = Player.player_start_of_game(0, own_hand, rng=random.Random(SEED))
+    for ask in asks[:num_asks]:
+        player.update_transaction(*ask)
+    player.info
+    return player, asks[num_asks]
+
+
+def _rolled_back(player):
+    marker = player.checkpoint()
+
+    def setup():
+        player.rollback(marker)
+        return player
+    return setup
+
+
+def start_of_game():
+    hand = card_utils.ALL_CARDS[:9]
+    return Scenario(lambda: hand, lambda own: Player.player_start_of_game(0, own), 500)
+
+
+def update_transaction():
+    player, ask = _mid_game_player()
+
+    def op(p):
+        p.update_transaction(*ask)
+        p.info
+    return Scenario(_rolled_back(player), op, 2000)
+
+
+def update_call():
+    player, _ = _mid_game_player()
+    hs = player.remaining_hs[0]
+    h = card_utils.HS_IDS[hs]
+    # Each card is counted for the first player who might have it, which is close enough for timing
+    counts = {ID: 0 for ID in range(NUM_PLAYERS)}
+    for c in card_utils.HS_CARDS[h]:
+        holders = [ID for ID in range(NUM_PLAYERS) if player.info.array[ID, c] != NO]
+        counts[holders[0]] += 1
+
+    def op(p):
+        p.update_call(hs, counts)
+        p.info
+    return Scenario(_rolled_back(player), op, 2000)
+
+
+def endgame_update():
+    # The endgame case from TestPlayer.test_update_info_endgame
+    def setup():
+        p = Player.player_start_of_game(0, ["2h", "3h"])
+        p.num_cards = {0: 2, 1: 0, 2: 2, 3: 0, 4: 2, 5: 0}
+        for c in card_utils.gen_all_cards():
+            for ID in range(NUM_PLAYERS):
+                if c not in card_utils.find_cards("Lh") or ID in p._get_opponents():
+                    p.info[ID][c] = NO
+        p.info[2]["4h"] = NO
+        p.info[2]["5h"] = NO
+        return p
+    return Scenario(setup, lambda p: p._update_info(), 500)
+
+
+def whole_game():
+    seeds = iter(range(SEED, SEED + 10 ** 6))
+    return Scenario(lambda: FishGame.start_random_game(rng=random.Random(next(seeds))),
+                    lambda game: game.run_whole_game(), 10)
+
+
+def state_vector():
+    player, _ = _mid_game_player()
+    out = np.empty(SIZE_STATES, dtype=np.float32)
+    return Scenario(lambda: player,
+                    lambda p: encoding.generate_state_vector(p.info, p.hs_info, p.num_cards, p.public_info, 3, out=out),
+                    20000)
+
+
+# Functions that build each scenario, by scenario name
+SCENARIOS = {
+    "player_start_of_game": start_of_game,
+    "update_transaction": update_transaction,
+    "update_call": update_call,
+    "endgame_update_info": endgame_update,
+    "run_whole_game": whole_game,
+    "generate_state_vector": state_vector,
+}
+
+
+def run_benchmarks(names=None, scale=1.0):
+    """
+    Runs the benchmark scenarios
+    :param names: names of the scenarios to run, all of them if None
+    :param scale: multiplies the number of iterations of each scenario
+    :return: dictionary of {scenario name: results}
+    """
+    results = {}
+    for name, make_scenario in SCENARIOS.items():
+        if not names or name in names:
+            scenario = make_scenario()
+            results[name] = scenario.run(max(1, int(scenario.iterations * scale)))
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compares results with a baseline from an earlier run
+    :param threshold: how much slower (as a fraction) a scenario's p50 latency can be before it is a regression
+    :return: list of (scenario name, baseline p50, new p50) for every regression
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["p50_us"] > baseline[name]["p50_us"] * (1 + threshold):
+            regressions.append((name, baseline[name]["p50_us"], result["p50_us"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Fish engine hot paths")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run (default: all): " + ", ".join(SCENARIOS))
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction a p50 latency can grow before it is a regression")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the number of iterations")
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario " + name)
+
+    results = run_benchmarks(args.scenarios, args.scale)
+    print("{:<24}{:>14}{:>12}{:>12}{:>14}".format("scenario", "ops/sec", "p50 us", "p99 us", "peak KB"))
+    for name, result in results.items():
+        print("{:<24}{:>14.1f}{:>12.1f}{:>12.1f}{:>14.1f}".format(
+            name, result["ops_per_sec"], result["p50_us"], result["p99_us"], result["peak_memory_kb"]))
+    if args.output:
+        meta = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print("REGRESSION {}: p50 {:.1f}us -> {:.1f}us".format(name, old, new))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
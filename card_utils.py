@@ -54,4 +54,92 @@ def gen_all_suits():
 
 def gen_all_halfsuits():
     for hs in ["Lc", "Hc", "Ld", "Hd", "Lh", "Hh", "Ls", "Hs", "8J"]:
-        yield hs
\ No newline at end of file
+        yield hs
+
+# Integer card representation
+# Cards are numbered 0-53 in the order of gen_all_cards and half suits 0-8
+# in the order of gen_all_halfsuits. A set of cards is a 54 bit integer mask
+# where bit i is set if card i is in the set.
+ALL_CARDS = tuple(gen_all_cards())
+ALL_HALFSUITS = tuple(gen_all_halfsuits())
+CARD_IDS = {card: i for i, card in enumerate(ALL_CARDS)}
+HS_IDS = {hs: i for i, hs in enumerate(ALL_HALFSUITS)}
+
+# CARD_HS[card_id] is the half suit id of the card
+CARD_HS = tuple(HS_IDS[find_half_suit(card)] for card in ALL_CARDS)
+# HS_CARDS[hs_id] is a tuple of the card ids in the half suit
+HS_CARDS = tuple(tuple(CARD_IDS[card] for card in find_cards(hs)) for hs in ALL_HALFSUITS)
+# HS_CARD_NAMES[hs_id] is a tuple of the card names in the half suit
+HS_CARD_NAMES = tuple(tuple(ALL_CARDS[c] for c in cards) for cards in HS_CARDS)
+# HS_MASKS[hs_id] is the card mask of the half suit
+HS_MASKS = tuple(sum(1 << c for c in cards) for cards in HS_CARDS)
+FULL_MASK = (1 << len(ALL_CARDS)) - 1
+
+
+def card_id(card_name):
+    """
+    Returns the integer id (0-53) of a card name
+    """
+    return CARD_IDS[card_name]
+
+
+def card_name(card_id):
+    """
+    Returns the card name of an integer card id
+    """
+    return ALL_CARDS[card_id]
+
+
+def hs_id(hs_name):
+    """
+    Returns the integer id (0-8) of a half suit name
+    """
+    return HS_IDS[hs_name]
+
+
+def hs_name(hs_id):
+    """
+    Returns the half suit name of an integer half suit id
+    """
+    return ALL_HALFSUITS[hs_id]
+
+
+def cards_to_mask(card_names):
+    """
+    Converts an iterable of card names into a card mask
+    """
+    mask = 0
+    for card in card_names:
+        mask |= 1 << CARD_IDS[card]
+    return mask
+
+
+def mask_to_cards(mask):
+    """
+    Converts a card mask into a list of card names, in gen_all_cards order
+    """
+    return [ALL_CARDS[c] for c in iter_mask(mask)]
+
+
+def iter_mask(mask):
+    """
+    Generator that returns the card ids in a card mask, lowest first
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask):
+    """
+    Returns the number of cards in a card mask
+    """
+    return bin(mask).count("1")
+
+
+def hs_of_mask(mask):
+    """
+    Returns the half suit ids that have at least one card in the card mask
+    """
+    return [h for h, hs_mask in enumerate(HS_MASKS) if mask & hs_mask]
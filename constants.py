@@ -1,5 +1,24 @@
 # Hyperparameters for training
 GAMMA = 0.999
+REPLAY_MEMORY_SIZE = 100000 # Number of transitions kept for training
+
+# Constants for search
+TRANSPOSITION_CACHE_SIZE = 100000 # Number of propagation results kept in a TranspositionCache
+ISMCTS_ITERATIONS = 200 # Iterations of ISMCTS per ask
+ISMCTS_EXPLORATION = 0.05 # UCB exploration constant of ISMCTS, small since one ask changes a result little
+ISMCTS_PRIOR_WEIGHT = 3.0 # Weight of the success probability of an ask at the root of ISMCTS
+ISMCTS_ROLLOUT_DEPTH = 5 # Random asks played out after leaving the ISMCTS tree
+ENDGAME_CARDS = 12 # The endgame solver plays once at most this many cards are left
+ENDGAME_SAMPLES = 20 # Deals each ask is tried in by the endgame solver
+ENDGAME_NODE_LIMIT = 20000 # Most positions the endgame solver searches to solve one position
+ENDGAME_MEMO_SIZE = 1000000 # Most positions kept in the endgame solver's memo table
+SPRT_ELO0 = 0 # Elo difference of the null hypothesis of a tournament's sequential test
+SPRT_ELO1 = 30 # Elo difference of the alternative hypothesis
+SPRT_ALPHA = 0.05 # Chance of accepting the alternative when the null hypothesis is true
+SPRT_BETA = 0.05 # Chance of accepting the null hypothesis when the alternative is true
+TOURNAMENT_MAX_PAIRS = 1000 # Most pairs of games a match plays before it stops undecided
+INFERENCE_MAX_BATCH = 256 # Most states the inference server evaluates in one forward pass
+INFERENCE_MAX_DELAY = 0.002 # Seconds the inference server waits for a batch to fill up
 
 # Rewards for training
 REWARD_SUCCESSFUL_ASK = 1
@@ -10,7 +29,7 @@ REWARD_WIN = 100
 REWARD_LOSE = -100
 
 # Constants for state and action tables
-SIZE_STATES = 762
+SIZE_STATES = 708
 SIZE_ACTIONS = 162
 
 # Constants for information in info dict
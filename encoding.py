@@ -0,0 +1,123 @@
+import numpy as np
+import card_utils
+import constants
+from tables import CardTable, HalfSuitTable, CardCounts
+
+# Where each table starts in a state vector
+STATE_INFO = 0
+STATE_PUBLIC_INFO = STATE_INFO + constants.NUM_PLAYERS * constants.DECK_SIZE
+STATE_HS_INFO = STATE_PUBLIC_INFO + constants.NUM_PLAYERS * constants.DECK_SIZE
+STATE_NUM_CARDS = STATE_HS_INFO + constants.NUM_PLAYERS * len(card_utils.ALL_HALFSUITS)
+# SEAT_ORDERS[ID] is the order of players in a state vector for player ID
+SEAT_ORDERS = np.array([[(ID + i) % constants.NUM_PLAYERS for i in range(constants.NUM_PLAYERS)]
+                        for ID in range(constants.NUM_PLAYERS)], dtype=np.intp)
+
+
+def generate_state_vector(info, hs_info, num_cards, public_info, ID_player, out=None):
+    """
+    Generates a state vector from the player's information
+
+    The structure of the state vector is as follows:
+    Length: 708 (SIZE_STATES)
+    The order of players in each section starts with the ID of the player
+    and counts up mod 6 (example: 3, 4, 5, 0, 1, 2)
+    The order of cards is defined in card_utils.gen_all_cards
+    The first 54 * 6 = 324 entries are for the info dict, with the values
+    being the same as in the info dict
+    The next 54 * 6 = 324 entries are for the public_info dict, with the values
+    being the same as in the public_info dict
+    The next 9 * 6 = 54 entries are for the hs_info, with the values
+    being the same as in the hs_info dict
+    The last 6 entries are the number of cards each player has
+
+    :param info: defined in Player class
+    :param hs_info: defined in Player class
+    :param num_cards: defined in Player class
+    :param public_info: defined in Player class
+    :param ID_player: ID of the player
+    :param out: numpy array of length SIZE_STATES (for example a row of a batch matrix)
+    that the state is written into. If None, a new int8 array is made
+    :return: a state vector (out, if it was given)
+    """
+    if out is None:
+        out = np.empty(constants.SIZE_STATES, dtype=np.int8)
+    order = SEAT_ORDERS[ID_player]
+    out[STATE_INFO:STATE_PUBLIC_INFO] = CardTable.coerce(info).array[order].ravel()
+    out[STATE_PUBLIC_INFO:STATE_HS_INFO] = CardTable.coerce(public_info).array[order].ravel()
+    out[STATE_HS_INFO:STATE_NUM_CARDS] = HalfSuitTable.coerce(hs_info).array[order].ravel()
+    out[STATE_NUM_CARDS:] = CardCounts.coerce(num_cards).array[order]
+    return out
+
+
+def generate_state_batch(info, hs_info, num_cards, public_info, ID_players, out=None):
+    """
+    Generates the state vectors of many players at once, in the same format as generate_state_vector
+    :param info: batch_size x NUM_PLAYERS x DECK_SIZE array of info tables
+    :param hs_info: batch_size x NUM_PLAYERS x 9 array of half suit info tables
+    :param num_cards: batch_size x NUM_PLAYERS array of the number of cards of each player
+    :param public_info: batch_size x NUM_PLAYERS x DECK_SIZE array of public info tables
+    :param ID_players: array of the ID of the player each state is for
+    :param out: batch_size x SIZE_STATES numpy array the states are written into.
+    If None, a new int8 array is made
+    :return: batch_size x SIZE_STATES array of state vectors (out, if it was given)
+    """
+    ID_players = np.asarray(ID_players)
+    if out is None:
+        out = np.empty((len(ID_players), constants.SIZE_STATES), dtype=np.int8)
+    rows = np.arange(len(ID_players))[:, None]
+    order = SEAT_ORDERS[ID_players]
+    out[:, STATE_INFO:STATE_PUBLIC_INFO] = np.asarray(info)[rows, order].reshape(len(rows), -1)
+    out[:, STATE_PUBLIC_INFO:STATE_HS_INFO] = np.asarray(public_info)[rows, order].reshape(len(rows), -1)
+    out[:, STATE_HS_INFO:STATE_NUM_CARDS] = np.asarray(hs_info)[rows, order].reshape(len(rows), -1)
+    out[:, STATE_NUM_CARDS:] = np.asarray(num_cards)[rows, order]
+    return out
+
+
+def generate_action_number(ID_ask, ID_target, card):
+    """
+    Generates an action vector from the player's action
+    This vector is universal to all players, meaning it is independent of player ID
+    For example, player 0 asking player 3 for a Jc will return the ]
+    same vector as player 1 asking player 4 for a Jc
+    This is to ensure that the model can be used universally among all players
+    :param ID_ask: ID of player asking
+    :param ID_target: ID of target
+    :param card: Card being asked
+    :return: Action number (0-161)
+    """
+    player_num = (((ID_target - ID_ask) % 6) - 1)//2
+    return player_num * constants.DECK_SIZE + card_utils.CARD_IDS[card]
+
+
+def generate_action_numbers(ID_asks, ID_targets, cards):
+    """
+    Generates the action numbers of many actions at once, like generate_action_number
+    :param ID_asks: array of IDs of players asking
+    :param ID_targets: array of IDs of targets
+    :param cards: array of card ids being asked
+    :return: array of action numbers (0-161)
+    """
+    player_nums = ((np.asarray(ID_targets) - ID_asks) % 6 - 1) // 2
+    return player_nums * constants.DECK_SIZE + cards
+
+
+def action_to_ask(ID_ask, action):
+    """
+    Returns the ask an action number stands for, the inverse of generate_action_number
+    :param ID_ask: ID of player asking
+    :param action: action number (0-161)
+    :return: (ID of target, card id)
+    """
+    player_num, c = divmod(int(action), constants.DECK_SIZE)
+    return (ID_ask + 2 * player_num + 1) % constants.NUM_PLAYERS, c
+
+
+def generate_reward_ask(success):
+    """
+    Generates a reward based on whether the ask was a success
+    :param success:
+    :return: reward
+    """
+    if success:
+        return constants.REWARD_SUCCESSFUL_ASK
+    return constants.REWARD_UNSUCCESSFUL_ASK
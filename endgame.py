@@ -0,0 +1,262 @@
+import random
+from collections import Counter
+import numpy as np
+import card_utils
+from card_utils import HS_MASKS, iter_mask, popcount
+from constants import NUM_PLAYERS, ENDGAME_CARDS, ENDGAME_SAMPLES, ENDGAME_NODE_LIMIT, ENDGAME_MEMO_SIZE
+from ismcts import legal_asks
+from probability import ProbabilityEngine
+
+
+def _team_mask(hands, team):
+    return hands[team] | hands[team + 2] | hands[team + 4]
+
+
+def _num_half_suits(mask):
+    return sum(1 for hs_mask in HS_MASKS if mask & hs_mask)
+
+
+def deal_to_hands(deal):
+    """
+    Converts a deal (a row of ProbabilityEngine.sample_deals) to a tuple of NUM_PLAYERS card masks
+    """
+    hands = [0] * NUM_PLAYERS
+    for c, ID in enumerate(deal.tolist() if isinstance(deal, np.ndarray) else deal):
+        if ID >= 0:
+            hands[ID] |= 1 << c
+    return tuple(hands)
+
+
+def settle(hands, turn):
+    """
+    Calls every half suit that one team has all of, and passes the turn on from a player with no cards
+    to the teammate on their right, as FishGame does
+    :param hands: tuple of NUM_PLAYERS card masks
+    :param turn: the player whose turn it is
+    :return: (hands, turn, number of half suits team 0 called, number of half suits team 1 called)
+    """
+    team0, team1 = _team_mask(hands, 0), _team_mask(hands, 1)
+    called = [0, 0]
+    done = 0
+    for hs_mask in HS_MASKS:
+        if team0 & hs_mask == hs_mask:
+            called[0] += 1
+            done |= hs_mask
+        elif team1 & hs_mask == hs_mask:
+            called[1] += 1
+            done |= hs_mask
+    if done:
+        hands = tuple(hand & ~done for hand in hands)
+    if any(hands[turn % 2::2]):
+        while not hands[turn]:
+            turn = (turn + 2) % NUM_PLAYERS
+    return hands, turn, called[0], called[1]
+
+
+def play_ask(hands, turn, target, c):
+    """
+    Plays an ask by the player whose turn it is, where every hand is known
+    :param hands: tuple of NUM_PLAYERS card masks
+    :param turn: the player whose turn it is
+    :param target: the player asked
+    :param c: id of the card asked for
+    :return: what settle returns for the position after the ask
+    """
+    bit = 1 << c
+    if not hands[target] & bit:
+        return settle(hands, target)
+    hands = list(hands)
+    hands[target] ^= bit
+    hands[turn] |= bit
+    return settle(tuple(hands), turn)
+
+
+def _asks(hands, turn):
+    """
+    Returns the (target, card id) asks the player whose turn it is can make, to opponents who have cards
+    The asks for cards the target has come first, since they are usually the best
+    """
+    hand = hands[turn]
+    wanted = 0
+    for hs_mask in HS_MASKS:
+        if hand & hs_mask:
+            wanted |= hs_mask & ~hand
+    hits, misses = [], []
+    for target in range(1 - turn % 2, NUM_PLAYERS, 2):
+        if hands[target]:
+            for c in iter_mask(wanted):
+                (hits if hands[target] >> c & 1 else misses).append((target, c))
+    return hits + misses
+
+
+def _share(hands):
+    """
+    Returns the number of half suits team 0 is expected to win if each half suit goes to a team in
+    proportion to the cards of it that the team has. Used for a position that repeats during a search
+    """
+    team0 = _team_mask(hands, 0)
+    both = team0 | _team_mask(hands, 1)
+    return sum(popcount(team0 & hs_mask) / popcount(both & hs_mask) for hs_mask in HS_MASKS if both & hs_mask)
+
+
+class _NodeLimit(Exception):
+    pass
+
+
+class EndgameSolver:
+    """
+    Plays the end of a game for the players of a game, once at most max_cards cards are left
+
+    solve searches a position where every hand is known: both teams choose their asks to win the most
+    half suits, a half suit is called as soon as one team has all of it, a failed ask passes the turn
+    to the player asked and a player with no cards passes it to a teammate. The search is depth first,
+    with the asks for cards the target has tried first, and it stops looking at a player's asks once
+    one of them wins their team every half suit left. A search that visits more than node_limit
+    positions is abandoned.
+    Asks can go back and forth, so a position that repeats on the line being searched is valued by
+    each team's share of the cards of each half suit (_share) instead of being searched again. A value
+    is exact if no such estimate went into it (or if it is every half suit left, or none of them, for
+    the team to move, reached through exact values only). Only exact values are kept in the memo table,
+    keyed on the hand bitmasks and the player whose turn it is and shared by every search of the solver,
+    so an estimate is never reused. After solve, exact tells whether the value it returned is exact.
+
+    A player does not know every hand, so make_ask plays by determinization: it draws deals
+    consistent with what the player knows (ProbabilityEngine.sample_deals), plays each of the player's
+    asks in every deal, solves the positions that follow and chooses the ask that wins the most half
+    suits on average. best_call chooses the forced call that is right in the most deals.
+
+    One solver can be shared by every player of a game (see FishGame).
+    """
+
+    def __init__(self, max_cards=ENDGAME_CARDS, samples=ENDGAME_SAMPLES, node_limit=ENDGAME_NODE_LIMIT,
+                 memo_size=ENDGAME_MEMO_SIZE, rng=None):
+        """
+        :param max_cards: make_ask plays when at most this many cards are left in the game
+        :param samples: number of deals each ask or call is tried in
+        :param node_limit: most positions one solve searches before giving up
+        :param memo_size: most positions kept in the memo table. It is emptied when it is full
+        :param rng: random.Random the deals are drawn with. If None, the global random module is used
+        """
+        self.max_cards = max_cards
+        self.samples = samples
+        self.node_limit = node_limit
+        self.memo_size = memo_size
+        self.rng = random if rng is None else rng
+        self.exact = True
+        self._memo = {}
+        self._nodes = 0
+
+    def solve(self, hands, turn):
+        """
+        Returns the number of the half suits left that team 0 wins when every hand is known and both teams
+        play perfectly, or None if the search visits more than node_limit positions
+        Sets exact to whether the value is exact, or only estimated because a position repeated
+        :param hands: tuple of NUM_PLAYERS card masks, the cards of every half suit that is left
+        :param turn: the player whose turn it is
+        """
+        hands, turn, called0, _ = settle(tuple(hands), turn)
+        self._nodes = 0
+        try:
+            value, self.exact = self._search(hands, turn, set())
+        except _NodeLimit:
+            self.exact = False
+            return None
+        return called0 + value
+
+    def _search(self, hands, turn, line):
+        """
+        Returns (number of the half suits left that team 0 wins from a settled position, True if it is exact)
+        :param line: the positions on the line being searched
+        """
+        if not any(hands):
+            return 0, True
+        key = (hands, turn)
+        value = self._memo.get(key)
+        if value is not None:
+            return value, True
+        if key in line:
+            return _share(hands), False
+        self._nodes += 1
+        if self._nodes > self.node_limit:
+            raise _NodeLimit()
+        maximize = turn % 2 == 0
+        # The most a team can win is every half suit left
+        target_value = _num_half_suits(_team_mask(hands, 0) | _team_mask(hands, 1)) if maximize else 0
+        best = None
+        exact = True
+        line.add(key)
+        try:
+            for target, c in _asks(hands, turn):
+                new_hands, new_turn, called0, _ = play_ask(hands, turn, target, c)
+                value, value_exact = self._search(new_hands, new_turn, line)
+                value += called0
+                exact = exact and value_exact
+                if best is None or (value > best if maximize else value < best):
+                    best = value
+                    if best == target_value:
+                        # No ask can do better, so the estimates of the other asks do not matter
+                        exact = value_exact
+                        break
+        finally:
+            line.discard(key)
+        if exact:
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[key] = best
+        return best, exact
+
+    def _sample_deals(self, player):
+        engine = ProbabilityEngine(player.info, player.hs_info, player.num_cards, player.remaining_hs)
+        return engine, engine.sample_deals(self.samples, np.random.default_rng(self.rng.getrandbits(64)))
+
+    def make_ask(self, player):
+        """
+        Returns the ask that wins the player's team the most half suits on average over sampled deals,
+        or None if more than max_cards cards are left
+        Format: (target_player_id, card)
+        """
+        if int(player.num_cards.array.sum()) > self.max_cards:
+            return None
+        asks = legal_asks(player)
+        if not asks:
+            return None
+        engine, deals = self._sample_deals(player)
+        totals = np.zeros(len(asks))
+        for deal in deals:
+            hands = deal_to_hands(deal)
+            num_hs = _num_half_suits(_team_mask(hands, 0) | _team_mask(hands, 1))
+            values = []
+            for target, c in asks:
+                new_hands, turn, called0, _ = play_ask(hands, player.ID, target, c)
+                value = self.solve(new_hands, turn)
+                if value is None:
+                    break
+                value += called0
+                values.append(value if player.ID % 2 == 0 else num_hs - value)
+            else:
+                # A deal counts only if every ask was solved in it
+                totals += values
+        # Asks that do equally well are ranked by how likely they are to succeed
+        probabilities = engine.probabilities
+        best = max(range(len(asks)), key=lambda i: (round(totals[i], 9), probabilities[asks[i]]))
+        target, c = asks[best]
+        return target, card_utils.ALL_CARDS[c]
+
+    def best_call(self, player, hs):
+        """
+        Returns the call of half suit hs that is right in the most sampled deals,
+        giving every card of it to one of the player's teammates
+        Format: [(player, card), (player, card) ...]
+        """
+        cards = card_utils.HS_CARDS[card_utils.HS_IDS[hs]]
+        teammates = tuple(range(player.ID % 2, NUM_PLAYERS, 2))
+        engine, deals = self._sample_deals(player)
+        counts = Counter(tuple(owners) for owners in deals[:, list(cards)].tolist()
+                         if all(ID in teammates for ID in owners))
+        if counts:
+            owners = counts.most_common(1)[0][0]
+        else:
+            # No deal gives the whole half suit to the team, so each card goes to the likeliest teammate
+            probabilities = engine.probabilities
+            owners = [max(teammates, key=lambda ID: probabilities[ID, c]) for c in cards]
+        return [(ID, card_utils.ALL_CARDS[c]) for ID, c in zip(owners, cards)]
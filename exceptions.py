@@ -2,4 +2,7 @@ class InfoDictException(Exception):
     pass
 
 class GameConfigException(Exception):
+    pass
+
+class TranscriptException(Exception):
     pass
\ No newline at end of file
@@ -0,0 +1,266 @@
+import card_utils
+from constants import YES, NO, UNSURE, NUM_PLAYERS, DECK_SIZE, HS_SIZE
+
+
+class FlowNetwork:
+    """
+    A directed graph with integer edge capacities and a Dinic max flow solver
+    Edges are stored in pairs: edge i and its reverse edge i ^ 1
+    """
+
+    def __init__(self, num_nodes):
+        self.num_nodes = num_nodes
+        self.adj = [[] for _ in range(num_nodes)]
+        self.to = []
+        self.cap = []
+
+    def add_edge(self, u, v, cap):
+        """
+        Adds an edge from u to v and returns its index
+        """
+        index = len(self.to)
+        self.to.append(v)
+        self.cap.append(cap)
+        self.adj[u].append(index)
+        self.to.append(u)
+        self.cap.append(0)
+        self.adj[v].append(index + 1)
+        return index
+
+    def max_flow(self, source, sink):
+        """
+        Pushes as much flow as possible from source to sink
+        The flow stays in the network as reduced capacities
+        :return: the amount of flow pushed
+        """
+        flow = 0
+        while True:
+            level = self._levels(source)
+            if level[sink] < 0:
+                return flow
+            pointers = [0] * self.num_nodes
+            pushed = self._push(source, sink, DECK_SIZE * NUM_PLAYERS, level, pointers)
+            while pushed:
+                flow += pushed
+                pushed = self._push(source, sink, DECK_SIZE * NUM_PLAYERS, level, pointers)
+
+    def _levels(self, source):
+        level = [-1] * self.num_nodes
+        level[source] = 0
+        queue = [source]
+        for u in queue:
+            for e in self.adj[u]:
+                if self.cap[e] > 0 and level[self.to[e]] < 0:
+                    level[self.to[e]] = level[u] + 1
+                    queue.append(self.to[e])
+        return level
+
+    def _push(self, u, sink, limit, level, pointers):
+        if u == sink:
+            return limit
+        adj = self.adj[u]
+        while pointers[u] < len(adj):
+            e = adj[pointers[u]]
+            v = self.to[e]
+            if self.cap[e] > 0 and level[v] == level[u] + 1:
+                pushed = self._push(v, sink, min(limit, self.cap[e]), level, pointers)
+                if pushed:
+                    self.cap[e] -= pushed
+                    self.cap[e ^ 1] += pushed
+                    return pushed
+            pointers[u] += 1
+        return 0
+
+
+class FeasibilityChecker:
+    """
+    Exact feasibility check for an info table.
+
+    The cards whose owner is not known yet are assigned to players with a flow:
+
+    source -> card            exactly 1 (every card has one owner)
+    card -> (player, hs)      0 or 1, only if the player's entry for the card is not NO
+    (player, hs) -> player    at least the player's half suit minimum (minus known cards)
+    player -> sink            exactly the player's number of cards (minus known cards)
+    sink -> source            any amount, which closes the flow into a circulation
+
+    The table is consistent exactly when this circulation exists. Unlike
+    Player._is_consistent, this also catches contradictions that involve many
+    players and half suits at once.
+
+    Once one circulation is found, any other one differs from it by cycles in
+    its residual graph. So an UNSURE entry can be flipped from its value in the
+    circulation only if both ends of its edge are in the same strongly
+    connected component of the residual graph. This decides every UNSURE entry
+    with one flow and one component search instead of one flow per entry.
+    """
+
+    def __init__(self, info, hs_info, num_cards, remaining_hs):
+        """
+        :param info: CardTable to check
+        :param hs_info: HalfSuitTable of half suit minimums for info
+        :param num_cards: CardCounts of each player's number of cards
+        :param remaining_hs: list of the half suits that have not been called
+        """
+        self.info = info.array.tolist()
+        self.hs_info = hs_info.array.tolist()
+        self.num_cards = num_cards.array.tolist()
+        self.remaining = [hs in remaining_hs for hs in card_utils.ALL_HALFSUITS]
+        self.feasible = self._solve()
+
+    def _solve(self):
+        need = list(self.num_cards)
+        hs_need = [list(row) for row in self.hs_info]
+        unknown = []
+        for c, h in enumerate(card_utils.CARD_HS):
+            if not self.remaining[h]:
+                continue
+            owners = [ID for ID in range(NUM_PLAYERS) if self.info[ID][c] == YES]
+            if len(owners) > 1:
+                return False
+            if owners:
+                need[owners[0]] -= 1
+                hs_need[owners[0]][h] -= 1
+            elif all(self.info[ID][c] == NO for ID in range(NUM_PLAYERS)):
+                return False
+            else:
+                unknown.append(c)
+        if min(need) < 0:
+            return False
+
+        # Nodes: 0 source, 1 sink, then cards, (player, hs) pairs and players
+        source, sink = 0, 1
+        node_count = 2
+        card_node = {}
+        for c in unknown:
+            card_node[c] = node_count
+            node_count += 1
+        pair_node = {}
+        for ID in range(NUM_PLAYERS):
+            for h in range(len(card_utils.ALL_HALFSUITS)):
+                if self.remaining[h]:
+                    pair_node[ID, h] = node_count
+                    node_count += 1
+        player_node = list(range(node_count, node_count + NUM_PLAYERS))
+        node_count += NUM_PLAYERS
+
+        # Edges with a lower and upper bound: (u, v, low, high)
+        edges = [(sink, source, 0, DECK_SIZE)]
+        self.cell_edges = {}
+        for c in unknown:
+            edges.append((source, card_node[c], 1, 1))
+            h = card_utils.CARD_HS[c]
+            for ID in range(NUM_PLAYERS):
+                if self.info[ID][c] == UNSURE:
+                    self.cell_edges[ID, c] = len(edges)
+                    edges.append((card_node[c], pair_node[ID, h], 0, 1))
+        for (ID, h), node in pair_node.items():
+            edges.append((node, player_node[ID], max(hs_need[ID][h], 0), HS_SIZE))
+        for ID in range(NUM_PLAYERS):
+            edges.append((player_node[ID], sink, need[ID], need[ID]))
+
+        # Lower bounds become demands served by a super source and super sink
+        super_source, super_sink = node_count, node_count + 1
+        network = FlowNetwork(node_count + 2)
+        excess = [0] * node_count
+        edge_index = []
+        for u, v, low, high in edges:
+            if low > high:
+                return False
+            edge_index.append(network.add_edge(u, v, high - low))
+            excess[v] += low
+            excess[u] -= low
+        demand = 0
+        for node, amount in enumerate(excess):
+            if amount > 0:
+                network.add_edge(super_source, node, amount)
+                demand += amount
+            elif amount < 0:
+                network.add_edge(node, super_sink, -amount)
+        if network.max_flow(super_source, super_sink) != demand:
+            return False
+
+        # Residual graph of the circulation, without the super source and sink
+        self.flow = [low + (high - low) - network.cap[e] for (u, v, low, high), e in zip(edges, edge_index)]
+        residual = [[] for _ in range(node_count)]
+        for (u, v, low, high), flow in zip(edges, self.flow):
+            if flow < high:
+                residual[u].append(v)
+            if flow > low:
+                residual[v].append(u)
+        self.edges = edges
+        self.component = _strongly_connected_components(residual)
+        return True
+
+    def forced_cells(self):
+        """
+        Returns every UNSURE entry that has the same value in all consistent card assignments
+        :return: list of (player id, card id, YES or NO)
+        """
+        if not self.feasible:
+            return []
+        forced = []
+        for (ID, c), index in self.cell_edges.items():
+            u, v = self.edges[index][:2]
+            if self.component[u] != self.component[v]:
+                forced.append((ID, c, YES if self.flow[index] else NO))
+        return forced
+
+
+def _strongly_connected_components(graph):
+    """
+    Iterative Tarjan's algorithm
+    :param graph: adjacency lists
+    :return: a list of component numbers, one per node
+    """
+    n = len(graph)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    component = [-1] * n
+    stack = []
+    counter = 0
+    num_components = 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, i = work.pop()
+            if i == 0:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            recurse = False
+            while i < len(graph[node]):
+                nxt = graph[node][i]
+                i += 1
+                if index[nxt] < 0:
+                    work.append((node, i))
+                    work.append((nxt, 0))
+                    recurse = True
+                    break
+                if on_stack[nxt]:
+                    low[node] = min(low[node], index[nxt])
+            if recurse:
+                continue
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+    return component
+
+
+def is_feasible(info, hs_info, num_cards, remaining_hs):
+    """
+    Returns True if at least one assignment of the cards agrees with the tables
+    """
+    return FeasibilityChecker(info, hs_info, num_cards, remaining_hs).feasible
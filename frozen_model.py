@@ -0,0 +1,194 @@
+import numpy as np
+
+# A FrozenModel runs a trained model.FishDecisionMaker with NumPy only, so processes that use the
+# model do not need tensorflow. export_model writes the Dense weights of the keras model to a .npz
+# file, and FrozenModel.load reads them back.
+
+# Version of the .npz layout written by FrozenModel.save
+FORMAT_VERSION = 1
+# Ways weights can be kept: float16 halves the file and the memory and int8 quarters them
+# (per output column scales), at some loss of precision
+WEIGHT_MODES = ("float32", "float16", "int8")
+# Keras layers that do nothing when a model is used for inference
+PASSTHROUGH_LAYERS = ("InputLayer", "Dropout", "Flatten")
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def _elu(x):
+    return np.where(x > 0, x, np.expm1(np.minimum(x, 0)))
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "softmax": _softmax,
+    "elu": _elu,
+}
+
+
+def _quantize(kernel):
+    """
+    Returns (int8 kernel, float32 scale of each output column) with kernel ~= int8 kernel * scale
+    """
+    scale = np.abs(kernel).max(axis=0) / 127
+    scale[scale == 0] = 1
+    return np.round(kernel / scale).astype(np.int8), scale.astype(np.float32)
+
+
+class FrozenModel:
+    """
+    The forward pass of a stack of Dense layers, computed with NumPy
+
+    weights: how the kernels are kept in memory, one of WEIGHT_MODES
+    layers: list of (kernel, bias, activation) where kernel is an inputs x outputs float32 array,
+    bias an array of length outputs and activation a name in ACTIVATIONS. For float16 and int8 weights,
+    these are the kernels widened back to float32
+
+    float16 and int8 kernels stay in that form in memory and in the file, so a model takes a half or a
+    quarter of the memory of float32 weights. NumPy only multiplies float32 and float64 matrices quickly,
+    so predict widens one kernel at a time to float32 (int8 products are scaled after the matmul).
+    That costs some time per call in exchange for the memory.
+    """
+
+    def __init__(self, layers, weights="float32"):
+        """
+        :param layers: list of (kernel, bias, activation) with float kernels, see layers
+        :param weights: how the kernels are kept, one of WEIGHT_MODES
+        """
+        if weights not in WEIGHT_MODES:
+            raise ValueError("weights must be one of {}, not {!r}".format(WEIGHT_MODES, weights))
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError("Unsupported activation " + repr(activation))
+        self.weights = weights
+        # (kernel in the weights' dtype, float32 scale of each output column for int8 or None, bias, activation)
+        self._layers = []
+        for kernel, bias, activation in layers:
+            kernel = np.asarray(kernel, dtype=np.float32)
+            scale = None
+            if weights == "int8":
+                kernel, scale = _quantize(kernel)
+            else:
+                kernel = np.ascontiguousarray(kernel, dtype=weights)
+            self._layers.append((kernel, scale, np.asarray(bias, dtype=np.float32), activation))
+
+    @classmethod
+    def _from_stored(cls, weights, stored):
+        model = cls([], weights)
+        model._layers = stored
+        return model
+
+    @classmethod
+    def from_keras(cls, model, weights="float32"):
+        """
+        Freezes the weights of a keras Sequential model, such as a model.FishDecisionMaker
+        Only Dense layers are supported, besides layers that do nothing at inference (PASSTHROUGH_LAYERS)
+        :param weights: how the kernels are kept, one of WEIGHT_MODES
+        """
+        layers = []
+        for layer in model.layers:
+            kind = type(layer).__name__
+            if kind in PASSTHROUGH_LAYERS:
+                continue
+            if kind != "Dense":
+                raise ValueError("Cannot freeze a {} layer".format(kind))
+            layer_weights = layer.get_weights()
+            kernel = layer_weights[0]
+            bias = layer_weights[1] if len(layer_weights) > 1 else np.zeros(kernel.shape[1], dtype=np.float32)
+            layers.append((kernel, bias, layer.get_config()["activation"]))
+        return cls(layers, weights)
+
+    @staticmethod
+    def _widen(kernel):
+        return kernel if kernel.dtype == np.float32 else kernel.astype(np.float32)
+
+    @property
+    def layers(self):
+        return [(self._widen(kernel) if scale is None else self._widen(kernel) * scale, bias, activation)
+                for kernel, scale, bias, activation in self._layers]
+
+    @property
+    def nbytes(self):
+        """
+        Bytes of memory the weights take
+        """
+        return sum(kernel.nbytes + bias.nbytes + (0 if scale is None else scale.nbytes)
+                   for kernel, scale, bias, _ in self._layers)
+
+    @property
+    def input_size(self):
+        return self._layers[0][0].shape[0]
+
+    @property
+    def output_size(self):
+        return self._layers[-1][0].shape[1]
+
+    def predict(self, states):
+        """
+        Returns the outputs (the Q values of a FishDecisionMaker) of a batch of states
+        :param states: batch_size x input_size array, or a single state vector
+        :return: batch_size x output_size float32 array, or a single output vector for a single state
+        """
+        x = np.asarray(states, dtype=np.float32)
+        single = x.ndim == 1
+        if single:
+            x = x[None]
+        for kernel, scale, bias, activation in self._layers:
+            x = x @ self._widen(kernel)
+            if scale is not None:
+                x *= scale
+            x += bias
+            x = ACTIVATIONS[activation](x)
+        return x[0] if single else x
+
+    __call__ = predict
+
+    def save(self, path, weights=None):
+        """
+        Writes the model to a compressed .npz file
+        :param weights: how the weights are stored, one of WEIGHT_MODES. If None, as they are kept
+        """
+        if weights is not None and weights != self.weights:
+            FrozenModel(self.layers, weights).save(path)
+            return
+        arrays = {"version": np.array(FORMAT_VERSION), "weights": np.array(self.weights),
+                  "activations": np.array([activation for _, _, _, activation in self._layers])}
+        for i, (kernel, scale, bias, _) in enumerate(self._layers):
+            arrays["kernel_{}".format(i)] = kernel
+            if scale is not None:
+                arrays["scale_{}".format(i)] = scale
+            arrays["bias_{}".format(i)] = bias
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a model written by save, keeping its weights in the form they were stored in
+        """
+        with np.load(path) as data:
+            if int(data["version"]) != FORMAT_VERSION:
+                raise ValueError("Unsupported model file version {}".format(int(data["version"])))
+            weights = str(data["weights"])
+            stored = []
+            for i, activation in enumerate(data["activations"].tolist()):
+                scale = data["scale_{}".format(i)] if weights == "int8" else None
+                stored.append((data["kernel_{}".format(i)], scale, data["bias_{}".format(i)], activation))
+        return cls._from_stored(weights, stored)
+
+
+def export_model(model, path, weights="float32"):
+    """
+    Writes the Dense weights of a keras model (such as a model.FishDecisionMaker) to a .npz file
+    that FrozenModel.load reads without tensorflow
+    :param weights: how the weights are stored, one of WEIGHT_MODES
+    :return: the FrozenModel that was written
+    """
+    frozen = FrozenModel.from_keras(model, weights)
+    frozen.save(path)
+    return frozen
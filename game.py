@@ -1,8 +1,11 @@
 from player import Player
+from public_knowledge import PublicKnowledge
 import card_utils
-import numpy.random as random
+import random
 from exceptions import InfoDictException, GameConfigException
-from constants import NUM_PLAYERS
+from instrumentation import GameStats
+from endgame import EndgameSolver
+from constants import NUM_PLAYERS, ENDGAME_CARDS
 
 class FishGame:
     """
@@ -12,7 +15,8 @@ class FishGame:
     Team 1: Players 1, 3, and 5
     Team 0: Players 0, 2, and 4
     """
-    def __init__(self, player_cards, start, team1_score, team0_score):
+    def __init__(self, player_cards, start, team1_score, team0_score, rng=None, stats=False, transcript=None,
+                 cache=None, strategies=None, endgame_cards=ENDGAME_CARDS):
         """
         Initializes a game with user defined starting hands
         Also makes sure that the starting configuration is valid 
@@ -20,12 +24,36 @@ class FishGame:
 
         player_cards: a length NUM_PLAYERS list, each element is a list of cards
         List is [p1cards, p2cards, etc...]
+        rng: random.Random that every random choice in the game is made with,
+        so a game can be replayed from its seed. If None, the global random module is used
+        stats: If True, the game collects a GameStats in self.stats while it runs:
+        time spent in each phase of a turn and the propagation work of each player.
+        If False, self.stats is None and nothing is measured
+        transcript: transaction.TranscriptWriter that the deal and every ask and call are written to,
+        or None to not record the game
+        cache: transposition.TranspositionCache shared by the public knowledge and every player,
+        or None to not cache propagation results
+        strategies: dictionary of {player ID: strategy} for the players whose asks are chosen by a
+        strategy such as ismcts.ISMCTS (see Player). Each player needs its own strategy object
+        endgame_cards: once at most this many cards are left, the players' asks are chosen by an
+        endgame.EndgameSolver, which is shared by every player and also makes their forced calls.
+        If None, there is no endgame solver
         """
+        if strategies is None:
+            strategies = {}
+        self.rng = random if rng is None else rng
+        self.endgame = None if endgame_cards is None else EndgameSolver(max_cards=endgame_cards, rng=self.rng)
+        self.stats = GameStats() if stats else None
+        self.turns = 0
         cards_seen_dict = {c: 0 for c in card_utils.gen_all_cards()}
         self.players = []
         self.player_cards = {ID: player_cards[ID] for ID in range(NUM_PLAYERS)}
+        # Public knowledge is the same for every player, so it is kept once per game
+        self.public = PublicKnowledge.start_of_game(stats=self.stats.public if stats else None, cache=cache)
         for i, cards in enumerate(player_cards):
-            player = Player.player_start_of_game(i, cards)
+            player = Player.player_start_of_game(i, cards, public=self.public, rng=self.rng,
+                                                 stats=self.stats.players[i] if stats else None, cache=cache,
+                                                 strategy=strategies.get(i), endgame=self.endgame)
             self.players.append(player)
             for c in cards:
                 if c in cards_seen_dict:
@@ -38,16 +66,30 @@ class FishGame:
         self.turn = start
         self.team1_score = team1_score
         self.team0_score = team0_score
+        self.transcript = transcript
+        if transcript is not None:
+            transcript.start_game(player_cards, start, team0_score, team1_score)
 
     @classmethod
-    def start_random_game(cls):
+    def start_random_game(cls, rng=None, stats=False, transcript=None, cache=None, strategies=None,
+                          endgame_cards=ENDGAME_CARDS):
         """
         Deals 9 random cards to NUM_PLAYERS players and assigns someone at random to start
+        :param rng: random.Random used for the deal and the rest of the game.
+        If None, the global random module is used
+        :param stats: If True, the game collects a GameStats in self.stats
+        :param transcript: transaction.TranscriptWriter the game is recorded in, or None
+        :param cache: transposition.TranspositionCache of propagation results, or None
+        :param strategies: dictionary of {player ID: strategy that chooses the player's asks}, or None
+        :param endgame_cards: number of cards left below which the endgame solver plays, or None for no solver
         """
+        if rng is None:
+            rng = random
         all_cards = list(card_utils.gen_all_cards())
-        player_cards = random.permutation(all_cards).reshape((NUM_PLAYERS, 9))
-        player_cards_list = [list(x) for x in player_cards]
-        return cls(player_cards_list, random.randint(0, NUM_PLAYERS), 0, 0)
+        rng.shuffle(all_cards)
+        player_cards_list = [all_cards[9 * i:9 * (i + 1)] for i in range(NUM_PLAYERS)]
+        return cls(player_cards_list, rng.randrange(NUM_PLAYERS), 0, 0, rng=rng, stats=stats,
+                   transcript=transcript, cache=cache, strategies=strategies, endgame_cards=endgame_cards)
 
     def check_call(self):
         """
@@ -92,18 +134,23 @@ class FishGame:
             self.turn = target
         return asker, target, card, success
 
-    def report_call(self, hs):
+    def report_call(self, hs, team=None, success=None):
         """
         Updates the player_cards dict
         Makes each player update their info in response to a call
         :param hs: half suit being called
+        :param team: team that called, only needed if the game is recorded in a transcript
+        :param success: True if the call was correct, only needed if the game is recorded in a transcript
         """
+        if self.transcript is not None:
+            self.transcript.write_call(hs, team, success)
         hs_info_dict = {ID: 0 for ID in range(NUM_PLAYERS)}
         for card in card_utils.find_cards(hs):
             for ID in range(NUM_PLAYERS):
                 if card in self.player_cards[ID]:
                     self.player_cards[ID].remove(card)
                     hs_info_dict[ID] += 1
+        self.public.update_call(hs, hs_info_dict)
         for player in self.players:
             player.update_call(hs, hs_info_dict)
 
@@ -119,8 +166,11 @@ class FishGame:
         if success:
             self.player_cards[ID_ask].append(card)
             self.player_cards[ID_target].remove(card)
+        self.public.update_transaction(ID_ask, ID_target, card, success)
         for player in self.players:
             player.update_transaction(ID_ask, ID_target, card, success)
+        if self.transcript is not None:
+            self.transcript.write_ask(ID_ask, ID_target, card, success)
 
     def run_whole_game(self, verbose = 0, max_turns = 1000):
         """
@@ -132,6 +182,9 @@ class FishGame:
         :param verbose: Prints nothing if 0, prints the final score if 1,
         prints all calls if 2, prints all transactions and calls if 3
         :return: True if game goes on longer than 1000 turns and False otherwise
+        The number of turns played is left in self.turns
+        If the game collects stats, the time of each phase is added to self.stats.
+        Propagation is lazy, so its time counts towards the phase that first reads the tables
         """
         turns = 0
         if verbose not in [0, 1, 2, 3]:
@@ -140,7 +193,7 @@ class FishGame:
             if turns > max_turns:
                 break
             # First check for calls
-            call = self.check_call()
+            call = self._timed("check_call", self.check_call)
             while call:
                 hs, team, success = call
                 if verbose >= 2:
@@ -149,7 +202,7 @@ class FishGame:
                     else:
                         print ("Team {} unsuccessfully called half suit {}".format(team, hs))
                 try:
-                    self.report_call(hs)
+                    self._timed("report_call", self.report_call, hs, team, success)
                 except InfoDictException as err:
                     print(err)
                     print ("Failed in updating calling")
@@ -160,7 +213,7 @@ class FishGame:
                     self.team1_score += 1
                 else:
                     self.team0_score += 1
-                call = self.check_call()
+                call = self._timed("check_call", self.check_call)
 
             # When there is 1 team left with cards, they are forced to call (for now game ends)
             num_cards = self.players[0].num_cards
@@ -174,14 +227,14 @@ class FishGame:
 
             # Now get the player who has turn's request
             if not self.check_game_finished():
-                ID_ask, ID_target, card, success = self.get_move()
+                ID_ask, ID_target, card, success = self._timed("get_move", self.get_move)
                 if verbose == 3:
                     if success:
                         print ("Player {} successfully took {} from {}".format(ID_ask, card, ID_target))
                     else:
                         print ("Player {} did not take {} from {}".format(ID_ask, card, ID_target))
                 try:
-                    self.report_ask(ID_ask, ID_target, card, success)
+                    self._timed("report_ask", self.report_ask, ID_ask, ID_target, card, success)
                 except InfoDictException as err:
                     print (err)
                     print ("Failed in updating ask")
@@ -189,12 +242,23 @@ class FishGame:
                         print(self.player_cards[i], self.players[i].own_cards())
                     break
                 turns += 1
+        self.turns = turns
+        if self.stats is not None:
+            self.stats.turns = turns
         if verbose >= 1:
             print ("Final Score:")
             print ("Team 0: " + str(self.team0_score))
             print ("Team 1: " + str(self.team1_score))
         return turns > max_turns
 
+    def _timed(self, phase, f, *args):
+        """
+        Calls f(*args), timing it as phase if the game collects stats
+        """
+        if self.stats is None:
+            return f(*args)
+        return self.stats.timed(phase, f, *args)
+
     def check_game_finished(self):
         """
         Returns true if the game is finished, (no players have cards)
@@ -206,26 +270,23 @@ class FishGame:
 
     def force_calls(self, team):
         """
-        Forces players on a team to call
+        Forces players on a team to call every half suit that is left
+        A half suit that a player of the team is sure of is called by them, and the others are called
+        by the team's first player with Player.force_call
         :param team: team number being forced to call
         """
         players = [self.players[2 * i + team] for i in range(3)]
-        remaining_hs = self.players[0].remaining_hs
-        for hs in remaining_hs:
+        while self.players[0].remaining_hs:
             for player in players:
                 call = player.check_call()
                 if call:
-                    hs, team, success = self.check_call_correct(call, player.ID)
-                    if success and team == 0 or not success and team == 1:
-                        self.team0_score += 1
-                    else:
-                        self.team1_score += 1
-                    self.report_call(hs)
                     break
-            call = players[0].force_call(hs)
-            hs, team, success = self.check_call_correct(call, players[0].ID)
+            else:
+                player = players[0]
+                call = player.force_call(self.players[0].remaining_hs[0])
+            hs, team, success = self.check_call_correct(call, player.ID)
             if success and team == 0 or not success and team == 1:
                 self.team0_score += 1
             else:
                 self.team1_score += 1
-            self.report_call(hs)
+            self.report_call(hs, team, success)
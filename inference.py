@@ -0,0 +1,267 @@
+import asyncio
+import threading
+import time
+import numpy as np
+import card_utils
+import constants
+import encoding
+from constants import INFERENCE_MAX_BATCH, INFERENCE_MAX_DELAY
+from ismcts import legal_asks
+
+
+def keras_predict(model):
+    """
+    Returns a predict function for InferenceServer that runs a keras model, such as a
+    model.FishDecisionMaker, directly on a batch. This skips the per call setup of model.predict
+    """
+    def predict(states):
+        return np.asarray(model(states, training=False))
+    return predict
+
+
+def legal_action_mask(player, out=None):
+    """
+    Returns a boolean array of length SIZE_ACTIONS that is True for the action numbers
+    (see encoding.generate_action_number) of the asks player can make
+    :param out: boolean array of length SIZE_ACTIONS the mask is written into. If None, a new one is made
+    """
+    if out is None:
+        out = np.zeros(constants.SIZE_ACTIONS, dtype=bool)
+    else:
+        out[:] = False
+    asks = legal_asks(player)
+    if asks:
+        targets, cards = zip(*asks)
+        out[encoding.generate_action_numbers(player.ID, np.array(targets), np.array(cards))] = True
+    return out
+
+
+class InferenceStats:
+    """
+    Statistics of an InferenceServer
+
+    requests: states that were evaluated
+    batches: forward passes that were run
+    batch_sizes: batch_sizes[n] is the number of forward passes of n states
+    queue_depth: total number of requests waiting when each batch was started, including the batch itself
+    max_queue_depth: most requests that were waiting when a batch was started
+    forward_time: total seconds spent in forward passes
+    wait_time: total seconds requests waited between being submitted and being answered
+    """
+
+    def __init__(self, max_batch):
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = [0] * (max_batch + 1)
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.forward_time = 0.0
+        self.wait_time = 0.0
+
+    @property
+    def mean_batch_size(self):
+        return self.requests / self.batches if self.batches else 0.0
+
+    @property
+    def mean_queue_depth(self):
+        return self.queue_depth / self.batches if self.batches else 0.0
+
+    def as_dict(self):
+        return {"requests": self.requests, "batches": self.batches, "mean_batch_size": self.mean_batch_size,
+                "max_batch_size": max((n for n, count in enumerate(self.batch_sizes) if count), default=0),
+                "mean_queue_depth": self.mean_queue_depth, "max_queue_depth": self.max_queue_depth,
+                "forward_time": self.forward_time,
+                "mean_wait_ms": 1000 * self.wait_time / self.requests if self.requests else 0.0}
+
+
+class InferenceServer:
+    """
+    Evaluates the states of many concurrent games in batches
+
+    A request is an encoded state (encoding.generate_state_vector) and a mask of the legal actions.
+    Requests are queued, and once max_batch of them are waiting, or max_delay seconds have passed since
+    the first one, they are evaluated in one forward pass. Illegal actions are masked out and each
+    request is answered with its highest scoring legal action number.
+    Batching this way pays the per call cost of a model (large for keras) once per batch instead of
+    once per decision.
+
+    The server runs on an asyncio event loop, either one it starts in a background thread (start and
+    stop, or a with block) or the running loop of the caller (an async with block).
+    Coroutines on the server's loop await decide, and other threads call submit or decide_sync.
+    """
+
+    def __init__(self, predict, max_batch=INFERENCE_MAX_BATCH, max_delay=INFERENCE_MAX_DELAY):
+        """
+        :param predict: function from a batch_size x SIZE_STATES float32 array of states to a
+        batch_size x SIZE_ACTIONS array of action scores, such as keras_predict(model)
+        :param max_batch: most states in one forward pass
+        :param max_delay: most seconds the first request of a batch waits for the batch to fill up
+        """
+        self.predict = predict
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = InferenceStats(max_batch)
+        self._states = np.empty((max_batch, constants.SIZE_STATES), dtype=np.float32)
+        self._masks = np.empty((max_batch, constants.SIZE_ACTIONS), dtype=bool)
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._thread = None
+
+    async def decide(self, state, mask):
+        """
+        Returns the highest scoring legal action number of a state
+        Has to be awaited on the server's event loop
+        :param state: state vector of length SIZE_STATES
+        :param mask: boolean array of length SIZE_ACTIONS, True for the legal actions
+        """
+        future = self._loop.create_future()
+        self._queue.put_nowait((state, mask, future, time.perf_counter()))
+        return await future
+
+    def submit(self, state, mask):
+        """
+        Queues a state from another thread
+        :return: concurrent.futures.Future of the action number decide returns
+        """
+        return asyncio.run_coroutine_threadsafe(self.decide(state, mask), self._loop)
+
+    def decide_sync(self, state, mask):
+        """
+        Returns the action number decide returns, blocking the calling thread until it is ready
+        Must not be called from the server's own event loop
+        """
+        return self.submit(state, mask).result()
+
+    async def _serve(self):
+        queue = self._queue
+        while True:
+            requests = [await queue.get()]
+            deadline = self._loop.time() + self.max_delay
+            while len(requests) < self.max_batch:
+                if not queue.empty():
+                    requests.append(queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._run_batch(requests, len(requests) + queue.qsize())
+
+    def _run_batch(self, requests, depth):
+        n = len(requests)
+        states, masks = self._states[:n], self._masks[:n]
+        for i, (state, mask, _, _) in enumerate(requests):
+            states[i] = state
+            masks[i] = mask
+        start = time.perf_counter()
+        try:
+            scores = np.asarray(self.predict(states), dtype=np.float32)
+        except Exception as e:
+            for _, _, future, _ in requests:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        end = time.perf_counter()
+        actions = np.where(masks, scores, -np.inf).argmax(axis=1)
+        legal = masks.any(axis=1)
+        for i, (_, _, future, submitted) in enumerate(requests):
+            if future.done():
+                continue
+            if legal[i]:
+                future.set_result(int(actions[i]))
+            else:
+                future.set_exception(ValueError("No legal action to choose from"))
+            self.stats.wait_time += end - submitted
+        stats = self.stats
+        stats.requests += n
+        stats.batches += 1
+        stats.batch_sizes[n] += 1
+        stats.queue_depth += depth
+        stats.max_queue_depth = max(stats.max_queue_depth, depth)
+        stats.forward_time += end - start
+
+    def _open(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = self._loop.create_task(self._serve())
+
+    async def _close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def __aenter__(self):
+        self._open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._close()
+
+    def start(self):
+        """
+        Starts the server on a new event loop in a background thread
+        """
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            loop.call_soon(lambda: (self._open(), started.set()))
+            loop.run_forever()
+            loop.run_until_complete(self._close())
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="inference-server", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        """
+        Stops a server that was started with start
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class InferenceStrategy:
+    """
+    A Player strategy (see Player) that chooses asks with an InferenceServer
+
+    make_ask encodes the player's state, sends it with the mask of the player's legal asks and
+    blocks until the server answers, so it is meant for games played in threads other than the
+    server's. Many games sharing one server are evaluated together.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._state = np.empty(constants.SIZE_STATES, dtype=np.int8)
+        self._mask = np.empty(constants.SIZE_ACTIONS, dtype=bool)
+
+    def make_ask(self, player):
+        """
+        Returns the legal ask with the highest score, format: (target_player_id, card)
+        """
+        state = encoding.generate_state_vector(player.info, player.hs_info, player.num_cards,
+                                               player.public_info, player.ID, out=self._state)
+        action = self.server.decide_sync(state, legal_action_mask(player, out=self._mask))
+        target, c = encoding.action_to_ask(player.ID, action)
+        return target, card_utils.ALL_CARDS[c]
+
+    def update_transaction(self, ID_ask, ID_target, card, success):
+        pass
+
+    def update_call(self, hs, card_count_hs):
+        pass
@@ -0,0 +1,96 @@
+import time
+from constants import NUM_PLAYERS
+from propagation import Propagator
+
+# Phases of a turn in FishGame.run_whole_game that are timed
+PHASES = ("check_call", "get_move", "report_ask", "report_call")
+
+
+class KnowledgeStats:
+    """
+    Counters for the propagation of one knowledge table (a player's info, or the public info)
+
+    events: asks and calls applied to the table
+    flushes: batches of queued events that were propagated together
+    checks: UNSURE entries whose rules were checked (the work _is_consistent used to do per entry)
+    resolved: entries that were resolved to YES or NO
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.flushes = 0
+        self.checks = 0
+        self.resolved = 0
+
+    @property
+    def resolved_per_event(self):
+        return self.resolved / self.events if self.events else 0.0
+
+    def as_dict(self):
+        return {"events": self.events, "flushes": self.flushes, "checks": self.checks,
+                "resolved": self.resolved, "resolved_per_event": self.resolved_per_event}
+
+
+class GameStats:
+    """
+    Statistics of one FishGame, filled in while the game runs if it was made with stats=True
+
+    phase_time: {phase: total seconds spent in that phase}
+    phase_calls: {phase: number of times the phase ran}
+    players: list of KnowledgeStats, one per player
+    public: KnowledgeStats of the shared public knowledge
+    turns: number of turns played
+    """
+
+    def __init__(self):
+        self.phase_time = {phase: 0.0 for phase in PHASES}
+        self.phase_calls = {phase: 0 for phase in PHASES}
+        self.players = [KnowledgeStats() for _ in range(NUM_PLAYERS)]
+        self.public = KnowledgeStats()
+        self.turns = 0
+
+    def timed(self, phase, f, *args):
+        """
+        Calls f(*args) and adds the time it took to phase
+        """
+        start = time.perf_counter()
+        try:
+            return f(*args)
+        finally:
+            self.phase_time[phase] += time.perf_counter() - start
+            self.phase_calls[phase] += 1
+
+    def as_dict(self):
+        return {"turns": self.turns, "phase_time": dict(self.phase_time), "phase_calls": dict(self.phase_calls),
+                "public": self.public.as_dict(), "players": [stats.as_dict() for stats in self.players]}
+
+
+class CountingPropagator(Propagator):
+    """
+    A Propagator that counts its work in a KnowledgeStats
+    It is only used when statistics are enabled, so the plain Propagator has no counting overhead
+    """
+
+    def __init__(self, info, hs_info, num_cards, remaining_hs, stats, cache=None):
+        self.stats = stats
+        super().__init__(info, hs_info, num_cards, remaining_hs, cache)
+
+    def _deduce(self, ID, c):
+        self.stats.checks += 1
+        return super()._deduce(ID, c)
+
+    def propagate(self):
+        resolved = super().propagate()
+        self.stats.resolved += resolved
+        return resolved
+
+
+def make_propagator(info, hs_info, num_cards, remaining_hs, stats=None, cache=None):
+    """
+    Returns a Propagator for the tables, or a CountingPropagator if stats (a KnowledgeStats) is given
+    :param cache: TranspositionCache the propagator shares, or None
+    """
+    if stats is None:
+        return Propagator(info, hs_info, num_cards, remaining_hs, cache)
+    return CountingPropagator(info, hs_info, num_cards, remaining_hs, stats, cache)
+
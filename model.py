@@ -1,130 +1,86 @@
-import tensorflow
 import numpy as np
-from tensorflow import keras
-from tensorflow.keras import layers
-import card_utils
 import constants
+import encoding
+from frozen_model import export_model
+from replay_memory import ReplayMemory
 
-class FishDecisionMaker(keras.Sequential):
-    """
-    A decision maker for the player class for Fish.
-    This class is a neural network that takes in the game state and
-    predicts which player to ask and which card to ask for
-    This class is a shared model between all 6 bots in the virtual fish game
-    They all use the same logic and train together (not sure if that's a good idea)
+# FishDecisionMaker subclasses keras.Sequential, so defining it needs tensorflow.
+# Importing tensorflow takes seconds and hundreds of MB, which processes that only
+# play games or encode states should not pay for. The class is defined the first
+# time model.FishDecisionMaker is looked up, and tensorflow is imported then.
+# The state and action encoding lives in encoding.py, which does not need tensorflow.
+# A trained model is run without tensorflow by exporting it to a frozen_model.FrozenModel.
 
-    Also note that this model only predicts what cards to ask,
-    not when to call.
-    When to call is hardcoded (It is when the players know excactly a half suit)
 
-    This model trains on data collected from virtual games
-    """
-    def __init__(self, *layers, **compile_options):
-        """
-        Creates the neural network with an architecture given by layers
-        :param *layers: A sequential list of Layer Objects defined in keras (ex. InputLayer)
-        :param **options: A list of compile options used to compile the network
-        """
-        super().__init__()
-        for l in layers:
-            self.add(l)
-        self.compile(**compile_options)
-        self.action_history = []
-        self.state_history = []
-        self.rewards_history = []
-        self.done_history = []
-
-    def update_data(self, info, hs_info, num_cards, public_info, ID_ask, ID_target, card, success, done):
-        """
-        Updates the history lists of the model, given a transaction and state
-        :param info: defined in Player class
-        :param hs_info: defined in Player class
-        :param num_cards: defined in Player class
-        :param public_info: defined in Player class
-        :param ID_ask: ID of asker
-        :param ID_target: ID of target
-        :param card: Card being asked for
-        :param success: Was the ask successful
-        :param done: has the game finished?
-        """
-        self.state_history.append(self.generate_state_vector(info, hs_info, num_cards, public_info, ID_ask))
-        self.action_history.append(self.generate_action_number(ID_ask, ID_target, card))
-        self.rewards_history.append(self.generate_reward_ask(success))
-        self.done_history.append(self.done)
+def _define_decision_maker():
+    from tensorflow import keras
 
-
-    @staticmethod
-    def generate_state_vector(info, hs_info, num_cards, public_info, ID_player):
+    class FishDecisionMaker(keras.Sequential):
         """
-        Generates a state vector from the player's information
+        A decision maker for the player class for Fish.
+        This class is a neural network that takes in the game state and
+        predicts which player to ask and which card to ask for
+        This class is a shared model between all 6 bots in the virtual fish game
+        They all use the same logic and train together (not sure if that's a good idea)
 
-        The structure of the state vector is as follows:
-        Length: 708 (SIZE_STATES)
-        The order of players in each section starts with the ID of the player
-        and counts up mod 6 (example: 3, 4, 5, 0, 1, 2)
-        The order of cards is defined in card_utils.gen_all_cards
-        The first 54 * 6 = 324 entries are for the info dict, with the values
-        being the same as in the info dict
-        The next 54 * 6 = 324 entries are for the public_info dict, with the values
-        being the same as in the public_info dict
-        The next 9 * 6 = 54 entries are for the hs_info, with the values
-        being the same as in the hs_info dict
-        The last 6 entries are the number of cards each player has
+        Also note that this model only predicts what cards to ask,
+        not when to call.
+        When to call is hardcoded (It is when the players know excactly a half suit)
 
-        :param info: defined in Player class
-        :param hs_info: defined in Player class
-        :param num_cards: defined in Player class
-        :param public_info: defined in Player class
-        :param ID_player: ID of the player
-        :return: a state vector
+        This model trains on data collected from virtual games
         """
-        player_order = list(range(6))[ID_player:] + list(range(6))[:ID_player]
-        state = []
-        # Info dict
-        for ID in player_order:
-            for card in card_utils.gen_all_cards():
-                state.append(info[ID][card])
-        # Public Info dict
-        for ID in player_order:
-            for card in card_utils.gen_all_cards():
-                state.append(public_info[ID][card])
-        # Half suit info dict
-        for ID in player_order:
-            for hs in card_utils.gen_all_halfsuits():
-                state.append(hs_info[ID][hs])
-        # Num cards
-        for ID in player_order:
-            state.append(num_cards[ID])
-        return state
+        def __init__(self, *layers, memory=None, **compile_options):
+            """
+            Creates the neural network with an architecture given by layers
+            :param *layers: A sequential list of Layer Objects defined in keras (ex. InputLayer)
+            :param memory: ReplayMemory the transitions are stored in.
+            If None, a new in memory ReplayMemory is made
+            :param **options: A list of compile options used to compile the network
+            """
+            super().__init__()
+            for l in layers:
+                self.add(l)
+            self.compile(**compile_options)
+            self.memory = ReplayMemory() if memory is None else memory
+            self._state = np.empty(constants.SIZE_STATES, dtype=np.int8)
 
-    @staticmethod
-    def generate_action_number(ID_ask, ID_target, card):
-        """
-        Generates an action vector from the player's action
-        This vector is universal to all players, meaning it is independent of player ID
-        For example, player 0 asking player 3 for a Jc will return the ]
-        same vector as player 1 asking player 4 for a Jc
-        This is to ensure that the model can be used universally among all players
-        :param ID_ask: ID of player asking
-        :param ID_target: ID of target
-        :param card: Card being asked
-        :return: Action number (0-161)
-        """
-        player_num = (((ID_target - ID_ask) % 6) - 1)//2
-        card_num = list(card_utils.gen_all_cards()).index(card)
-        return player_num * constants.DECK_SIZE + card_num
+        def update_data(self, info, hs_info, num_cards, public_info, ID_ask, ID_target, card, success, done):
+            """
+            Adds a transition to the model's replay memory, given a transaction and state
+            :param info: defined in Player class
+            :param hs_info: defined in Player class
+            :param num_cards: defined in Player class
+            :param public_info: defined in Player class
+            :param ID_ask: ID of asker
+            :param ID_target: ID of target
+            :param card: Card being asked for
+            :param success: Was the ask successful
+            :param done: has the game finished?
+            """
+            self.memory.add(self.generate_state_vector(info, hs_info, num_cards, public_info, ID_ask, out=self._state),
+                            self.generate_action_number(ID_ask, ID_target, card), self.generate_reward_ask(success), done)
 
-    @staticmethod
-    def generate_reward_ask(success):
-        """
-        Generates a reward based on whether the ask was a success
-        :param success:
-        :return: reward
-        """
-        if success:
-            return constants.REWARD_SUCCESSFUL_ASK
-        return constants.REWARD_UNSUCCESSFUL_ASK
+        def export_numpy(self, path, weights="float32"):
+            """
+            Writes the model's weights to a .npz file that frozen_model.FrozenModel.load
+            runs with NumPy only, for processes that should not import tensorflow
+            :param path: file the weights are written to
+            :param weights: "float32", "float16" or "int8", how the weights are stored
+            :return: the frozen_model.FrozenModel that was written
+            """
+            return export_model(self, path, weights)
 
+        generate_state_vector = staticmethod(encoding.generate_state_vector)
+        generate_state_batch = staticmethod(encoding.generate_state_batch)
+        generate_action_number = staticmethod(encoding.generate_action_number)
+        generate_action_numbers = staticmethod(encoding.generate_action_numbers)
+        generate_reward_ask = staticmethod(encoding.generate_reward_ask)
 
+    return FishDecisionMaker
 
 
+def __getattr__(name):
+    if name == "FishDecisionMaker":
+        globals()[name] = _define_decision_maker()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
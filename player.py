@@ -1,8 +1,14 @@
 import card_utils
 import random
+import numpy as np
 from constants import YES, NO, UNSURE, NUM_PLAYERS, DECK_SIZE, HS_SIZE
+from endgame import EndgameSolver
 from exceptions import InfoDictException
-import copy
+from instrumentation import make_propagator
+from propagation import Propagator
+from probability import ProbabilityEngine
+from public_knowledge import PublicKnowledge, apply_events, deduce_exact, ASK_EVENT, CALL_EVENT
+from tables import CardTable, HalfSuitTable, CardCounts, CARD_HS_MATRIX, CARD_HS_INDEX
 
 
 class Player:
@@ -34,13 +40,18 @@ class Player:
     }
     Where count is the minimum number of cards a player has in a half suit
 
+    The tables are stored as numpy arrays (see tables.py) but are indexed
+    just like the dictionaries above, so info[ID][card] still works.
+    Dictionaries passed in to the constructor are converted to tables.
+
     Important methods:
     Take in a Transaction object and update the info data structure with the information
     Determine the "optimal" play that it can make
     Determine whether to call, and which half suit
     """
 
-    def __init__(self, ID, num_cards, info, public_info, hs_info, public_hs_info, remaining_hs, name=None):
+    def __init__(self, ID, num_cards, info, public_info, hs_info, public_hs_info, remaining_hs, name=None,
+                 exact=False, public=None, rng=None, stats=None, cache=None, strategy=None, endgame=None):
         """
         Initializes the player with the information:
         :param ID: a number in the range 0-5 that denotes the team of the player.
@@ -57,30 +68,142 @@ class Player:
         :param Name: The name of the player. This field is not relevant to the logic in the game.
         Since each player knows their own cards, the section of the dictionary corresponding
         to their own id will be completely determined (YES or NO)
+        :param exact: If True, every update also runs the exact flow based deduction in
+        feasibility.py, which finds every entry that is forced but is slower than the rules alone
+        :param public: A PublicKnowledge shared with the other players of a game.
+        If given, num_cards, public_info, public_hs_info and remaining_hs are ignored,
+        and the owner of public (the FishGame) is responsible for updating it
+        :param rng: random.Random used to choose asks. If None, the global random module is used
+        :param stats: KnowledgeStats that the propagation of info is counted in, or None to not count it
+        :param cache: TranspositionCache of propagation results, or None to not cache them.
+        If the player makes its own PublicKnowledge, that shares the cache too
+        :param strategy: object that chooses the player's asks when no card is guaranteed, such as an
+        ismcts.ISMCTS. It has a make_ask(player) method, and update_transaction and update_call methods
+        that are told every update. If None, the most likely ask is made
+        :param endgame: endgame.EndgameSolver that chooses the player's asks once few cards are left,
+        before the strategy, and the calls the player is forced to make. If None, forced calls make their own
         """
         self.ID = ID
         self.name = name
-        self.num_cards = num_cards
+        self.exact = exact
+        self.rng = random if rng is None else rng
+        self.stats = stats
+        self.cache = cache
+        self.strategy = strategy
+        self.endgame = endgame
+        self._info_engine = None
+        self._probability_engine = None
+        self._tables_changed = False
+        self._pending = []
+        self._owns_public = public is None
+        if public is None:
+            public = PublicKnowledge(num_cards, public_info, public_hs_info, remaining_hs, exact=exact, cache=cache)
+        self.public = public
         self.info = info
-        self.public_info = public_info
         self.hs_info = hs_info
-        self.public_hs_info = public_hs_info
-        self.remaining_hs = remaining_hs
         self._update_info()
-        self._update_public_info()
+        if self._owns_public:
+            self._update_public_info()
+
+    @property
+    def num_cards(self):
+        return self.public.num_cards
+
+    @num_cards.setter
+    def num_cards(self, num_cards):
+        self.public.num_cards = num_cards
+        self._info_engine = None
+
+    @property
+    def info(self):
+        self._flush()
+        return self._info
+
+    @info.setter
+    def info(self, info):
+        self._info = CardTable.coerce(info)
+        self._info.on_change = self._table_changed
+        self._info_engine = None
+
+    @property
+    def public_info(self):
+        return self.public.public_info
+
+    @public_info.setter
+    def public_info(self, public_info):
+        self.public.public_info = public_info
+
+    @property
+    def hs_info(self):
+        self._flush()
+        return self._hs_info
+
+    @hs_info.setter
+    def hs_info(self, hs_info):
+        self._hs_info = HalfSuitTable.coerce(hs_info)
+        self._hs_info.on_change = self._table_changed
+        self._info_engine = None
+
+    @property
+    def public_hs_info(self):
+        return self.public.public_hs_info
+
+    @public_hs_info.setter
+    def public_hs_info(self, public_hs_info):
+        self.public.public_hs_info = public_hs_info
+
+    @property
+    def remaining_hs(self):
+        return self.public.remaining_hs
+
+    @remaining_hs.setter
+    def remaining_hs(self, remaining_hs):
+        self.public.remaining_hs = remaining_hs
+        self._info_engine = None
 
     @classmethod
-    def player_start_of_game(cls, ID, own_cards, name=None):
+    def player_start_of_game(cls, ID, own_cards, name=None, exact=False, public=None, rng=None, stats=None,
+                             cache=None, strategy=None, endgame=None):
         """
         This initialization corresponds to the initialization at the start of a fish game
-        Assumes that everyone has 9 cards
-        """
+        Assumes that everyone has 9 cards, unless a shared PublicKnowledge is given
+        :param public: the game's PublicKnowledge. The player's private info starts
+        from the public info with its own hand filled in
+        """
+        if public is not None:
+            return cls(ID, None, cls._init_info_from_public(public, ID, own_cards), None,
+                       cls._init_hs_info_from_public(public, ID, own_cards), None, None,
+                       name=name, exact=exact, public=public, rng=rng, stats=stats, cache=cache,
+                       strategy=strategy, endgame=endgame)
         num_cards = {x: 9 for x in range(NUM_PLAYERS)}
         return cls(ID, num_cards, cls._init_info_start_game(ID, own_cards),
                    cls._init_public_info_start_game(),
                    cls._init_hs_info_start_game(ID, own_cards),
                    cls._init_public_hs_info_start_game(),
-                   list(card_utils.gen_all_halfsuits()), name=name)
+                   list(card_utils.gen_all_halfsuits()), name=name, exact=exact, rng=rng, stats=stats,
+                   cache=cache, strategy=strategy, endgame=endgame)
+
+    @staticmethod
+    def _init_info_from_public(public, ID, own_cards):
+        """
+        Returns the info table given the public knowledge and your own cards and ID
+        """
+        info = public.public_info.copy()
+        info.array[ID] = NO
+        for card in own_cards:
+            info[ID][card] = YES
+        return info
+
+    @staticmethod
+    def _init_hs_info_from_public(public, ID, own_cards):
+        """
+        Returns the half suit info table given the public knowledge and your own cards and ID
+        """
+        hs_info = public.public_hs_info.copy()
+        hs_info.array[ID] = 0
+        for card in own_cards:
+            hs_info[ID][card_utils.find_half_suit(card)] += 1
+        return hs_info
 
     @staticmethod
     def _init_info_start_game(ID, own_cards):
@@ -139,47 +262,84 @@ class Player:
             public_hs_info[ID] = d
         return public_hs_info
 
-    def _update_info(self, check_cards=tuple(card_utils.gen_all_cards())):
-        self.info = self._update_recurse(copy.deepcopy(self.info), self.remaining_hs,
-                                         self.hs_info, self.num_cards, check_cards=check_cards)
+    def _update_info(self, check_cards=card_utils.ALL_CARDS):
+        """
+        Updates the info table in place
+        The changes are recorded on the trail, so they can be undone with rollback
+        """
+        engine = self._engine()
+        engine.sweep(check_cards)
+        if self.exact:
+            deduce_exact(engine)
+        self._probability_engine = None
 
-    def _update_public_info(self, check_cards=tuple(card_utils.gen_all_cards())):
-        self.public_info = self._update_recurse(copy.deepcopy(self.public_info), self.remaining_hs,
-                                                self.public_hs_info, self.num_cards, check_cards=check_cards)
+    def _update_public_info(self, check_cards=card_utils.ALL_CARDS):
+        """
+        Updates the public info table in place
+        The changes are recorded on the trail, so they can be undone with rollback
+        """
+        self.public.update(check_cards)
+
+    def _engine(self):
+        """
+        Returns the propagator for info, with every queued event applied
+        """
+        self._flush(sweep=self._tables_changed)
+        return self._info_engine
+
+    def _table_changed(self):
+        """
+        Called when info or hs_info is written through its dictionary view (info[ID][card] = ...)
+        The propagator's counters no longer match the tables, so the next flush recomputes them
+        and propagates the whole table, as _update_recurse used to on every update
+        """
+        self._tables_changed = True
+        self._probability_engine = None
+
+    def _flush(self, sweep=False):
+        """
+        Applies the queued asks and calls to info and hs_info and propagates them
+        If a table was replaced since the last flush, the propagator is rebuilt
+        and the whole table is propagated. If a table was written through its view,
+        the whole table is propagated with the next queued events
+        :param sweep: If True, propagates the whole table even if no events are queued
+        """
+        if self._info_engine is None:
+            self._info_engine = make_propagator(self._info, self._hs_info, self.num_cards, self.remaining_hs,
+                                                self.stats, self.cache)
+            sweep = True
+        elif not self._pending and not sweep:
+            return
+        elif self._tables_changed:
+            self._info_engine.resync()
+            sweep = True
+        self._tables_changed = False
+        pending, self._pending = self._pending, []
+        self._probability_engine = None
+        if self.stats is not None:
+            self.stats.flushes += 1
+            self.stats.events += len(pending)
+        apply_events(self._info_engine, pending, self.exact, sweep)
 
     @staticmethod
     def _update_recurse(info_dict, remaining_hs, hs_info, num_cards, check_cards):
         """
-        Recursively updates entries in an info dictionary to YES or NO
-        This method works by assuming either YES or NO for all unsure cards
-        then checking for contradictions
-        If there is a contradiction, the other option must be correct
-        If there is no contradiction for either YES or NO, then leave as UNSURE
+        Updates entries in an info dictionary to YES or NO
+        An UNSURE entry is set to NO if setting it to YES contradicts the rules
+        in _is_consistent, and to YES if setting it to NO does.
+        This is repeated until nothing changes, using the incremental
+        Propagator so that only entries affected by a change are checked again
 
-        This function is expensive!
         :param info_dict: either a public info dict or player info dict
         :param remaining_hs: remaining half suits
         :param hs_info: half suit info
         :param num_cards: each players number of cards
         :param check_cards: list of cards to check for updates to info
-        :return: an updated info dictionary
-        """
-        changed = True
-        while changed:
-            changed = False
-            for ID in range(NUM_PLAYERS):
-                for c in check_cards:
-                    if info_dict[ID][c] == UNSURE:
-                        res = UNSURE
-                        info_dict[ID][c] = YES
-                        if not Player._is_consistent(info_dict, remaining_hs, hs_info, num_cards, check_cards):
-                            res = NO
-                            changed = True
-                        info_dict[ID][c] = NO
-                        if not Player._is_consistent(info_dict, remaining_hs, hs_info, num_cards, check_cards):
-                            res = YES
-                            changed = True
-                        info_dict[ID][c] = res
+        :return: an updated info table
+        """
+        info_dict = CardTable.coerce(info_dict)
+        Propagator(info_dict, HalfSuitTable.coerce(hs_info), CardCounts.coerce(num_cards),
+                   remaining_hs).sweep(check_cards)
         return info_dict
 
     @staticmethod
@@ -204,90 +364,53 @@ class Player:
         :param check_cards: cards to check for consistency
         :return: True if consistent, false otherwise
         """
+        info = CardTable.coerce(info_dict).array
+        hs_info = HalfSuitTable.coerce(hs_info).array
+        num_cards = CardCounts.coerce(num_cards).array
+        check_ids = [card_utils.CARD_IDS[c] for c in check_cards]
+        is_no = info == NO
         # Calculate check_hs based on check_cards
-        check_hs = set([])
-        for c in check_cards:
-            hs = card_utils.find_half_suit(c)
-            if hs not in check_hs and hs in remaining_hs:
-                check_hs.add(hs)
+        check_hs = np.zeros(len(card_utils.ALL_HALFSUITS), dtype=bool)
+        check_hs[CARD_HS_INDEX[check_ids]] = True
+        check_hs &= [hs in remaining_hs for hs in card_utils.ALL_HALFSUITS]
         # Rule 1
-        for card in check_cards:
-            players_yes = 0
-            for ID in range(NUM_PLAYERS):
-                if info_dict[ID][card] == YES:
-                    players_yes += 1
-            if players_yes > 1:
-                return False
+        if ((info[:, check_ids] == YES).sum(axis=0) > 1).any():
+            return False
         # Rule 2
-        for hs in check_hs:
-            for card in card_utils.find_cards(hs):
-                players_no = 0
-                for ID in range(NUM_PLAYERS):
-                    if info_dict[ID][card] == NO:
-                        players_no += 1
-                if players_no == NUM_PLAYERS:
-                    return False
+        if (is_no.sum(axis=0)[check_hs[CARD_HS_INDEX]] == NUM_PLAYERS).any():
+            return False
         # Rule 3
-        for hs in check_hs:
-            for ID in range(NUM_PLAYERS):
-                hs_no_count = 0
-                for card in card_utils.find_cards(hs):
-                    if info_dict[ID][card] == NO:
-                        hs_no_count += 1
-                if hs_info[ID][hs] + hs_no_count > HS_SIZE:
-                    return False
+        hs_no_count = is_no @ CARD_HS_MATRIX
+        if ((hs_info + hs_no_count > HS_SIZE)[:, check_hs]).any():
+            return False
         # Rule 4
-        for ID in range(NUM_PLAYERS):
-            no_count = 0
-            for card in card_utils.gen_all_cards():
-                if info_dict[ID][card] == NO:
-                    no_count += 1
-            if num_cards[ID] + no_count > DECK_SIZE:
-                return False
+        if (num_cards + is_no.sum(axis=1) > DECK_SIZE).any():
+            return False
         return True
 
     def update_transaction(self, ID_ask, ID_target, card, success):
         """
         Given a transaction, updates the player's info, public info, and half suit info
+        If the public knowledge is shared, only the player's own info is updated here
+        The update is queued and propagated the next time info or hs_info is read
 
         :param ID_ask: ID of player asking for the card
         :param ID_target: player being asked
         :param card: card being asked
         :param success: true if card was taken from ID_target
         """
-        if success:
-            self.num_cards[ID_ask] += 1
-            self.num_cards[ID_target] -= 1
-            self.info[ID_ask][card] = YES
-            self.info[ID_target][card] = NO
-            self.public_info[ID_ask][card] = YES
-            self.public_info[ID_target][card] = NO
-            if self.hs_info[ID_ask][card_utils.find_half_suit(card)] == 0:
-                self.hs_info[ID_ask][card_utils.find_half_suit(card)] = 1
-            self.hs_info[ID_ask][card_utils.find_half_suit(card)] += 1
-            if self.public_hs_info[ID_ask][card_utils.find_half_suit(card)] == 0:
-                self.public_hs_info[ID_ask][card_utils.find_half_suit(card)] = 1
-            self.public_hs_info[ID_ask][card_utils.find_half_suit(card)] += 1
-            if self.hs_info[ID_target][card_utils.find_half_suit(card)] > 0:
-                self.hs_info[ID_target][card_utils.find_half_suit(card)] -= 1
-            if self.public_hs_info[ID_target][card_utils.find_half_suit(card)] > 0:
-                self.public_hs_info[ID_target][card_utils.find_half_suit(card)] -= 1
-        else:
-            self.info[ID_ask][card] = NO
-            self.info[ID_target][card] = NO
-            self.public_info[ID_ask][card] = NO
-            self.public_info[ID_target][card] = NO
-            if self.hs_info[ID_ask][card_utils.find_half_suit(card)] == 0:
-                self.hs_info[ID_ask][card_utils.find_half_suit(card)] = 1
-            if self.public_hs_info[ID_ask][card_utils.find_half_suit(card)] == 0:
-                self.public_hs_info[ID_ask][card_utils.find_half_suit(card)] = 1
-        self._update_info(card_utils.find_cards(card_utils.find_half_suit(card)))
-        self._update_public_info(card_utils.find_cards(card_utils.find_half_suit(card)))
+        if self._owns_public:
+            self.public.update_transaction(ID_ask, ID_target, card, success)
+        self._pending.append((ASK_EVENT, ID_ask, ID_target, card_utils.CARD_IDS[card], success))
+        if self.strategy is not None:
+            self.strategy.update_transaction(ID_ask, ID_target, card, success)
 
     def update_call(self, hs, card_count_hs):
         """
         Given a half suit being called, update the player's info and half suit info
         This essentially sets the info on all players to knowing that they don't have cards in that half suit
+        If the public knowledge is shared, only the player's own info is updated here
+        The update is queued and propagated the next time info or hs_info is read
 
         hs: the half suit being called
         card_count_hs: the number of cards that each player had in the half suit
@@ -295,16 +418,42 @@ class Player:
 
         Note that there's no difference whether the call succeeds or fails!
         """
-        self.remaining_hs.remove(hs)
-        for ID in range(NUM_PLAYERS):
-            for card in card_utils.find_cards(hs):
-                self.info[ID][card] = NO
-                self.public_info[ID][card] = NO
-            self.hs_info[ID][hs] = 0
-            self.public_hs_info[ID][hs] = 0
-            self.num_cards[ID] -= card_count_hs[ID]
-        self._update_info()
-        self._update_public_info()
+        if self._owns_public:
+            self.public.update_call(hs, card_count_hs)
+        self._pending.append((CALL_EVENT, card_utils.HS_IDS[hs]))
+        if self.strategy is not None:
+            self.strategy.update_call(hs, card_count_hs)
+
+    def checkpoint(self):
+        """
+        Returns a marker for the player's current knowledge (info, half suit info and,
+        if the player owns its public knowledge, the public tables)
+        Calling rollback with the marker undoes every update made after the checkpoint,
+        so hypothetical asks can be tried without copying the player
+        """
+        public_marker = self.public.checkpoint() if self._owns_public else None
+        return self._engine().checkpoint(), public_marker
+
+    def rollback(self, marker):
+        """
+        Restores the player's knowledge to a marker returned by checkpoint
+        A shared public knowledge has to be rolled back by its owner first
+        :param marker: a marker returned by checkpoint
+        """
+        info_marker, public_marker = marker
+        self._pending = []
+        if self._owns_public:
+            self.public.rollback(public_marker)
+        self._engine().rollback(info_marker)
+        self._probability_engine = None
+
+    def clear_trail(self):
+        """
+        Forgets the recorded updates, so earlier checkpoints can no longer be rolled back to
+        """
+        self._engine().clear_trail()
+        if self._owns_public:
+            self.public.clear_trail()
 
     def own_cards(self):
         """
@@ -329,7 +478,7 @@ class Player:
         """
         if ID_target % 2 != self.ID % 2:
             if self.info[self.ID][card] == NO:
-                for c in card_utils.find_cards(card_utils.find_half_suit(card)):
+                for c in card_utils.HS_CARD_NAMES[card_utils.CARD_HS[card_utils.CARD_IDS[card]]]:
                     if self.info[self.ID][c] == YES:
                         return True
         return False
@@ -337,19 +486,21 @@ class Player:
     def make_optimal_ask(self):
         """
         Returns the optimal person and card to ask
+        A guaranteed card is always asked for. Otherwise the endgame solver chooses once few cards are left,
+        and before that the player's strategy, if it has one
         Format: (target_player_id, card)
         """
         ask_guarenteed = self._check_card_guarenteed()
         if ask_guarenteed:
             return ask_guarenteed
-        # For now, just ask randomly if no obvious card
-        target = self._get_opponents()[random.randint(0, 2)]
-        valid = []
-        for c in card_utils.gen_all_cards():
-            if self._check_legal_ask(target, c):
-                valid.append(c)
-        return target, valid[random.randint(0, len(valid) - 1)]
-        # return self._list_best_options()[0]
+        if self.endgame is not None:
+            ask = self.endgame.make_ask(self)
+            if ask is not None:
+                return ask
+        if self.strategy is not None:
+            return self.strategy.make_ask(self)
+        best_asks = self._list_best_options()
+        return best_asks[self.rng.randint(0, len(best_asks) - 1)]
 
     def _check_card_guarenteed(self):
         """
@@ -357,39 +508,72 @@ class Player:
         If so, return a tuple (player_id, card)
         If not, return False
         """
-        for hs in card_utils.gen_all_halfsuits():
+        for h, hs in enumerate(card_utils.ALL_HALFSUITS):
             if self.hs_info[self.ID][hs] > 0:
-                for card in card_utils.find_cards(hs):
+                for card in card_utils.HS_CARD_NAMES[h]:
                     for ID in self._get_opponents():
                         if self.info[ID][card] == YES:
                             return ID, card
         return False
 
+    def _probabilities(self):
+        """
+        Returns the probability.ProbabilityEngine of everything the player knows
+        It is kept until the propagator flushes new knowledge, so asks made without anything new being
+        learned in between reuse its work
+        """
+        self._flush()
+        if self._probability_engine is None:
+            self._probability_engine = ProbabilityEngine(self._info, self._hs_info, self.num_cards,
+                                                         self.remaining_hs)
+        return self._probability_engine
+
+    def card_probabilities(self):
+        """
+        Returns the NUM_PLAYERS x DECK_SIZE numpy array of the probability that each player has each card,
+        given everything the player knows (see probability.ProbabilityEngine)
+        """
+        return self._probabilities().probabilities
+
+    def sample_deals(self, num_samples, rng=None):
+        """
+        Returns a num_samples x DECK_SIZE int8 numpy array of deals drawn uniformly from the deals consistent with
+        everything the player knows. Each row is the ID of the player who has each card (-1 for called cards)
+        The work of sampling is kept until the player learns something new, so later calls are cheaper
+        :param rng: numpy Generator. If None, one is seeded from the player's rng, so a game replayed
+        from the same seed draws the same deals
+        """
+        if rng is None:
+            rng = np.random.default_rng(self.rng.getrandbits(64))
+        return self._probabilities().sample_deals(num_samples, rng)
+
     def _list_best_options(self):
         """
-        Returns a list of the highest probability asks you can make, according to self.info
+        Returns a list of the highest probability asks you can make, according to card_probabilities
         Ties are broken in this method by the following criteria:
         1. Number of guarenteed cards in half suit
         If player A is guarenteed to have more cards in the half suit than player B, ask them
 
         This method does not account for the "danger" of asking certain players yet
         """
+        probabilities = self.card_probabilities()
+        hs_info = self.hs_info.array
+        own = self.info.array[self.ID]
+        # The legal cards are the ones the player does not have in half suits they have a card in
+        has_hs = np.bincount(CARD_HS_INDEX[own == YES], minlength=len(card_utils.ALL_HALFSUITS)) > 0
+        legal_cards = np.flatnonzero((own == NO) & has_hs[CARD_HS_INDEX])
         best_asks = []
-        highest_prob = 0
-        most_hs_cards = 0
-        for card in card_utils.gen_all_cards():
+        best = None
+        for c in legal_cards.tolist():
+            h = card_utils.CARD_HS[c]
             for ID in self._get_opponents():
-                if self._check_legal_ask(ID, card):
-                    if self.info[ID][card] != NO:
-                        best_asks = [(ID, card)]
-                        highest_prob = self.info[ID][card]
-                        most_hs_cards = self.hs_info[ID][card_utils.find_half_suit(card)]
-                    elif self.info[ID][card] == highest_prob:
-                        if self.hs_info[ID][card_utils.find_half_suit(card)] > most_hs_cards:
-                            best_asks = [(ID, card)]
-                            most_hs_cards = self.hs_info[ID][card_utils.find_half_suit(card)]
-                        elif self.hs_info[ID][card_utils.find_half_suit(card)] == most_hs_cards:
-                            best_asks.append((ID, card))
+                # Probabilities are rounded so that equally likely asks tie
+                option = (round(probabilities[ID, c], 9), hs_info[ID, h])
+                if best is None or option > best:
+                    best_asks = [(ID, card_utils.ALL_CARDS[c])]
+                    best = option
+                elif option == best:
+                    best_asks.append((ID, card_utils.ALL_CARDS[c]))
         return best_asks
 
     def check_call(self):
@@ -399,9 +583,9 @@ class Player:
         [(player, card), (player, card) ...]
         If no call can be made, return False
         """
-        for hs in card_utils.gen_all_halfsuits():
+        for cards in card_utils.HS_CARD_NAMES:
             call = []
-            for card in card_utils.find_cards(hs):
+            for card in cards:
                 for ID in self._get_teammates():
                     if self.info[ID][card] == YES:
                         call.append((ID, card))
@@ -413,21 +597,14 @@ class Player:
         """
         Forces the player to call the half suit hs.
         Typically this happens at the end of the game
+        The call is the one that is right in the most deals consistent with what the player knows
+        (see endgame.EndgameSolver.best_call)
         :param hs: half suit that is being forced
         :return: A "call" list of tuples
         [(player, card), (player, card) ...]
         """
-        call = []
-        teammates = self._get_teammates()
-        for card in card_utils.find_cards(hs):
-            found = False
-            for ID in range(NUM_PLAYERS):
-                if self.info[ID][card] == YES and ID in teammates:
-                    call.append((ID, teammates))
-                    found = True
-            if not found:
-                call.append(teammates[random.randint(0, len(teammates)-1)], call)
-        return call
+        solver = self.endgame if self.endgame is not None else EndgameSolver(rng=self.rng)
+        return solver.best_call(self, hs)
 
     def _get_opponents(self):
         """
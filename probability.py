@@ -0,0 +1,320 @@
+from functools import lru_cache
+from itertools import product
+import numpy as np
+import card_utils
+from constants import YES, UNSURE, NUM_PLAYERS, DECK_SIZE
+from exceptions import InfoDictException
+from tables import CardTable, HalfSuitTable, CardCounts
+
+
+@lru_cache(maxsize=4096)
+def _group_ways(allowed, mins, caps):
+    """
+    Counts the ways to give a group of unknown cards to the players
+    Memoized, since most groups are single cards that many players might have, and repeat
+    The returned dictionary is shared, so it must not be changed
+    :param allowed: tuple of, for each unknown card, the tuple of (axis) players who might have it
+    :param mins: the least number of these cards each player must get
+    :param caps: the most number of these cards each player can get
+    :return: dictionary of {tuple of the number of cards each player gets: number of ways}
+    """
+    ways = {(0,) * len(mins): 1}
+    for players in allowed:
+        step = {}
+        for k, count in ways.items():
+            for i in players:
+                if k[i] < caps[i]:
+                    new_k = k[:i] + (k[i] + 1,) + k[i + 1:]
+                    step[new_k] = step.get(new_k, 0) + count
+        ways = step
+    return {k: count for k, count in ways.items() if all(map(int.__ge__, k, mins))}
+
+
+@lru_cache(maxsize=256)
+def _group_assignments(allowed, num_players):
+    """
+    Lists every way to give a group of unknown cards to the players, by how many cards each player gets
+    :param allowed: tuple of, for each unknown card, the tuple of (axis) players who might have it
+    :param num_players: number of axis players
+    :return: dictionary of {tuple of the number of cards each player gets: array of assignments}, where
+    each row of an array is the (axis) player of each card
+    """
+    assignments = np.array(list(product(*allowed)), dtype=np.intp).reshape(-1, len(allowed))
+    counts = (assignments[:, :, None] == np.arange(num_players)).sum(axis=1)
+    groups = {}
+    for row, k in zip(assignments, map(tuple, counts.tolist())):
+        groups.setdefault(k, []).append(row)
+    return {k: np.array(rows) for k, rows in groups.items()}
+
+
+@lru_cache(maxsize=None)
+def _shift(k):
+    """
+    Returns the slices (read, write) that move an array on the counts grid by k cards
+    """
+    return tuple(slice(None, -n if n else None) for n in k), tuple(slice(n, None) for n in k)
+
+
+class ProbabilityEngine:
+    """
+    Exact probabilities of where each card is, given what a player knows
+
+    A deal is consistent with the tables if every unknown card goes to a player whose
+    info is UNSURE for it, each player ends up with num_cards cards and at least
+    hs_info cards in each half suit. Every consistent deal is equally likely, and
+    probabilities[ID][c] is the fraction of them where player ID has card c.
+
+    The deals are counted without listing them, by dynamic programming over groups of
+    unknown cards. A half suit where some player must have more cards than are known is
+    one group, since those cards have to be dealt together to check the minimum; every
+    other unknown card is a group by itself. A deal is a choice of how many cards of each
+    group each player gets (the ways to do that are counted once per group), and the
+    state between groups is how many unknown cards each player got so far, a grid
+    with one axis per player who still has unknown cards. The last of these players is
+    left off the grid, since their count is the number of cards dealt minus the others'.
+    forward[g] counts the ways to deal the groups before g and backward[g] the ways
+    to finish the deal from g, so each group's cards can be weighted by the number of
+    ways to complete the rest of the deal around them.
+
+    The same forward grids give uniformly random consistent deals (see sample_deals): going back
+    from the last group, the split of each group is drawn in proportion to the number of deals
+    that use it, and then the group's cards are given out uniformly among the ways to make that split.
+
+    total: number of consistent deals (as a float, since it can be very large)
+    probabilities: NUM_PLAYERS x DECK_SIZE array. YES entries are 1 and NO entries are 0
+    """
+
+    def __init__(self, info, hs_info, num_cards, remaining_hs):
+        """
+        Raises InfoDictException if no deal is consistent with the tables
+        :param info: CardTable or info dictionary
+        :param hs_info: HalfSuitTable or half suit info dictionary
+        :param num_cards: CardCounts or dictionary of each player's number of cards
+        :param remaining_hs: list of the half suits that have not been called
+        """
+        cells = CardTable.coerce(info).array
+        hs_mins = HalfSuitTable.coerce(hs_info).array
+        counts = CardCounts.coerce(num_cards).array
+        self._cells = cells
+        self._probabilities = None
+        self._sampling = None
+        half_suits = [card_utils.HS_IDS[hs] for hs in remaining_hs]
+        yes = (cells == YES).astype(np.int64)
+        need = counts.astype(np.int64) - sum(yes[:, card_utils.HS_CARDS[h]].sum(axis=1) for h in half_suits)
+        if np.any(need < 0):
+            raise InfoDictException("A player has more known cards than cards")
+        # Players with unknown cards left, one grid axis each (except the last)
+        self.players = [ID for ID in range(NUM_PLAYERS) if need[ID] > 0]
+        axis = {ID: i for i, ID in enumerate(self.players)}
+        caps = tuple(int(need[ID]) for ID in self.players)
+
+        # The groups of unknown cards and the ways to deal each of them
+        self._cards, self._allowed, self._ways = [], [], []
+        for h in half_suits:
+            cards = [c for c in card_utils.HS_CARDS[h] if not yes[:, c].any()]
+            allowed = []
+            for c in cards:
+                players = tuple(axis[ID] for ID in np.flatnonzero(cells[:, c] == UNSURE) if ID in axis)
+                if not players:
+                    raise InfoDictException("Nobody can have {}".format(card_utils.ALL_CARDS[c]))
+                allowed.append(players)
+            mins = [0] * len(self.players)
+            for ID in range(NUM_PLAYERS):
+                missing = hs_mins[ID, h] - yes[ID, card_utils.HS_CARDS[h]].sum()
+                if missing > 0:
+                    if ID not in axis:
+                        raise InfoDictException("Player {} cannot have enough cards in {}".format(
+                            ID, card_utils.ALL_HALFSUITS[h]))
+                    mins[axis[ID]] = int(missing)
+            if any(mins):
+                groups = [(cards, tuple(allowed))]
+            else:
+                groups = [([c], (players,)) for c, players in zip(cards, allowed)]
+            for group_cards, group_allowed in groups:
+                ways = _group_ways(group_allowed, tuple(mins), caps)
+                if not ways:
+                    raise InfoDictException("The cards of {} cannot be dealt".format(card_utils.ALL_HALFSUITS[h]))
+                self._cards.append(group_cards)
+                self._allowed.append(group_allowed)
+                self._ways.append(ways)
+
+        if sum(caps) != sum(len(cards) for cards in self._cards):
+            raise InfoDictException("The number of unknown cards does not match the number of cards")
+        self._caps = caps
+        if not self.players:
+            self.total = 1.0
+            return
+        self._grid_shape = tuple(n + 1 for n in caps[:-1])
+        # Number of cards dealt to the players on the grid, at each point of the grid
+        self._dealt = sum(np.indices(self._grid_shape)) if self._grid_shape else np.zeros(())
+        self._last_cap = caps[-1]
+        self._forward_grids = self._forward()
+        self.total = float(self._forward_grids[-1][tuple(caps[:-1])])
+        if self.total == 0:
+            raise InfoDictException("No deal is consistent with the tables")
+
+    @property
+    def probabilities(self):
+        """
+        Computed the first time it is read, since sampling deals does not need it
+        """
+        if self._probabilities is None:
+            self._probabilities = (self._cells == YES).astype(np.float64)
+            if self.players:
+                forward, backward = self._forward_grids, self._backward(self._caps)
+                for g in range(len(self._ways)):
+                    self._group_probabilities(g, forward[g], backward[g + 1])
+        return self._probabilities
+
+    def _mask(self, grid, dealt):
+        """
+        Zeroes the points of the grid where the last player would have too many or too few cards
+        """
+        last = dealt - self._dealt
+        grid[(last < 0) | (last > self._last_cap)] = 0
+        return grid
+
+    def _forward(self):
+        forward = [np.zeros(self._grid_shape)]
+        forward[0][(0,) * len(self._grid_shape)] = 1
+        dealt = 0
+        for g, ways in enumerate(self._ways):
+            grid = np.zeros(self._grid_shape)
+            for k, count in ways.items():
+                read, write = _shift(k[:-1])
+                grid[write] += count * forward[-1][read]
+            dealt += len(self._cards[g])
+            forward.append(self._mask(grid, dealt))
+        return forward
+
+    def _backward(self, caps):
+        grid = np.zeros(self._grid_shape)
+        grid[tuple(caps[:-1])] = 1
+        backward = [grid]
+        dealt = sum(caps)
+        for g in reversed(range(len(self._ways))):
+            dealt -= len(self._cards[g])
+            grid = np.zeros(self._grid_shape)
+            for k, count in self._ways[g].items():
+                read, write = _shift(k[:-1])
+                grid[read] += count * backward[0][write]
+            backward.insert(0, self._mask(grid, dealt))
+        return backward
+
+    def _group_probabilities(self, g, before, after):
+        """
+        Sets the probabilities of the cards of group g
+        :param before: forward grid before the group
+        :param after: backward grid after the group
+        """
+        # Number of deals for each way of splitting the group's cards between the players
+        weight = {}
+        for k in self._ways[g]:
+            read, write = _shift(k[:-1])
+            weight[k] = float(np.vdot(before[read], after[write]))
+        allowed, cards = self._allowed[g], self._cards[g]
+        # Forward and backward over the cards of the group, weighted by the rest of the deal
+        prefix = [{(0,) * len(self.players): 1.0}]
+        for players in allowed[:-1]:
+            step = {}
+            for k, count in prefix[-1].items():
+                for i in players:
+                    new_k = k[:i] + (k[i] + 1,) + k[i + 1:]
+                    step[new_k] = step.get(new_k, 0.0) + count
+            prefix.append(step)
+        suffix = weight
+        for j in reversed(range(len(allowed))):
+            step = {}
+            for k, count in prefix[j].items():
+                rest_total = 0.0
+                for i in allowed[j]:
+                    rest = suffix.get(k[:i] + (k[i] + 1,) + k[i + 1:], 0.0)
+                    if rest:
+                        self._probabilities[self.players[i], cards[j]] += count * rest / self.total
+                        rest_total += rest
+                step[k] = rest_total
+            suffix = step
+
+    def sample_deals(self, num_samples, rng=None):
+        """
+        Draws deals uniformly at random from the deals consistent with the tables
+        Every sample is equally likely, so no importance weights are needed. The engine keeps the work
+        shared between samples, so one engine should be used for all the samples of a state
+        :param num_samples: number of deals
+        :param rng: numpy Generator. If None, a new one is made
+        :return: num_samples x DECK_SIZE int8 array of the player who has each card in each deal,
+        -1 for the cards of half suits that have been called
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        # Filled in card by card, so it is card x sample until it is returned
+        deals = np.full((DECK_SIZE, num_samples), -1, dtype=np.int8)
+        owners = np.nonzero((self._cells == YES).T)
+        deals[owners[0]] = owners[1][:, None]
+        if not self.players:
+            return np.ascontiguousarray(deals.T)
+        if self._sampling is None:
+            self._sampling = self._sampling_tables()
+        position, steps = self._sampling
+        # Flat index of each sample on the padded grid, going back from the full deal
+        position = np.full(num_samples, position, dtype=np.intp)
+        samples = np.arange(num_samples)
+        draws = rng.random((len(self._ways), num_samples))
+        for g in reversed(range(len(self._ways))):
+            grid, offsets, counts, owners = steps[g]
+            # Grid points before the group for each sample and each split, and the number of deals through them
+            # (split x sample, so the sums run over the short axis)
+            before = position - offsets[:, None]
+            cumulative = (counts[:, None] * grid.take(before)).cumsum(axis=0)
+            choice = np.minimum((cumulative <= draws[g] * cumulative[-1]).sum(axis=0), len(offsets) - 1)
+            position = before[choice, samples]
+            cards = self._cards[g]
+            if len(cards) == 1:
+                deals[cards[0]] = owners[choice]
+                continue
+            assignments = _group_assignments(self._allowed[g], len(self.players))
+            splits = list(self._ways[g])
+            for s in np.unique(choice):
+                rows = np.flatnonzero(choice == s)
+                options = assignments[splits[s]]
+                picked = options[rng.integers(len(options), size=len(rows))]
+                deals[np.array(cards)[:, None], rows] = owners[picked].T
+        return np.ascontiguousarray(deals.T)
+
+    def _sampling_tables(self):
+        """
+        Returns what sample_deals reuses between calls: the flat index of the full deal and, for each group,
+        (forward grid before the group, flat offset of each split, number of ways of each split, owners)
+        The forward grids are padded with zeros below each axis and flattened, so a split that would take
+        a player below 0 cards reads a 0 instead of needing a bounds check
+        For single card groups owners is the player who gets the card in each split, otherwise the player of each axis
+        """
+        pad = max(len(cards) for cards in self._cards)
+        shape = tuple(n + pad for n in self._grid_shape)
+        strides = np.array([int(np.prod(shape[i + 1:])) for i in range(len(shape))], dtype=np.intp)
+        players = np.array(self.players, dtype=np.int8)
+        steps = []
+        for g, ways in enumerate(self._ways):
+            grid = np.zeros(shape)
+            grid[tuple(slice(pad, None) for _ in shape)] = self._forward_grids[g]
+            splits = np.array(list(ways), dtype=np.intp)
+            owners = players[splits.argmax(axis=1)] if len(self._cards[g]) == 1 else players
+            steps.append((grid.ravel(), splits[:, :-1] @ strides, np.array(list(ways.values()), dtype=np.float64),
+                          owners))
+        return int((np.array(self._caps[:-1], dtype=np.intp) + pad) @ strides), steps
+
+
+def card_probabilities(info, hs_info, num_cards, remaining_hs):
+    """
+    Returns the NUM_PLAYERS x DECK_SIZE array of the probability that each player has each card,
+    counting every deal consistent with the tables as equally likely (see ProbabilityEngine)
+    """
+    return ProbabilityEngine(info, hs_info, num_cards, remaining_hs).probabilities
+
+
+def sample_deals(info, hs_info, num_cards, remaining_hs, num_samples, rng=None):
+    """
+    Returns a num_samples x DECK_SIZE array of deals drawn uniformly from the deals consistent
+    with the tables (see ProbabilityEngine.sample_deals)
+    """
+    return ProbabilityEngine(info, hs_info, num_cards, remaining_hs).sample_deals(num_samples, rng)
@@ -0,0 +1,325 @@
+import card_utils
+from constants import YES, NO, UNSURE, NUM_PLAYERS, DECK_SIZE, HS_SIZE
+from exceptions import InfoDictException
+from transposition import CELL_KEYS, HS_KEYS, COUNT_KEYS, REMAINING_KEYS, table_hash
+
+CARD_HS = card_utils.CARD_HS
+HS_CARDS = card_utils.HS_CARDS
+NUM_HS = len(card_utils.ALL_HALFSUITS)
+
+# Kinds of changes recorded on the trail
+CELL_ENTRY = 0
+HS_ENTRY = 1
+
+
+class Propagator:
+    """
+    Incremental constraint propagation for one info table.
+
+    The propagator deduces the same YES/NO entries as trying YES and NO for every
+    UNSURE entry and checking the four rules in Player._is_consistent, but it keeps
+    running counters instead of rescanning the table:
+
+    yes_count[card]: number of players with YES for the card
+    no_count[card]: number of players with NO for the card
+    no_total[player]: number of NO entries of the player
+    hs_no[player][hs]: number of NO entries of the player in the half suit
+
+    An UNSURE entry (player, card) can then be decided in constant time:
+    NO if another player has YES for the card (rule 1)
+    YES if every other player has NO for the card (rule 2)
+    YES if the player has no room left for another NO in the half suit (rule 3)
+    YES if the player has no room left for another NO at all (rule 4)
+
+    Whenever an entry changes, only the entries whose rules read the changed
+    counters are put on the worklist, and propagation stops when it is empty.
+
+    The propagator changes the info and hs_info tables it was built with in place.
+    Every change it makes is recorded on a trail (an undo log), so the tables can be
+    restored to an earlier checkpoint with rollback instead of being copied.
+    Changes to the num_cards table must be reported with touch_player.
+
+    If the propagator is made with a TranspositionCache, it keeps hash, the Zobrist
+    hash (see transposition.py) of the tables, up to date as entries change, and
+    propagate looks the hash up before deducing anything. A position that was already
+    propagated (by any propagator sharing the cache) is then resolved without checking
+    any rules. Without a cache, no hash is kept, so there is no hashing overhead.
+    A propagation_store.PropagationStore can be used as the cache instead, to share
+    results across runs and processes by the canonical form of the tables.
+    """
+
+    def __init__(self, info, hs_info, num_cards, remaining_hs, cache=None):
+        """
+        :param info: CardTable that is updated in place
+        :param hs_info: HalfSuitTable with the half suit minimums for info
+        :param num_cards: CardCounts of each player's number of cards
+        :param remaining_hs: list of the half suits that have not been called
+        :param cache: TranspositionCache or PropagationStore of propagation results, or None to always propagate
+        """
+        self.info = info
+        self.hs_info = hs_info
+        self.num_cards = num_cards
+        self.remaining_hs = remaining_hs
+        self.cache = cache
+        self._worklist = []
+        self._trail = []
+        self.resync()
+
+    def resync(self):
+        """
+        Recomputes the counters from the tables
+        Needed if the tables were changed without going through the propagator
+        """
+        self._cells = self.info.array.tolist()
+        self._hs = self.hs_info.array.tolist()
+        self._counts = self.num_cards.array.tolist()
+        self._remaining = [hs in self.remaining_hs for hs in card_utils.ALL_HALFSUITS]
+        self._yes_count = [0] * DECK_SIZE
+        self._no_count = [0] * DECK_SIZE
+        self._no_total = [0] * NUM_PLAYERS
+        self._hs_no = [[0] * NUM_HS for _ in range(NUM_PLAYERS)]
+        for ID, row in enumerate(self._cells):
+            for c, value in enumerate(row):
+                self._count(ID, c, value, 1)
+        self.hash = 0 if self.cache is None else table_hash(self._cells, self._hs, self._counts, self._remaining)
+
+    def _count(self, ID, c, value, step):
+        if value == YES:
+            self._yes_count[c] += step
+        elif value == NO:
+            self._no_count[c] += step
+            self._no_total[ID] += step
+            self._hs_no[ID][CARD_HS[c]] += step
+
+    def assign(self, ID, c, value):
+        """
+        Sets an entry of the info table and queues the entries that could be affected
+        :param ID: player id
+        :param c: card id
+        :param value: YES, NO, or UNSURE
+        """
+        old = self._cells[ID][c]
+        if old == value:
+            return
+        self._set(ID, c, old, value)
+
+    def set_half_suit(self, ID, h, count):
+        """
+        Sets the minimum number of cards a player has in a half suit
+        and queues the entries that could be affected
+        :param ID: player id
+        :param h: half suit id
+        :param count: new minimum
+        """
+        old = self._hs[ID][h]
+        if old == count:
+            return
+        self._trail.append((HS_ENTRY, ID, h, old))
+        self._hs[ID][h] = count
+        self.hs_info.array[ID, h] = count
+        if self.cache is not None:
+            self.hash ^= HS_KEYS[ID][h][old] ^ HS_KEYS[ID][h][count]
+        self.touch_player(ID)
+
+    def touch_player(self, ID):
+        """
+        Rereads a player's number of cards after it changed,
+        and queues the entries that could be affected
+        """
+        self._set_count(ID, self.num_cards[ID])
+        row = self._cells[ID]
+        if self._counts[ID] + self._no_total[ID] >= DECK_SIZE:
+            self._worklist.extend((ID, c) for c in range(DECK_SIZE) if row[c] == UNSURE)
+            return
+        for h in range(NUM_HS):
+            if self._hs[ID][h] + self._hs_no[ID][h] >= HS_SIZE:
+                self._worklist.extend((ID, c) for c in HS_CARDS[h] if row[c] == UNSURE)
+
+    def record_ask(self, ID_ask, ID_target, c, success):
+        """
+        Applies what an ask reveals to the info and half suit tables
+        The number of cards must already be updated. Call propagate afterwards
+        :param ID_ask: ID of player asking for the card
+        :param ID_target: player being asked
+        :param c: card id being asked
+        :param success: true if card was taken from ID_target
+        """
+        h = CARD_HS[c]
+        hs = self._hs
+        if success:
+            self.assign(ID_ask, c, YES)
+            self.assign(ID_target, c, NO)
+            # The asker had at least 1 card in the half suit, and now has 1 more
+            self.set_half_suit(ID_ask, h, max(hs[ID_ask][h], 1) + 1)
+            if hs[ID_target][h] > 0:
+                self.set_half_suit(ID_target, h, hs[ID_target][h] - 1)
+        else:
+            self.assign(ID_ask, c, NO)
+            self.assign(ID_target, c, NO)
+            self.set_half_suit(ID_ask, h, max(hs[ID_ask][h], 1))
+        self.touch_player(ID_ask)
+        self.touch_player(ID_target)
+
+    def record_call(self, h):
+        """
+        Applies a call of half suit h: nobody has its cards anymore
+        The number of cards and remaining half suits must already be updated. Call propagate afterwards
+        """
+        for ID in range(NUM_PLAYERS):
+            for c in HS_CARDS[h]:
+                self.assign(ID, c, NO)
+            self.set_half_suit(ID, h, 0)
+            self.touch_player(ID)
+
+    def checkpoint(self):
+        """
+        Returns a marker for the current state of the tables that rollback can return to
+        Should be called after propagate, when nothing is left on the worklist
+        """
+        return len(self._trail)
+
+    def rollback(self, marker):
+        """
+        Undoes every change made since checkpoint returned marker
+        The num_cards table and remaining half suits must already be restored when this is called
+        """
+        trail = self._trail
+        hashing = self.cache is not None
+        while len(trail) > marker:
+            kind, ID, index, old = trail.pop()
+            if kind == CELL_ENTRY:
+                value = self._cells[ID][index]
+                self._cells[ID][index] = old
+                self.info.array[ID, index] = old
+                self._count(ID, index, value, -1)
+                self._count(ID, index, old, 1)
+                if hashing:
+                    self.hash ^= CELL_KEYS[ID][index][value + 1] ^ CELL_KEYS[ID][index][old + 1]
+            else:
+                if hashing:
+                    self.hash ^= HS_KEYS[ID][index][self._hs[ID][index]] ^ HS_KEYS[ID][index][old]
+                self._hs[ID][index] = old
+                self.hs_info.array[ID, index] = old
+        counts = self.num_cards.array.tolist()
+        for ID in range(NUM_PLAYERS):
+            if counts[ID] != self._counts[ID]:
+                self._set_count(ID, counts[ID])
+        self._update_remaining()
+        self._worklist = []
+
+    def clear_trail(self):
+        """
+        Forgets the recorded changes. Earlier checkpoints can no longer be rolled back to
+        """
+        self._trail = []
+
+    def sweep(self, check_cards=card_utils.ALL_CARDS):
+        """
+        Resyncs the counters and propagates from every UNSURE entry of the cards in check_cards
+        :return: the number of entries that were resolved to YES or NO
+        """
+        self.resync()
+        check_ids = [card_utils.CARD_IDS[card] for card in check_cards]
+        for ID, row in enumerate(self._cells):
+            self._worklist.extend((ID, c) for c in check_ids if row[c] == UNSURE)
+        if len(check_ids) < DECK_SIZE:
+            # Only part of the table is checked, so the result is not the full propagation of the position
+            self._update_remaining()
+            return self._propagate()
+        return self.propagate()
+
+    def propagate(self):
+        """
+        Resolves entries until nothing more can be deduced
+        Raises InfoDictException if an UNSURE entry can be neither YES nor NO
+        :return: the number of entries that were resolved to YES or NO
+        """
+        self._update_remaining()
+        if self.cache is None or not self._worklist:
+            return self._propagate()
+        key, result = self.cache.lookup(self)
+        if result is None:
+            start = len(self._trail)
+            try:
+                resolved = self._propagate()
+            except InfoDictException as err:
+                self.cache.save(key, str(err))
+                raise
+            # Propagation only sets UNSURE entries, so the trail since start is exactly what it resolved
+            self.cache.save(key, tuple((ID, c, self._cells[ID][c]) for _, ID, c, _ in self._trail[start:]))
+            return resolved
+        self._worklist = []
+        if isinstance(result, str):
+            raise InfoDictException(result)
+        for ID, c, value in result:
+            self._write(ID, c, UNSURE, value)
+        return len(result)
+
+    def _update_remaining(self):
+        remaining = [hs in self.remaining_hs for hs in card_utils.ALL_HALFSUITS]
+        if self.cache is not None:
+            for h, is_remaining in enumerate(remaining):
+                if is_remaining != self._remaining[h]:
+                    self.hash ^= REMAINING_KEYS[h]
+        self._remaining = remaining
+
+    def _propagate(self):
+        cells = self._cells
+        worklist = self._worklist
+        resolved = 0
+        while worklist:
+            ID, c = worklist.pop()
+            if cells[ID][c] != UNSURE:
+                continue
+            value = self._deduce(ID, c)
+            if value != UNSURE:
+                self._set(ID, c, UNSURE, value)
+                resolved += 1
+        return resolved
+
+    def _deduce(self, ID, c):
+        """
+        Returns the value an UNSURE entry is forced to, or UNSURE if it is not forced
+        """
+        h = CARD_HS[c]
+        must_have = self._counts[ID] + self._no_total[ID] >= DECK_SIZE
+        if self._remaining[h]:
+            must_have = (must_have or self._no_count[c] == NUM_PLAYERS - 1
+                         or self._hs[ID][h] + self._hs_no[ID][h] >= HS_SIZE)
+        if self._yes_count[c]:
+            if must_have:
+                raise InfoDictException("Player {} must have {}, but another player has it".format(
+                    ID, card_utils.ALL_CARDS[c]))
+            return NO
+        if must_have:
+            return YES
+        return UNSURE
+
+    def _set_count(self, ID, count):
+        if self.cache is not None:
+            self.hash ^= COUNT_KEYS[ID][self._counts[ID]] ^ COUNT_KEYS[ID][count]
+        self._counts[ID] = count
+
+    def _write(self, ID, c, old, value):
+        self._trail.append((CELL_ENTRY, ID, c, old))
+        self._cells[ID][c] = value
+        self.info.array[ID, c] = value
+        self._count(ID, c, old, -1)
+        self._count(ID, c, value, 1)
+        if self.cache is not None:
+            self.hash ^= CELL_KEYS[ID][c][old + 1] ^ CELL_KEYS[ID][c][value + 1]
+
+    def _set(self, ID, c, old, value):
+        self._write(ID, c, old, value)
+        worklist = self._worklist
+        cells = self._cells
+        if value == YES:
+            worklist.extend((other, c) for other in range(NUM_PLAYERS) if cells[other][c] == UNSURE)
+        elif value == NO:
+            h = CARD_HS[c]
+            if self._no_count[c] == NUM_PLAYERS - 1:
+                worklist.extend((other, c) for other in range(NUM_PLAYERS) if cells[other][c] == UNSURE)
+            if self._counts[ID] + self._no_total[ID] >= DECK_SIZE:
+                worklist.extend((ID, other) for other in range(DECK_SIZE) if cells[ID][other] == UNSURE)
+            elif self._hs[ID][h] + self._hs_no[ID][h] >= HS_SIZE:
+                worklist.extend((ID, other) for other in HS_CARDS[h] if cells[ID][other] == UNSURE)
@@ -0,0 +1,120 @@
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+from constants import NUM_PLAYERS, DECK_SIZE, UNSURE
+from symmetry import canonicalize
+
+# Status of a slot of the store
+EMPTY = 0
+PROPAGATED = 1
+CONTRADICTION = 2
+
+SLOT_DTYPE = np.dtype([("key", "V16"), ("status", np.int8), ("cells", np.int8, (NUM_PLAYERS, DECK_SIZE))])
+# The store stops taking new results when this fraction of its slots is used, so lookups stay short
+MAX_LOAD = 0.7
+
+
+class PropagationStore:
+    """
+    A persistent key-value store of canonical knowledge state -> propagated info table
+
+    The store is an open addressing hash table in a .npy file opened with numpy's memmap.
+    The key of a slot is CanonicalState.key of the tables before propagating, and the value is
+    the info table after propagating (in the canonical labels), or a mark that propagating
+    raised InfoDictException. Since every suit relabeling and seat rotation of a state has the
+    same canonical form, one stored result answers all of them.
+
+    The file outlives the process, so propagation work done in one run is reused by later runs.
+    Any number of processes can open it with readonly=True and share the same pages,
+    but only one process at a time may open it for writing.
+
+    A store can be passed as the cache of a Propagator (see Propagator.propagate), like a
+    TranspositionCache. Canonicalizing a state costs more than a small incremental
+    propagation, so the store pays off for expensive propagations such as sweeps and
+    exact deductions, not for every ask.
+    """
+
+    def __init__(self, path, capacity=1 << 16, readonly=False):
+        """
+        :param path: .npy file of the store. It is made if it does not exist
+        :param capacity: number of slots, rounded up to a power of 2. Ignored if the file exists
+        :param readonly: If True, the file is only read and save does nothing
+        """
+        self.path = path
+        self.readonly = readonly
+        if os.path.exists(path):
+            self.slots = open_memmap(path, mode="r" if readonly else "r+")
+            if self.slots.dtype != SLOT_DTYPE:
+                raise ValueError("{} is not a propagation store".format(path))
+        elif readonly:
+            raise FileNotFoundError(path)
+        else:
+            capacity = 1 << max(capacity - 1, 1).bit_length()
+            self.slots = open_memmap(path, mode="w+", dtype=SLOT_DTYPE, shape=(capacity,))
+        self.capacity = len(self.slots)
+        self._size = int(np.count_nonzero(self.slots["status"]))
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self._size
+
+    def _find(self, key):
+        """
+        Returns the index of the slot holding key, or of the empty slot where it would go
+        """
+        index = int.from_bytes(key[:8], "little") & (self.capacity - 1)
+        while True:
+            slot = self.slots[index]
+            if slot["status"] == EMPTY or slot["key"].tobytes() == key:
+                return index
+            index = (index + 1) & (self.capacity - 1)
+
+    def lookup(self, engine):
+        """
+        Looks up the propagation of a Propagator's current tables
+        :return: (key, result), where result is a tuple of (player, card, value) entries that propagating sets,
+        a message if propagating raises InfoDictException, or None if the state is not in the store.
+        key is passed to save with the result of propagating
+        """
+        state = canonicalize(engine.info, engine.hs_info, engine.num_cards, engine.remaining_hs)
+        slot = self.slots[self._find(state.key)]
+        if slot["status"] == EMPTY:
+            self.misses += 1
+            return state, None
+        self.hits += 1
+        if slot["status"] == CONTRADICTION:
+            return state, "No assignment of the cards agrees with the tables (from the propagation store)"
+        before = engine.info.array
+        after = state.from_canonical(slot["cells"])
+        return state, tuple((ID, c, int(after[ID, c])) for ID, c in zip(*np.nonzero(after != before)))
+
+    def save(self, state, result):
+        """
+        Stores the result of propagating the state a lookup returned the key of
+        :param state: key returned by lookup
+        :param result: tuple of (player, card, value) entries set by propagating, or the message of the exception
+        """
+        if self.readonly or self._size + 1 > MAX_LOAD * self.capacity:
+            return
+        index = self._find(state.key)
+        if self.slots[index]["status"] != EMPTY:
+            return
+        slot = np.zeros((), dtype=SLOT_DTYPE)
+        slot["key"] = np.void(state.key)
+        if isinstance(result, str):
+            slot["status"] = CONTRADICTION
+        else:
+            slot["status"] = PROPAGATED
+            canonical = np.frombuffer(state.data, dtype=np.int8, count=NUM_PLAYERS * DECK_SIZE)
+            cells = state.from_canonical(canonical.reshape(NUM_PLAYERS, DECK_SIZE)).copy()
+            for ID, c, value in result:
+                if cells[ID, c] == UNSURE:
+                    cells[ID, c] = value
+            slot["cells"] = state.to_canonical(cells)
+        self.slots[index] = slot
+        self._size += 1
+
+    def flush(self):
+        if not self.readonly:
+            self.slots.flush()
@@ -0,0 +1,258 @@
+import card_utils
+from constants import UNSURE, NUM_PLAYERS
+from exceptions import InfoDictException
+from feasibility import FeasibilityChecker
+from instrumentation import make_propagator
+from tables import CardTable, HalfSuitTable, CardCounts
+
+# Kinds of changes recorded on the trail
+NUM_CARDS_ENTRY = 0
+REMAINING_HS_ENTRY = 1
+
+# Kinds of queued events
+ASK_EVENT = 0
+CALL_EVENT = 1
+
+
+class PublicKnowledge:
+    """
+    The information about a Fish game that every player has:
+
+    public_info: what everyone knows about each player's cards, structured like Player.info
+    public_hs_info: what everyone knows about each player's half suits, structured like Player.hs_info
+    num_cards: the number of cards each player has
+    remaining_hs: the half suits that have not been called
+
+    This is the same for all players, so a FishGame keeps one PublicKnowledge and every
+    Player holds a reference to it. The game reports each ask and call here once,
+    instead of each of the NUM_PLAYERS players repeating the same propagation.
+    A Player made on its own creates its own PublicKnowledge.
+
+    num_cards and remaining_hs are updated as soon as an event is reported. The
+    table updates are queued and propagated together the next time the public
+    tables are read.
+    """
+
+    def __init__(self, num_cards, public_info, public_hs_info, remaining_hs, exact=False, stats=None, cache=None):
+        """
+        :param num_cards: dictionary or CardCounts of each player's number of cards
+        :param public_info: public info dictionary or CardTable
+        :param public_hs_info: public half suit info dictionary or HalfSuitTable
+        :param remaining_hs: list of the half suits that have not been called
+        :param exact: If True, every update also runs the exact flow based deduction
+        :param stats: KnowledgeStats that the propagation work is counted in, or None to not count it
+        :param cache: TranspositionCache of propagation results, or None to not cache them
+        """
+        self.exact = exact
+        self.stats = stats
+        self.cache = cache
+        self._trail = []
+        self._pending = []
+        self._tables_changed = False
+        self.num_cards = num_cards
+        self.public_info = public_info
+        self.public_hs_info = public_hs_info
+        self.remaining_hs = remaining_hs
+
+    @classmethod
+    def start_of_game(cls, num_cards=None, exact=False, stats=None, cache=None):
+        """
+        Returns the public knowledge at the start of a game: nothing is known except how many cards each player has
+        :param num_cards: dictionary of each player's number of cards, 9 each if None
+        """
+        if num_cards is None:
+            num_cards = {ID: 9 for ID in range(NUM_PLAYERS)}
+        public_info = CardTable()
+        public_info.array[:] = UNSURE
+        return cls(num_cards, public_info, HalfSuitTable(), list(card_utils.gen_all_halfsuits()), exact=exact,
+                   stats=stats, cache=cache)
+
+    @property
+    def num_cards(self):
+        return self._num_cards
+
+    @num_cards.setter
+    def num_cards(self, num_cards):
+        self._num_cards = CardCounts.coerce(num_cards)
+        self._engine = None
+
+    @property
+    def public_info(self):
+        self.flush()
+        return self._public_info
+
+    @public_info.setter
+    def public_info(self, public_info):
+        self._public_info = CardTable.coerce(public_info)
+        self._public_info.on_change = self._table_changed
+        self._engine = None
+
+    @property
+    def public_hs_info(self):
+        self.flush()
+        return self._public_hs_info
+
+    @public_hs_info.setter
+    def public_hs_info(self, public_hs_info):
+        self._public_hs_info = HalfSuitTable.coerce(public_hs_info)
+        self._public_hs_info.on_change = self._table_changed
+        self._engine = None
+
+    @property
+    def remaining_hs(self):
+        return self._remaining_hs
+
+    @remaining_hs.setter
+    def remaining_hs(self, remaining_hs):
+        self._remaining_hs = remaining_hs
+        self._engine = None
+
+    def engine(self):
+        """
+        Returns the propagator for the public info table, with every queued event applied
+        """
+        self.flush(sweep=self._tables_changed)
+        return self._engine
+
+    def _table_changed(self):
+        """
+        Called when a public table is written through its dictionary view
+        The next flush recomputes the propagator's counters and propagates the whole table
+        """
+        self._tables_changed = True
+
+    def update(self, check_cards=card_utils.ALL_CARDS):
+        """
+        Propagates the public info table in place, starting from every UNSURE entry of check_cards
+        """
+        engine = self.engine()
+        engine.sweep(check_cards)
+        if self.exact:
+            deduce_exact(engine)
+
+    def flush(self, sweep=False):
+        """
+        Applies the queued asks and calls to the public tables and propagates them
+        If a table was replaced since the last flush, the propagator is rebuilt
+        and the whole table is propagated. If a table was written through its view,
+        the whole table is propagated with the next queued events
+        :param sweep: If True, propagates the whole table even if no events are queued
+        """
+        if self._engine is None:
+            self._engine = make_propagator(self._public_info, self._public_hs_info, self.num_cards,
+                                           self.remaining_hs, self.stats, self.cache)
+            sweep = True
+        elif not self._pending and not sweep:
+            return
+        elif self._tables_changed:
+            self._engine.resync()
+            sweep = True
+        self._tables_changed = False
+        pending, self._pending = self._pending, []
+        if self.stats is not None:
+            self.stats.flushes += 1
+            self.stats.events += len(pending)
+        apply_events(self._engine, pending, self.exact, sweep)
+
+    def update_transaction(self, ID_ask, ID_target, card, success):
+        """
+        Given a transaction, updates the number of cards, public info and public half suit info
+
+        :param ID_ask: ID of player asking for the card
+        :param ID_target: player being asked
+        :param card: card being asked
+        :param success: true if card was taken from ID_target
+        """
+        if success:
+            self._set_num_cards(ID_ask, self.num_cards[ID_ask] + 1)
+            self._set_num_cards(ID_target, self.num_cards[ID_target] - 1)
+        self._pending.append((ASK_EVENT, ID_ask, ID_target, card_utils.CARD_IDS[card], success))
+
+    def update_call(self, hs, card_count_hs):
+        """
+        Given a half suit being called, updates the remaining half suits, number of cards and public info
+
+        hs: the half suit being called
+        card_count_hs: the number of cards that each player had in the half suit
+        This is a dictionary of {Player ID: num_cards}
+        """
+        self._trail.append((REMAINING_HS_ENTRY, self.remaining_hs.index(hs), hs))
+        self.remaining_hs.remove(hs)
+        for ID in range(NUM_PLAYERS):
+            self._set_num_cards(ID, self.num_cards[ID] - card_count_hs[ID])
+        self._pending.append((CALL_EVENT, card_utils.HS_IDS[hs]))
+
+    def _set_num_cards(self, ID, count):
+        self._trail.append((NUM_CARDS_ENTRY, ID, self.num_cards[ID]))
+        self.num_cards[ID] = count
+
+    def checkpoint(self):
+        """
+        Returns a marker that rollback can restore the public knowledge to
+        """
+        self.flush()
+        return len(self._trail), self.engine().checkpoint()
+
+    def rollback(self, marker):
+        """
+        Restores the public knowledge to a marker returned by checkpoint
+        Events queued since the checkpoint are dropped instead of being propagated
+        """
+        own_marker, engine_marker = marker
+        self._pending = []
+        while len(self._trail) > own_marker:
+            entry = self._trail.pop()
+            if entry[0] == NUM_CARDS_ENTRY:
+                self.num_cards[entry[1]] = entry[2]
+            else:
+                self.remaining_hs.insert(entry[1], entry[2])
+        self.engine().rollback(engine_marker)
+
+    def clear_trail(self):
+        """
+        Forgets the recorded updates, so earlier checkpoints can no longer be rolled back to
+        """
+        self.flush()
+        self._trail = []
+        self._engine.clear_trail()
+
+
+def apply_events(engine, events, exact, sweep=False):
+    """
+    Applies a batch of queued asks and calls to a propagator's tables,
+    then propagates once for all of them
+
+    Applying the events first and propagating afterwards reaches the same
+    tables as propagating after every event: an event never weakens a rule
+    that an earlier deduction relied on, because every card or half suit
+    minimum a player loses comes with a new NO entry for that player.
+    :param engine: Propagator
+    :param events: list of (ASK_EVENT, ID_ask, ID_target, card id, success) and (CALL_EVENT, half suit id)
+    :param exact: If True, also runs the exact deduction
+    :param sweep: If True, propagates from every UNSURE entry instead of only the changed ones
+    """
+    for event in events:
+        if event[0] == ASK_EVENT:
+            engine.record_ask(*event[1:])
+        else:
+            engine.record_call(event[1])
+    if sweep:
+        engine.sweep()
+    else:
+        engine.propagate()
+    if exact:
+        deduce_exact(engine)
+
+
+def deduce_exact(engine):
+    """
+    Sets every UNSURE entry that has the same value in all card assignments that
+    agree with the engine's tables, using the flow model in feasibility.py
+    Raises InfoDictException if no assignment agrees with the tables
+    """
+    checker = FeasibilityChecker(engine.info, engine.hs_info, engine.num_cards, engine.remaining_hs)
+    if not checker.feasible:
+        raise InfoDictException("No assignment of the cards agrees with the tables")
+    for ID, c, value in checker.forced_cells():
+        engine.assign(ID, c, value)
+    engine.propagate()
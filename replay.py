@@ -0,0 +1,114 @@
+from collections import namedtuple
+from multiprocessing import Pool
+import numpy as np
+import card_utils
+import encoding
+from constants import NUM_PLAYERS, SIZE_STATES
+from player import Player
+from public_knowledge import PublicKnowledge
+from transaction import Call, read_transcripts
+
+# The transitions of one replayed game, as arrays that can go straight into ReplayMemory.add_batch
+# seats is the ID of the player each transition belongs to
+Transitions = namedtuple("Transitions", ["states", "actions", "rewards", "dones", "seats"])
+
+
+def replay_game(transcript, seats=range(NUM_PLAYERS), reward=encoding.generate_reward_ask):
+    """
+    Replays a recorded game through the knowledge model of the chosen players, without asking any policy for moves
+    Only the players in seats are tracked, so replaying for one seat is much cheaper than for all of them
+
+    Each ask made by a player in seats gives one transition: the state of the asker just before the ask
+    (as generate_state_vector makes it), the action number, the reward of the ask and whether it was
+    that player's last ask of the game
+    :param transcript: transaction.GameTranscript
+    :param seats: IDs of the players whose asks are turned into transitions
+    :param reward: function from the success of an ask to its reward
+    :return: Transitions
+    """
+    seats = sorted(set(seats))
+    deal = transcript.deal
+    hands = [set(cards) for cards in deal.player_cards]
+    public = PublicKnowledge.start_of_game({ID: len(hands[ID]) for ID in range(NUM_PLAYERS)})
+    players = {ID: Player.player_start_of_game(ID, deal.player_cards[ID], public=public) for ID in seats}
+    asks = [event for event in transcript.events if not isinstance(event, Call) and event.ID_ask in players]
+    states = np.empty((len(asks), SIZE_STATES), dtype=np.int8)
+    actions = np.empty(len(asks), dtype=np.int16)
+    rewards = np.empty(len(asks), dtype=np.float32)
+    dones = np.zeros(len(asks), dtype=np.bool_)
+    last_ask = {}
+    i = 0
+    for event in transcript.events:
+        if isinstance(event, Call):
+            card_count_hs = {ID: 0 for ID in range(NUM_PLAYERS)}
+            for card in card_utils.find_cards(event.hs):
+                for ID in range(NUM_PLAYERS):
+                    if card in hands[ID]:
+                        hands[ID].remove(card)
+                        card_count_hs[ID] += 1
+            public.update_call(event.hs, card_count_hs)
+            for player in players.values():
+                player.update_call(event.hs, card_count_hs)
+            continue
+        ID_ask, ID_target, card, success = event
+        player = players.get(ID_ask)
+        if player is not None:
+            encoding.generate_state_vector(player.info, player.hs_info, player.num_cards, player.public_info,
+                                           ID_ask, out=states[i])
+            actions[i] = encoding.generate_action_number(ID_ask, ID_target, card)
+            rewards[i] = reward(success)
+            last_ask[ID_ask] = i
+            i += 1
+        if success:
+            hands[ID_target].remove(card)
+            hands[ID_ask].add(card)
+        public.update_transaction(ID_ask, ID_target, card, success)
+        for player in players.values():
+            player.update_transaction(ID_ask, ID_target, card, success)
+    dones[list(last_ask.values())] = True
+    return Transitions(states, actions, rewards, dones, np.array([ask.ID_ask for ask in asks], dtype=np.int8))
+
+
+def _replay_game(args):
+    return replay_game(*args)
+
+
+def replay_transcripts(files, seats=range(NUM_PLAYERS), reward=encoding.generate_reward_ask, processes=None,
+                       chunksize=16):
+    """
+    Generator that replays every game of some transcript files across a pool of processes
+    The files are read as a stream and the Transitions of each game are returned in the order of the files
+    :param files: list of transcript paths (or one path)
+    :param seats: IDs of the players whose asks are turned into transitions
+    :param reward: function from the success of an ask to its reward. It is sent to the workers,
+    so it must be a module level function
+    :param processes: number of worker processes, the number of CPUs if None.
+    If 1, the games are replayed in this process
+    :param chunksize: number of games sent to a worker at a time
+    """
+    if isinstance(files, str):
+        files = [files]
+    seats = tuple(seats)
+    tasks = ((transcript, seats, reward) for path in files for transcript in read_transcripts(path))
+    if processes == 1:
+        for task in tasks:
+            yield _replay_game(task)
+        return
+    with Pool(processes) as pool:
+        for transitions in pool.imap(_replay_game, tasks, chunksize):
+            yield transitions
+
+
+def fill_memory(memory, transitions):
+    """
+    Adds the Transitions of replayed games to a ReplayMemory
+    :param memory: ReplayMemory
+    :param transitions: iterable of Transitions, such as replay_transcripts(...)
+    :return: number of transitions added
+    """
+    total = 0
+    for game in transitions:
+        if len(game.actions):
+            memory.add_batch(game.states, game.actions, game.rewards, game.dones)
+            total += len(game.actions)
+    return total
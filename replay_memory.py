@@ -0,0 +1,136 @@
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+import constants
+
+# Files a persistent replay memory is stored in, inside its directory
+MEMORY_FILES = {
+    "states": "states.npy",
+    "actions": "actions.npy",
+    "rewards": "rewards.npy",
+    "dones": "dones.npy",
+    "meta": "meta.npy",
+}
+
+
+class ReplayMemory:
+    """
+    A fixed capacity ring buffer of transitions (state, action, reward, done)
+    Once the buffer is full, each new transition overwrites the oldest one
+
+    states: capacity x SIZE_STATES int8 array of state vectors
+    actions: int16 array of action numbers
+    rewards: float32 array of rewards
+    dones: bool array of whether the game finished after the transition
+
+    If a path is given, the arrays are .npy files in that directory, opened with
+    numpy's memmap. The memory then outlives the process: opening the same path
+    again continues where it left off, and a trainer in another process can read
+    the files with np.load(..., mmap_mode="r") while self-play keeps adding to them.
+    """
+
+    def __init__(self, capacity=constants.REPLAY_MEMORY_SIZE, state_size=constants.SIZE_STATES, path=None):
+        """
+        :param capacity: the most transitions the memory holds
+        :param state_size: length of a state vector
+        :param path: directory for the memory mapped files. If None, the memory is kept in RAM
+        If the directory already has a memory in it, it is reopened (capacity and state_size must match)
+        """
+        self.capacity = capacity
+        self.path = path
+        shapes = {
+            "states": ((capacity, state_size), np.int8),
+            "actions": ((capacity,), np.int16),
+            "rewards": ((capacity,), np.float32),
+            "dones": ((capacity,), np.bool_),
+            # Number of transitions ever added
+            "meta": ((1,), np.int64),
+        }
+        if path is None:
+            arrays = {name: np.zeros(shape, dtype=dtype) for name, (shape, dtype) in shapes.items()}
+        else:
+            os.makedirs(path, exist_ok=True)
+            arrays = {name: self._open(os.path.join(path, MEMORY_FILES[name]), shape, dtype)
+                      for name, (shape, dtype) in shapes.items()}
+        self.states = arrays["states"]
+        self.actions = arrays["actions"]
+        self.rewards = arrays["rewards"]
+        self.dones = arrays["dones"]
+        self._meta = arrays["meta"]
+
+    @staticmethod
+    def _open(filename, shape, dtype):
+        if os.path.exists(filename):
+            array = open_memmap(filename, mode="r+")
+            if array.shape != shape or array.dtype != dtype:
+                raise ValueError("{} holds a {} {} array, not {} {}".format(
+                    filename, array.shape, array.dtype, shape, np.dtype(dtype)))
+            return array
+        return open_memmap(filename, mode="w+", shape=shape, dtype=dtype)
+
+    @property
+    def total_added(self):
+        """
+        Number of transitions added since the memory was created, including overwritten ones
+        """
+        return int(self._meta[0])
+
+    @property
+    def position(self):
+        """
+        Index the next transition is written to
+        """
+        return self.total_added % self.capacity
+
+    def __len__(self):
+        return min(self.total_added, self.capacity)
+
+    def add(self, state, action, reward, done):
+        """
+        Adds a transition, overwriting the oldest one if the memory is full
+        :return: the index the transition was written to
+        """
+        index = self.position
+        self.states[index] = state
+        self.actions[index] = action
+        self.rewards[index] = reward
+        self.dones[index] = done
+        self._meta[0] += 1
+        return index
+
+    def add_batch(self, states, actions, rewards, dones):
+        """
+        Adds many transitions at once, in order
+        """
+        count = len(actions)
+        if count > self.capacity:
+            states, actions, rewards, dones = (a[count - self.capacity:] for a in (states, actions, rewards, dones))
+            self._meta[0] += count - self.capacity
+            count = self.capacity
+        indices = (self.position + np.arange(count)) % self.capacity
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.dones[indices] = dones
+        self._meta[0] += count
+
+    def sample(self, batch_size, rng=None):
+        """
+        Returns batch_size transitions chosen uniformly at random (with replacement)
+        :param rng: numpy Generator. A new one is made if None
+        :return: states, actions, rewards, dones arrays
+        """
+        if not len(self):
+            raise ValueError("Cannot sample from an empty replay memory")
+        if rng is None:
+            rng = np.random.default_rng()
+        indices = rng.integers(0, len(self), batch_size)
+        return self.states[indices], self.actions[indices], self.rewards[indices], self.dones[indices]
+
+    def flush(self):
+        """
+        Writes the memory mapped arrays to disk
+        """
+        if self.path is not None:
+            for array in (self.states, self.actions, self.rewards, self.dones, self._meta):
+                array.flush()
@@ -0,0 +1,82 @@
+import random
+from collections import namedtuple
+from multiprocessing import Pool
+import numpy as np
+from game import FishGame
+
+# The result of one self-play game
+GameResult = namedtuple("GameResult", ["seed", "team0_score", "team1_score", "turns", "timed_out"])
+
+
+def game_seeds(seed, num_games):
+    """
+    Returns num_games independent seeds derived from one seed
+    The same seed always gives the same list, so a whole run can be repeated
+    """
+    return [int(s) for s in np.random.SeedSequence(seed).generate_state(num_games, dtype=np.uint64)]
+
+
+def play_game(seed, max_turns=1000):
+    """
+    Plays one game of Fish where every random choice comes from a random.Random seeded with seed
+    Playing the same seed again replays the same game
+    :return: GameResult
+    """
+    game = FishGame.start_random_game(rng=random.Random(seed))
+    timed_out = game.run_whole_game(max_turns=max_turns)
+    return GameResult(seed, game.team0_score, game.team1_score, game.turns, timed_out)
+
+
+def _play_game(args):
+    return play_game(*args)
+
+
+def run_self_play(num_games, seed=0, processes=None, max_turns=1000, chunksize=8):
+    """
+    Generator that plays num_games games across a pool of processes
+    and returns each GameResult as soon as its game finishes (not in seed order)
+    :param num_games: number of games to play
+    :param seed: seed the per game seeds are derived from
+    :param processes: number of worker processes, the number of CPUs if None.
+    If 1, the games are played in this process
+    :param max_turns: longest a game can go on before it is forced to end
+    :param chunksize: number of games sent to a worker at a time
+    """
+    tasks = [(game_seed, max_turns) for game_seed in game_seeds(seed, num_games)]
+    if processes == 1:
+        for task in tasks:
+            yield _play_game(task)
+        return
+    with Pool(processes) as pool:
+        for result in pool.imap_unordered(_play_game, tasks, chunksize):
+            yield result
+
+
+def summarize(results):
+    """
+    Aggregates GameResults into a dictionary of totals and averages
+    """
+    summary = {"games": 0, "team0_wins": 0, "team1_wins": 0, "ties": 0, "timeouts": 0,
+               "team0_score": 0, "team1_score": 0, "turns": 0}
+    for result in results:
+        summary["games"] += 1
+        if result.team0_score > result.team1_score:
+            summary["team0_wins"] += 1
+        elif result.team1_score > result.team0_score:
+            summary["team1_wins"] += 1
+        else:
+            summary["ties"] += 1
+        summary["timeouts"] += result.timed_out
+        summary["team0_score"] += result.team0_score
+        summary["team1_score"] += result.team1_score
+        summary["turns"] += result.turns
+    games = max(summary["games"], 1)
+    for key in ("team0_score", "team1_score", "turns"):
+        summary["mean_" + key] = summary.pop(key) / games
+    return summary
+
+
+if __name__ == "__main__":
+    import sys
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    print(summarize(run_self_play(num_games)))
@@ -0,0 +1,108 @@
+import hashlib
+from itertools import permutations
+import numpy as np
+import card_utils
+from constants import NUM_PLAYERS, DECK_SIZE
+from tables import CardTable, HalfSuitTable, CardCounts
+
+SUITS = tuple(card_utils.gen_all_suits())
+NUM_HS = len(card_utils.ALL_HALFSUITS)
+
+
+def _suit_permutation_cards(suit_order):
+    """
+    Returns the card ids that each card is relabeled from when suit SUITS[i] becomes suit_order[i]
+    The 8s move with their suits, and the jokers stay where they are
+    """
+    relabel = dict(zip(SUITS, suit_order))
+    names = []
+    for card in card_utils.ALL_CARDS:
+        if card in ["SJ", "BJ"]:
+            names.append(card)
+        else:
+            names.append(card[0] + relabel[card[1]])
+    return [card_utils.CARD_IDS[card] for card in names]
+
+
+# CARD_PERMUTATIONS[k][c]: the card that card c of the canonical table is read from, for the k-th suit relabeling
+CARD_PERMUTATIONS = np.array([_suit_permutation_cards(order) for order in permutations(SUITS)], dtype=np.intp)
+# HS_PERMUTATIONS[k][h]: the same for half suits
+HS_PERMUTATIONS = np.array([[card_utils.CARD_HS[perm[card_utils.HS_CARDS[h][0]]]
+                             for h in range(NUM_HS)] for perm in CARD_PERMUTATIONS],
+                           dtype=np.intp)
+# SEAT_PERMUTATIONS[r][ID]: the player that seat ID of the canonical table is read from, for a rotation by r seats
+SEAT_PERMUTATIONS = np.array([[(ID + r) % NUM_PLAYERS for ID in range(NUM_PLAYERS)] for r in range(NUM_PLAYERS)],
+                             dtype=np.intp)
+NUM_RELABELINGS = NUM_PLAYERS * len(CARD_PERMUTATIONS)
+
+
+def _relabeling_index():
+    """
+    Returns the NUM_RELABELINGS x STATE_SIZE array of where each entry of a relabeled state is read from
+    in the unrelabeled state. Relabeling r is seat rotation r // 24 and suit relabeling r % 24.
+    A state is its info cells, half suit minimums, numbers of cards and remaining half suits, flattened
+    """
+    cells = (SEAT_PERMUTATIONS[:, None, :, None] * DECK_SIZE + CARD_PERMUTATIONS[None, :, None, :])
+    hs = (SEAT_PERMUTATIONS[:, None, :, None] * NUM_HS + HS_PERMUTATIONS[None, :, None, :])
+    counts = np.broadcast_to(SEAT_PERMUTATIONS[:, None, :], (NUM_PLAYERS, len(CARD_PERMUTATIONS), NUM_PLAYERS))
+    remaining = np.broadcast_to(HS_PERMUTATIONS[None], (NUM_PLAYERS, len(HS_PERMUTATIONS), NUM_HS))
+    offsets = np.cumsum([0, NUM_PLAYERS * DECK_SIZE, NUM_PLAYERS * NUM_HS, NUM_PLAYERS])
+    return np.concatenate([part.reshape(NUM_RELABELINGS, -1) + offset
+                           for part, offset in zip((cells, hs, counts, remaining), offsets)], axis=1)
+
+
+RELABELING_INDEX = _relabeling_index()
+
+
+class CanonicalState:
+    """
+    The canonical form of a knowledge state (info, hs_info, num_cards, remaining_hs)
+
+    Relabeling the suits (the 8s move with their suits) or rotating the seats gives a state that
+    propagates the same way: only the labels of the players and cards change. All the
+    NUM_PLAYERS * 24 relabelings of a state have the same canonical form, the one whose
+    tables are smallest as bytes.
+
+    data: bytes of the canonical tables
+    key: 16 byte digest of data
+    seats: seats[ID] is the player that seat ID of the canonical tables is
+    cards: cards[c] is the card that card c of the canonical tables is
+    """
+
+    def __init__(self, data, seats, cards):
+        self.data = data
+        self.key = hashlib.blake2b(data, digest_size=16).digest()
+        self.seats = seats
+        self.cards = cards
+
+    def to_canonical(self, cells):
+        """
+        Relabels a NUM_PLAYERS x DECK_SIZE array of the original state into the canonical labels
+        """
+        return cells[np.ix_(self.seats, self.cards)]
+
+    def from_canonical(self, cells):
+        """
+        Relabels a NUM_PLAYERS x DECK_SIZE array in the canonical labels back into the original ones
+        """
+        original = np.empty_like(cells)
+        original[np.ix_(self.seats, self.cards)] = cells
+        return original
+
+
+def canonicalize(info, hs_info, num_cards, remaining_hs):
+    """
+    Returns the CanonicalState of a knowledge state, such as a Player's
+    (player.info, player.hs_info, player.num_cards, player.remaining_hs)
+    :param info: CardTable or info dictionary
+    :param hs_info: HalfSuitTable or half suit info dictionary
+    :param num_cards: CardCounts or dictionary of each player's number of cards
+    :param remaining_hs: list of the half suits that have not been called
+    """
+    remaining = [hs in remaining_hs for hs in card_utils.ALL_HALFSUITS]
+    state = np.concatenate([CardTable.coerce(info).array.ravel(), HalfSuitTable.coerce(hs_info).array.ravel(),
+                            CardCounts.coerce(num_cards).array, np.array(remaining, dtype=np.int8)]).astype(np.int8)
+    rows = [row.tobytes() for row in state.take(RELABELING_INDEX)]
+    best = min(range(NUM_RELABELINGS), key=rows.__getitem__)
+    rotation, relabeling = divmod(best, len(CARD_PERMUTATIONS))
+    return CanonicalState(rows[best], SEAT_PERMUTATIONS[rotation], CARD_PERMUTATIONS[relabeling])
@@ -0,0 +1,245 @@
+import numpy as np
+import card_utils
+from constants import NUM_PLAYERS
+
+# CARD_HS_MATRIX[c, h] is 1 if card c is in half suit h
+CARD_HS_MATRIX = np.zeros((len(card_utils.ALL_CARDS), len(card_utils.ALL_HALFSUITS)), dtype=np.int64)
+for _c, _h in enumerate(card_utils.CARD_HS):
+    CARD_HS_MATRIX[_c, _h] = 1
+CARD_HS_INDEX = np.array(card_utils.CARD_HS, dtype=np.intp)
+
+
+class TableRow:
+    """
+    A dictionary style view of one row of a table
+    row[key] reads and writes the underlying numpy array, so changes
+    made through the view are seen by the table and vice versa
+    """
+
+    def __init__(self, row, keys, key_index, table=None):
+        """
+        :param row: 1D numpy array (a view into the table's array)
+        :param keys: tuple of keys, in the same order as the row
+        :param key_index: dictionary of {key: index in row}
+        :param table: PlayerTable the row belongs to, told about writes made through the view
+        """
+        self._row = row
+        self._keys = keys
+        self._key_index = key_index
+        self._table = table
+
+    def __getitem__(self, key):
+        return self._row.item(self._key_index[key])
+
+    def __setitem__(self, key, value):
+        self._row[self._key_index[key]] = value
+        if self._table is not None:
+            self._table.changed()
+
+    def __contains__(self, key):
+        return key in self._key_index
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        return self._keys
+
+    def values(self):
+        return self._row.tolist()
+
+    def items(self):
+        return zip(self._keys, self._row.tolist())
+
+    def copy(self):
+        """
+        Returns the row as a regular dictionary
+        """
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, TableRow):
+            return self._keys == other._keys and np.array_equal(self._row, other._row)
+        try:
+            return len(other) == len(self._keys) and all(other[k] == v for k, v in self.items())
+        except (KeyError, TypeError):
+            return NotImplemented
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class PlayerTable:
+    """
+    A table with one row for each player, backed by a 2D int8 numpy array
+    table[ID][key] behaves like the nested dictionaries the Player class used to store
+    Subclasses define the keys of each row
+
+    on_change is called (with no arguments) after every write made through table[ID] or table[ID][key],
+    so the owner of the table (a Player or PublicKnowledge) knows its propagator is out of date.
+    Writes to array itself are not reported, which is how the propagator changes the table.
+    """
+    keys_per_row = ()
+    key_index = {}
+
+    def __init__(self, array=None):
+        """
+        :param array: NUM_PLAYERS x len(keys_per_row) numpy array. If None, the table is all zeros
+        """
+        if array is None:
+            array = np.zeros((NUM_PLAYERS, len(self.keys_per_row)), dtype=np.int8)
+        self.array = array
+        self.on_change = None
+
+    @classmethod
+    def from_dict(cls, d):
+        """
+        Builds a table from a dictionary of {player id: {key: value}}
+        """
+        table = cls()
+        for ID, row in d.items():
+            for key, value in row.items():
+                table.array[ID, cls.key_index[key]] = value
+        return table
+
+    @classmethod
+    def coerce(cls, table):
+        """
+        Returns table if it is already this kind of table, otherwise converts it from a dictionary
+        """
+        if isinstance(table, cls):
+            return table
+        return cls.from_dict(table)
+
+    def to_dict(self):
+        return {ID: self[ID].copy() for ID in range(len(self.array))}
+
+    def copy(self):
+        return type(self)(self.array.copy())
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def __getitem__(self, ID):
+        return TableRow(self.array[ID], self.keys_per_row, self.key_index, self)
+
+    def __setitem__(self, ID, row):
+        for key, value in row.items():
+            self.array[ID, self.key_index[key]] = value
+        self.changed()
+
+    def __iter__(self):
+        return iter(range(len(self.array)))
+
+    def __len__(self):
+        return len(self.array)
+
+    def keys(self):
+        return range(len(self.array))
+
+    def values(self):
+        return [self[ID] for ID in self]
+
+    def items(self):
+        return [(ID, self[ID]) for ID in self]
+
+    def __eq__(self, other):
+        if isinstance(other, PlayerTable):
+            return type(self) is type(other) and np.array_equal(self.array, other.array)
+        try:
+            return len(other) == len(self) and all(self[ID] == other[ID] for ID in self)
+        except (KeyError, TypeError):
+            return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class CardTable(PlayerTable):
+    """
+    NUM_PLAYERS x DECK_SIZE table of YES/NO/UNSURE, indexed by player id and card name
+    Used for the info and public info tables
+    """
+    keys_per_row = card_utils.ALL_CARDS
+    key_index = card_utils.CARD_IDS
+
+
+class HalfSuitTable(PlayerTable):
+    """
+    NUM_PLAYERS x 9 table of the minimum number of cards each player has in each half suit
+    Used for the half suit info and public half suit info tables
+    """
+    keys_per_row = card_utils.ALL_HALFSUITS
+    key_index = card_utils.HS_IDS
+
+
+class CardCounts:
+    """
+    Length NUM_PLAYERS vector of how many cards each player has
+    counts[ID] behaves like the num_cards dictionary the Player class used to store
+    """
+
+    def __init__(self, array=None):
+        if array is None:
+            array = np.zeros(NUM_PLAYERS, dtype=np.int8)
+        self.array = array
+
+    @classmethod
+    def coerce(cls, counts):
+        """
+        Returns counts if it is already a CardCounts, otherwise converts it from a dictionary
+        """
+        if isinstance(counts, cls):
+            return counts
+        res = cls()
+        for ID, count in counts.items():
+            res.array[ID] = count
+        return res
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def copy(self):
+        return CardCounts(self.array.copy())
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __getitem__(self, ID):
+        return self.array.item(ID)
+
+    def __setitem__(self, ID, value):
+        self.array[ID] = value
+
+    def __iter__(self):
+        return iter(range(len(self.array)))
+
+    def __len__(self):
+        return len(self.array)
+
+    def keys(self):
+        return range(len(self.array))
+
+    def values(self):
+        return self.array.tolist()
+
+    def items(self):
+        return enumerate(self.array.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, CardCounts):
+            return np.array_equal(self.array, other.array)
+        try:
+            return len(other) == len(self) and all(other[ID] == v for ID, v in self.items())
+        except (KeyError, TypeError):
+            return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
@@ -0,0 +1,327 @@
+import argparse
+import json
+import math
+import random
+import sys
+from collections import namedtuple
+from multiprocessing import Pool
+from constants import NUM_PLAYERS, SPRT_ELO0, SPRT_ELO1, SPRT_ALPHA, SPRT_BETA, TOURNAMENT_MAX_PAIRS, ENDGAME_CARDS
+from endgame import EndgameSolver
+from game import FishGame
+from ismcts import ISMCTS
+from self_play import game_seeds
+
+# The result of one deal played twice, once with each policy on team 0
+# a_scores and b_scores are the half suits each policy won in the two games
+PairResult = namedtuple("PairResult", ["seed", "a_scores", "b_scores", "turns", "timeouts"])
+
+# Normal quantile of a two sided 95% confidence interval
+Z_95 = 1.959964
+
+
+class Policy:
+    """
+    A way of playing Fish, given to every player of one team in a tournament game
+
+    strategy is a class, such as ismcts.ISMCTS, that is built with strategy(rng=rng, **options)
+    for each player and chooses their asks (see Player). If None, the players make the most likely ask.
+    If endgame_cards is not None, each player also gets an endgame.EndgameSolver that plays
+    once at most that many cards are left.
+    A policy is sent to the worker processes, so strategy has to be picklable (a module level class).
+    """
+
+    def __init__(self, name, strategy=None, endgame_cards=None, **options):
+        self.name = name
+        self.strategy = strategy
+        self.endgame_cards = endgame_cards
+        self.options = options
+
+    def __repr__(self):
+        return "Policy({!r})".format(self.name)
+
+    def make_strategy(self, rng):
+        return None if self.strategy is None else self.strategy(rng=rng, **self.options)
+
+    def make_endgame(self, rng):
+        return None if self.endgame_cards is None else EndgameSolver(max_cards=self.endgame_cards, rng=rng)
+
+
+# The policies that can be named on the command line
+POLICIES = {
+    "greedy": Policy("greedy"),
+    "endgame": Policy("endgame", endgame_cards=ENDGAME_CARDS),
+    "ismcts": Policy("ismcts", ISMCTS),
+    "ismcts_endgame": Policy("ismcts_endgame", ISMCTS, endgame_cards=ENDGAME_CARDS),
+}
+
+
+def play_match_game(seed, team0_policy, team1_policy, max_turns=1000):
+    """
+    Plays the deal of seed with team0_policy on team 0 and team1_policy on team 1
+    The deal and the starting player only depend on seed, so the same seed with the policies
+    swapped plays the same cards from the other side
+    :return: (team 0 score, team 1 score, turns, timed out)
+    """
+    rng = random.Random(seed)
+    policies = [team0_policy, team1_policy]
+    strategies = {ID: policies[ID % 2].make_strategy(rng) for ID in range(NUM_PLAYERS)}
+    game = FishGame.start_random_game(rng=rng, strategies=strategies, endgame_cards=None)
+    for player in game.players:
+        player.endgame = policies[player.ID % 2].make_endgame(rng)
+    timed_out = game.run_whole_game(max_turns=max_turns)
+    return game.team0_score, game.team1_score, game.turns, timed_out
+
+
+def play_pair(seed, policy_a, policy_b, max_turns=1000):
+    """
+    Plays one deal twice, with policy_a on team 0 and then on team 1
+    Swapping the seats cancels out most of the luck of the deal and of who starts
+    :return: PairResult
+    """
+    a0, b1, turns0, timeout0 = play_match_game(seed, policy_a, policy_b, max_turns)
+    b0, a1, turns1, timeout1 = play_match_game(seed, policy_b, policy_a, max_turns)
+    return PairResult(seed, (a0, a1), (b1, b0), turns0 + turns1, timeout0 + timeout1)
+
+
+def _play_pair(args):
+    return play_pair(*args)
+
+
+def score_to_elo(score):
+    """
+    Returns the Elo difference that gives an expected score (between 0 and 1)
+    """
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+
+def elo_to_score(elo):
+    """
+    Returns the expected score of a player that is elo stronger
+    """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+class MatchStats:
+    """
+    Running totals of a match between policy A and policy B, from A's side
+
+    A game scores 1 for a win, 0.5 for a tie and 0 for a loss. The statistics are taken over
+    pairs of games (see play_pair), since the two games of a deal are not independent:
+    the variance of the mean pair score accounts for how much of the result the deal decides.
+    """
+
+    def __init__(self):
+        self.pairs = 0
+        self.wins = 0
+        self.ties = 0
+        self.losses = 0
+        self.timeouts = 0
+        self.turns = 0
+        self._score_sum = 0.0
+        self._score_squares = 0.0
+        self._diff_sum = 0.0
+        self._diff_squares = 0.0
+
+    def add(self, result):
+        """
+        Adds a PairResult
+        """
+        score = 0.0
+        for a, b in zip(result.a_scores, result.b_scores):
+            if a > b:
+                self.wins += 1
+                score += 0.5
+            elif a < b:
+                self.losses += 1
+            else:
+                self.ties += 1
+                score += 0.25
+        diff = (sum(result.a_scores) - sum(result.b_scores)) / 2
+        self.pairs += 1
+        self.timeouts += result.timeouts
+        self.turns += result.turns
+        self._score_sum += score
+        self._score_squares += score * score
+        self._diff_sum += diff
+        self._diff_squares += diff * diff
+
+    @property
+    def games(self):
+        return 2 * self.pairs
+
+    @property
+    def score(self):
+        """
+        A's mean score per game
+        """
+        return self._score_sum / self.pairs if self.pairs else 0.5
+
+    @property
+    def win_rate(self):
+        return self.wins / self.games if self.pairs else 0.0
+
+    @staticmethod
+    def _variance(total, squares, n):
+        return max(squares / n - (total / n) ** 2, 0.0) if n else 0.0
+
+    def score_interval(self, z=Z_95):
+        """
+        Returns the confidence interval of A's expected score per game, (low, high)
+        """
+        half = z * math.sqrt(self._variance(self._score_sum, self._score_squares, self.pairs) / max(self.pairs, 1))
+        return self.score - half, self.score + half
+
+    @property
+    def elo(self):
+        return score_to_elo(self.score)
+
+    def elo_interval(self, z=Z_95):
+        """
+        Returns the confidence interval of A's Elo difference over B, (low, high)
+        """
+        low, high = self.score_interval(z)
+        return score_to_elo(low), score_to_elo(high)
+
+    @property
+    def half_suit_diff(self):
+        """
+        Mean number of half suits A won more than B per game
+        """
+        return self._diff_sum / self.pairs if self.pairs else 0.0
+
+    def half_suit_diff_interval(self, z=Z_95):
+        half = z * math.sqrt(self._variance(self._diff_sum, self._diff_squares, self.pairs) / max(self.pairs, 1))
+        return self.half_suit_diff - half, self.half_suit_diff + half
+
+    def llr(self, elo0=SPRT_ELO0, elo1=SPRT_ELO1):
+        """
+        Returns the log likelihood ratio of A being elo1 stronger than B against A being elo0 stronger
+        This is the generalized SPRT: the mean pair score is taken to be normal, with the variance
+        measured so far, so the ratio is n * (s1 - s0) * (mean - (s0 + s1) / 2) / variance
+        """
+        variance = self._variance(self._score_sum, self._score_squares, self.pairs)
+        if variance == 0:
+            return 0.0
+        s0, s1 = elo_to_score(elo0), elo_to_score(elo1)
+        return self.pairs * (s1 - s0) * (self.score - (s0 + s1) / 2) / variance
+
+    def as_dict(self):
+        elo_low, elo_high = self.elo_interval()
+        diff_low, diff_high = self.half_suit_diff_interval()
+        return {"pairs": self.pairs, "games": self.games, "wins": self.wins, "ties": self.ties,
+                "losses": self.losses, "timeouts": self.timeouts, "win_rate": self.win_rate, "score": self.score,
+                "elo": self.elo, "elo_low": elo_low, "elo_high": elo_high, "half_suit_diff": self.half_suit_diff,
+                "half_suit_diff_low": diff_low, "half_suit_diff_high": diff_high,
+                "mean_turns": self.turns / self.games if self.pairs else 0.0}
+
+
+def sprt_bounds(alpha=SPRT_ALPHA, beta=SPRT_BETA):
+    """
+    Returns the (lower, upper) log likelihood ratio bounds of a sequential probability ratio test
+    Below lower the null hypothesis is accepted and above upper the alternative is
+    """
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run_match(policy_a, policy_b, max_pairs=TOURNAMENT_MAX_PAIRS, seed=0, processes=None, max_turns=1000,
+              elo0=SPRT_ELO0, elo1=SPRT_ELO1, alpha=SPRT_ALPHA, beta=SPRT_BETA, sprt=True, callback=None):
+    """
+    Plays pairs of games between two policies across a pool of processes until the sequential
+    probability ratio test decides whether A is elo1 stronger than B or only elo0 stronger,
+    or max_pairs pairs have been played
+
+    The results are added in seed order, so the decision and the statistics do not depend on the
+    number of processes or how fast they are. Games that are still being played when the test
+    decides are thrown away.
+    :param policy_a: Policy being tested
+    :param policy_b: Policy it is tested against
+    :param max_pairs: most pairs of games played
+    :param seed: seed the per pair seeds are derived from
+    :param processes: number of worker processes, the number of CPUs if None.
+    If 1, the games are played in this process
+    :param max_turns: longest a game can go on before it is forced to end
+    :param elo0: Elo difference of the null hypothesis
+    :param elo1: Elo difference of the alternative hypothesis
+    :param alpha: chance of accepting the alternative when the null hypothesis is true
+    :param beta: chance of accepting the null hypothesis when the alternative is true
+    :param sprt: if False, every pair is played and no hypothesis is accepted
+    :param callback: function called with the MatchStats after each pair, or None
+    :return: (MatchStats, decision) where decision is "H1" if A is stronger by elo1, "H0" if it is
+    not stronger by more than elo0 and None if the match ran out of pairs first
+    """
+    lower, upper = sprt_bounds(alpha, beta)
+    stats = MatchStats()
+    tasks = [(pair_seed, policy_a, policy_b, max_turns) for pair_seed in game_seeds(seed, max_pairs)]
+    if processes == 1:
+        results = map(_play_pair, tasks)
+        pool = None
+    else:
+        pool = Pool(processes)
+        results = pool.imap(_play_pair, tasks)
+    decision = None
+    try:
+        for result in results:
+            stats.add(result)
+            if callback is not None:
+                callback(stats)
+            if sprt:
+                llr = stats.llr(elo0, elo1)
+                if llr >= upper:
+                    decision = "H1"
+                elif llr <= lower:
+                    decision = "H0"
+                if decision is not None:
+                    break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return stats, decision
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plays two Fish policies against each other until one is "
+                                                 "clearly stronger")
+    parser.add_argument("policy_a", choices=sorted(POLICIES), help="policy being tested")
+    parser.add_argument("policy_b", choices=sorted(POLICIES), help="policy it is tested against")
+    parser.add_argument("--pairs", type=int, default=TOURNAMENT_MAX_PAIRS, help="most pairs of games to play")
+    parser.add_argument("--seed", type=int, default=0, help="seed the deals are derived from")
+    parser.add_argument("--processes", type=int, help="worker processes (default: number of CPUs)")
+    parser.add_argument("--elo0", type=float, default=SPRT_ELO0, help="Elo difference of the null hypothesis")
+    parser.add_argument("--elo1", type=float, default=SPRT_ELO1, help="Elo difference of the alternative")
+    parser.add_argument("--alpha", type=float, default=SPRT_ALPHA, help="false positive rate of the test")
+    parser.add_argument("--beta", type=float, default=SPRT_BETA, help="false negative rate of the test")
+    parser.add_argument("--no-sprt", action="store_true", help="play every pair instead of stopping early")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    lower, upper = sprt_bounds(args.alpha, args.beta)
+
+    def report(stats):
+        elo_low, elo_high = stats.elo_interval()
+        print("\r{} games  W/T/L {}/{}/{}  Elo {:+.1f} [{:+.1f}, {:+.1f}]  LLR {:.2f} ({:.2f}, {:.2f})".format(
+            stats.games, stats.wins, stats.ties, stats.losses, stats.elo, elo_low, elo_high,
+            stats.llr(args.elo0, args.elo1), lower, upper), end="", flush=True)
+
+    stats, decision = run_match(POLICIES[args.policy_a], POLICIES[args.policy_b], args.pairs, args.seed,
+                                args.processes, elo0=args.elo0, elo1=args.elo1, alpha=args.alpha, beta=args.beta,
+                                sprt=not args.no_sprt, callback=report)
+    print()
+    results = stats.as_dict()
+    results.update({"policy_a": args.policy_a, "policy_b": args.policy_b, "decision": decision,
+                    "llr": stats.llr(args.elo0, args.elo1), "elo0": args.elo0, "elo1": args.elo1})
+    print("{} vs {}: win rate {:.3f}, half suit differential {:+.2f} [{:+.2f}, {:+.2f}], Elo {:+.1f} [{:+.1f}, {:+.1f}]"
+          .format(args.policy_a, args.policy_b, results["win_rate"], results["half_suit_diff"],
+                  results["half_suit_diff_low"], results["half_suit_diff_high"], results["elo"],
+                  results["elo_low"], results["elo_high"]))
+    print({"H1": "{} is stronger".format(args.policy_a), "H0": "{} is not stronger".format(args.policy_a),
+           None: "undecided"}[decision])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
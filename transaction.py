@@ -0,0 +1,179 @@
+import struct
+from collections import namedtuple
+import card_utils
+from constants import NUM_PLAYERS
+from exceptions import TranscriptException
+
+# A transcript file starts with MAGIC followed by the format version
+MAGIC = b"FISHTX"
+VERSION = 1
+
+# Every record starts with a little endian 16 bit word. The top 2 bits are the kind of record
+ASK_RECORD = 0
+CALL_RECORD = 1
+DEAL_RECORD = 2
+RECORD_KIND_SHIFT = 14
+WORD = struct.Struct("<H")
+# After a deal word: team 0 score, team 1 score, and the number of cards in each hand
+DEAL_HEADER = struct.Struct("<BB{}B".format(NUM_PLAYERS))
+
+# An ask: ID_ask asked ID_target for card
+Transaction = namedtuple("Transaction", ["ID_ask", "ID_target", "card", "success"])
+# A half suit called by a team
+Call = namedtuple("Call", ["hs", "team", "success"])
+# The state a game started in. player_cards is a list of each player's cards, in the order they were dealt
+Deal = namedtuple("Deal", ["player_cards", "start", "team0_score", "team1_score"])
+# A whole game: its Deal and the list of its Transactions and Calls in the order they happened
+GameTranscript = namedtuple("GameTranscript", ["deal", "events"])
+
+
+def encode_ask(ID_ask, ID_target, card, success):
+    """
+    Packs an ask into a 16 bit word: | kind 2 | ID_ask 3 | ID_target 3 | unused 1 | card 6 | success 1 |
+    """
+    return (ASK_RECORD << RECORD_KIND_SHIFT | ID_ask << 11 | ID_target << 8
+            | card_utils.CARD_IDS[card] << 1 | bool(success))
+
+
+def encode_call(hs, team, success):
+    """
+    Packs a call into a 16 bit word: | kind 2 | unused 6 | half suit 4 | unused 2 | team 1 | success 1 |
+    """
+    return CALL_RECORD << RECORD_KIND_SHIFT | card_utils.HS_IDS[hs] << 4 | team << 1 | bool(success)
+
+
+def decode_word(word):
+    """
+    Unpacks an ask or call word
+    :return: Transaction or Call
+    """
+    kind = word >> RECORD_KIND_SHIFT
+    if kind == ASK_RECORD:
+        return Transaction((word >> 11) & 7, (word >> 8) & 7, card_utils.ALL_CARDS[(word >> 1) & 63], bool(word & 1))
+    if kind == CALL_RECORD:
+        return Call(card_utils.ALL_HALFSUITS[(word >> 4) & 15], (word >> 1) & 1, bool(word & 1))
+    raise TranscriptException("Record of kind {} is not an ask or a call".format(kind))
+
+
+class TranscriptWriter:
+    """
+    Streams games into a binary transcript file
+
+    The file is a header (MAGIC and VERSION) followed by games one after the other.
+    Each game is a deal record and then one 2 byte record per ask or call:
+    deal word (kind and starting player), DEAL_HEADER, then each dealt card id as a byte,
+    so a full deal takes 64 bytes and a typical game about half a kilobyte.
+    A game ends where the next deal record or the file starts, so no game is ever
+    rewritten and many games can be appended to the same file.
+
+    Pass the writer to FishGame (transcript=writer) and the game records itself.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: path of the transcript, which is appended to if it exists,
+        or a binary file object opened for writing
+        """
+        self._owns_file = isinstance(file, str)
+        self.file = open(file, "ab") if self._owns_file else file
+        if self.file.tell() == 0:
+            self.file.write(MAGIC + bytes([VERSION]))
+        self.games = 0
+
+    def start_game(self, player_cards, start, team0_score=0, team1_score=0):
+        """
+        Writes the deal that starts a new game
+        :param player_cards: list of each player's cards
+        :param start: ID of the player who asks first
+        """
+        self.file.write(WORD.pack(DEAL_RECORD << RECORD_KIND_SHIFT | start))
+        self.file.write(DEAL_HEADER.pack(team0_score, team1_score, *(len(cards) for cards in player_cards)))
+        self.file.write(bytes(card_utils.CARD_IDS[card] for cards in player_cards for card in cards))
+        self.games += 1
+
+    def write_ask(self, ID_ask, ID_target, card, success):
+        self.file.write(WORD.pack(encode_ask(ID_ask, ID_target, card, success)))
+
+    def write_call(self, hs, team, success):
+        """
+        :param team: team that called the half suit
+        :param success: True if the call was correct
+        """
+        if team is None or success is None:
+            raise TranscriptException("A call needs the calling team and whether it succeeded to be recorded")
+        self.file.write(WORD.pack(encode_call(hs, team, success)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self._owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_records(file):
+    """
+    Generator over the records of a transcript, in order, without reading the whole file
+    :param file: path of the transcript or a binary file object opened for reading
+    :return: Deal, Transaction and Call records
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            yield from iter_records(f)
+        return
+    header = file.read(len(MAGIC) + 1)
+    if header[:len(MAGIC)] != MAGIC:
+        raise TranscriptException("Not a Fish transcript")
+    if header[len(MAGIC)] != VERSION:
+        raise TranscriptException("Unsupported transcript version {}".format(header[len(MAGIC)]))
+    while True:
+        data = file.read(WORD.size)
+        if not data:
+            return
+        if len(data) < WORD.size:
+            raise TranscriptException("Transcript ends in the middle of a record")
+        word = WORD.unpack(data)[0]
+        if word >> RECORD_KIND_SHIFT != DEAL_RECORD:
+            yield decode_word(word)
+            continue
+        data = file.read(DEAL_HEADER.size)
+        if len(data) < DEAL_HEADER.size:
+            raise TranscriptException("Transcript ends in the middle of a deal")
+        team0_score, team1_score, *hand_sizes = DEAL_HEADER.unpack(data)
+        cards = file.read(sum(hand_sizes))
+        if len(cards) < sum(hand_sizes):
+            raise TranscriptException("Transcript ends in the middle of a deal")
+        cards = [card_utils.ALL_CARDS[c] for c in cards]
+        player_cards, i = [], 0
+        for size in hand_sizes:
+            player_cards.append(cards[i:i + size])
+            i += size
+        yield Deal(player_cards, word & 7, team0_score, team1_score)
+
+
+def read_transcripts(file):
+    """
+    Generator over the games of a transcript, one GameTranscript at a time
+    Only one game is held in memory at once
+    :param file: path of the transcript or a binary file object opened for reading
+    """
+    game = None
+    for record in iter_records(file):
+        if isinstance(record, Deal):
+            if game is not None:
+                yield game
+            game = GameTranscript(record, [])
+        elif game is None:
+            raise TranscriptException("Transcript has a record before its first deal")
+        else:
+            game.events.append(record)
+    if game is not None:
+        yield game
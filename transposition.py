@@ -0,0 +1,120 @@
+import random
+from collections import OrderedDict
+import card_utils
+from constants import NUM_PLAYERS, DECK_SIZE, TRANSPOSITION_CACHE_SIZE
+
+NUM_HS = len(card_utils.ALL_HALFSUITS)
+# The keys are made from a fixed seed, so a table has the same hash in every process
+ZOBRIST_SEED = 54
+
+
+def _make_keys(rng, *shape):
+    if not shape:
+        return rng.getrandbits(64)
+    return [_make_keys(rng, *shape[1:]) for _ in range(shape[0])]
+
+
+_rng = random.Random(ZOBRIST_SEED)
+# CELL_KEYS[player][card][value + 1] for value NO, UNSURE or YES
+CELL_KEYS = _make_keys(_rng, NUM_PLAYERS, DECK_SIZE, 3)
+# HS_KEYS[player][half suit][minimum number of cards in the half suit]
+HS_KEYS = _make_keys(_rng, NUM_PLAYERS, NUM_HS, DECK_SIZE + 1)
+# COUNT_KEYS[player][number of cards]
+COUNT_KEYS = _make_keys(_rng, NUM_PLAYERS, DECK_SIZE + 1)
+# REMAINING_KEYS[half suit] is in the hash if the half suit has not been called
+REMAINING_KEYS = _make_keys(_rng, NUM_HS)
+
+
+def table_hash(cells, hs, counts, remaining):
+    """
+    Returns the Zobrist hash of a knowledge state, computed from scratch
+    The Propagator keeps the same hash up to date as entries change, without recomputing it
+    :param cells: NUM_PLAYERS x DECK_SIZE nested lists of YES, NO or UNSURE
+    :param hs: NUM_PLAYERS x 9 nested lists of half suit minimums
+    :param counts: list of each player's number of cards
+    :param remaining: list of 9 booleans, True if the half suit has not been called
+    """
+    key = 0
+    for ID in range(NUM_PLAYERS):
+        cell_keys = CELL_KEYS[ID]
+        for c, value in enumerate(cells[ID]):
+            key ^= cell_keys[c][value + 1]
+        for h, count in enumerate(hs[ID]):
+            key ^= HS_KEYS[ID][h][count]
+        key ^= COUNT_KEYS[ID][counts[ID]]
+    for h, is_remaining in enumerate(remaining):
+        if is_remaining:
+            key ^= REMAINING_KEYS[h]
+    return key
+
+
+class TranspositionCache:
+    """
+    A bounded least recently used cache of propagation results
+
+    The key is the Zobrist hash of the tables before propagating and the value is what
+    propagating changed: a tuple of (player, card, value) entries, or the message of the
+    InfoDictException it raised. Propagation reaches the same tables from the same starting
+    tables, so a repeated position is resolved by replaying the stored entries instead of
+    deducing them again. Two different positions with the same 64 bit hash are assumed not to happen.
+
+    One cache can be shared by any number of Propagators, across players and games.
+    Propagators use it through lookup and save, the same methods as propagation_store.PropagationStore.
+    """
+
+    def __init__(self, capacity=TRANSPOSITION_CACHE_SIZE):
+        self.capacity = capacity
+        self._results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key):
+        """
+        Returns the stored result for key, or None if there is none
+        """
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        """
+        Stores a result, dropping the least recently used one if the cache is full
+        """
+        self._results[key] = result
+        self._results.move_to_end(key)
+        if len(self._results) > self.capacity:
+            self._results.popitem(last=False)
+
+    def lookup(self, engine):
+        """
+        Looks up the propagation of a Propagator's current tables, by the propagator's hash
+        :return: (key, result) where result is what get returns and key is passed to save
+        """
+        return engine.hash, self.get(engine.hash)
+
+    def save(self, key, result):
+        """
+        Stores the result of propagating the tables a lookup returned key for
+        """
+        self.put(key, result)
+
+    def clear(self):
+        self._results.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self):
+        return {"size": len(self), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hit_rate}
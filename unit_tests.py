@@ -1,9 +1,56 @@
 import unittest
 from player import Player
+from public_knowledge import PublicKnowledge
 import card_utils
 from game import FishGame
-from model import FishDecisionMaker
+import batch_game
+from batch_game import BatchFishGame, heuristic_policy
+from self_play import play_game, run_self_play, summarize
+from tournament import POLICIES, MatchStats, PairResult, run_match, sprt_bounds, score_to_elo, elo_to_score
+from replay_memory import ReplayMemory
+from frozen_model import FrozenModel
+import benchmarks
+import transaction
+import replay
+import encoding
 import constants
+from propagation import Propagator
+from transposition import TranspositionCache, table_hash
+from symmetry import canonicalize
+from propagation_store import PropagationStore
+from probability import ProbabilityEngine
+from ismcts import ISMCTS, Simulation, legal_asks
+from inference import InferenceServer, InferenceStrategy, legal_action_mask
+from endgame import EndgameSolver, settle, play_ask
+from math import factorial
+from exceptions import InfoDictException, TranscriptException
+from feasibility import is_feasible
+from tables import CardTable, HalfSuitTable, CardCounts
+import numpy as np
+import asyncio
+import importlib.util
+import tempfile
+import subprocess
+import sys
+import random
+import os
+
+
+class TestCardUtils(unittest.TestCase):
+
+    def test_card_ids_round_trip(self):
+        for i, card in enumerate(card_utils.gen_all_cards()):
+            self.assertEqual(card_utils.card_id(card), i, "Card id does not follow gen_all_cards order")
+            self.assertEqual(card_utils.card_name(i), card, "Card name does not match card id")
+        self.assertEqual(card_utils.mask_to_cards(card_utils.cards_to_mask(["BJ", "2c", "Th"])), ["2c", "Th", "BJ"])
+
+    def test_half_suit_tables(self):
+        for hs in card_utils.gen_all_halfsuits():
+            h = card_utils.hs_id(hs)
+            self.assertEqual(card_utils.mask_to_cards(card_utils.HS_MASKS[h]), sorted(card_utils.find_cards(hs), key=card_utils.card_id))
+            for c in card_utils.HS_CARDS[h]:
+                self.assertEqual(card_utils.CARD_HS[c], h, "Card is not mapped to its half suit")
+        self.assertEqual(card_utils.hs_of_mask(card_utils.cards_to_mask(["8c", "2h"])), [card_utils.hs_id("Lh"), card_utils.hs_id("8J")])
 
 
 class TestPlayer(unittest.TestCase):
@@ -73,6 +120,19 @@ class TestPlayer(unittest.TestCase):
         p1._update_info()
         self.assertEqual(p1.info[5]["Jh"], constants.YES, "Did not update correctly")
 
+    def test_view_writes_reach_propagation(self):
+        own_hand = ["2h", "3h", "4h", "5h", "6h", "7h", "8h", "9h", "Th"]
+        p1 = Player.player_start_of_game(0, own_hand)
+        for i in range(1, 5):
+            p1.info[i]["Jh"] = constants.NO
+        p1.update_transaction(1, 2, "Qh", False)
+        self.assertEqual(p1.info[5]["Jh"], constants.YES, "Did not propagate entries written through the view")
+        public = PublicKnowledge.start_of_game()
+        for i in range(5):
+            public.public_info[i]["Jh"] = constants.NO
+        public.update_transaction(1, 2, "Qh", False)
+        self.assertEqual(public.public_info[5]["Jh"], constants.YES, "Did not propagate public entries written through the view")
+
     def test_update_info_endgame(self):
         own_hand = ["2h", "3h"]
         p1 = Player.player_start_of_game(0, own_hand)
@@ -96,6 +156,18 @@ class TestPlayer(unittest.TestCase):
         p1.update_transaction(3, 4, "3d", False)
         p1.print_info()
 
+    def test_tables_dict_access(self):
+        own_hand = ["2h", "3h", "4h", "5h", "6h", "7h", "8h", "9h", "Th"]
+        p1 = Player.player_start_of_game(0, own_hand)
+        self.assertEqual(p1.info.array.shape, (constants.NUM_PLAYERS, constants.DECK_SIZE), "Info table has the wrong shape")
+        self.assertEqual(p1.hs_info.array.shape, (constants.NUM_PLAYERS, 9), "Half suit table has the wrong shape")
+        p1.info[3]["Jh"] = constants.NO
+        self.assertEqual(p1.info.array[3, card_utils.card_id("Jh")], constants.NO, "Table view did not write through")
+        self.assertEqual(p1.info.to_dict()[3]["Jh"], constants.NO, "Table did not convert back to a dictionary")
+        copied = p1.info.copy()
+        copied[3]["Qh"] = constants.NO
+        self.assertEqual(p1.info[3]["Qh"], constants.UNSURE, "Copy shares data with the original table")
+
     def test_is_consistent_duplicate_cards(self):
         info = {ID: {card: constants.UNSURE for card in card_utils.gen_all_cards()} for ID in range(constants.NUM_PLAYERS)}
         hs_info = {ID: {hs: 1 for hs in card_utils.gen_all_halfsuits()} for ID in range(constants.NUM_PLAYERS)}
@@ -261,6 +333,407 @@ class TestPlayer(unittest.TestCase):
         self.assertEqual(res, expected, "Call was incorrect")
 
 
+class TestPropagation(unittest.TestCase):
+
+    def test_propagate_only_affected_cells(self):
+        own_hand = ["2h", "3h", "4h", "5h", "6h", "7h", "8h", "9h", "Th"]
+        p1 = Player.player_start_of_game(0, own_hand)
+        engine = Propagator(p1.info, p1.hs_info, p1.num_cards, p1.remaining_hs)
+        engine.set_half_suit(3, card_utils.hs_id("Hc"), 3)
+        for card in ["9c", "Tc", "Jc"]:
+            engine.assign(3, card_utils.card_id(card), constants.NO)
+        # 3 YES entries for player 3, then NO for the 4 other players who could have had them
+        self.assertEqual(engine.propagate(), 15, "Resolved entries outside the affected half suit")
+        for card in ["Qc", "Kc", "Ac"]:
+            self.assertEqual(p1.info[3][card], constants.YES, "Did not conclude player 3 had {}".format(card))
+            self.assertEqual(p1.info[4][card], constants.NO, "Did not conclude player 4 did not have {}".format(card))
+
+    def test_propagate_contradiction(self):
+        p1 = Player.player_start_of_game(0, ["2h"])
+        engine = Propagator(p1.info, p1.hs_info, p1.num_cards, p1.remaining_hs)
+        engine.set_half_suit(2, card_utils.hs_id("Hh"), 6)
+        with self.assertRaises(InfoDictException):
+            engine.assign(3, card_utils.card_id("Qh"), constants.YES)
+            engine.propagate()
+
+
+    def test_checkpoint_rollback(self):
+        own_hand = ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]
+        p1 = Player.player_start_of_game(0, own_hand)
+        p1.update_transaction(3, 4, "9c", True)
+        before = (p1.info.copy(), p1.public_info.copy(), p1.hs_info.copy(), p1.public_hs_info.copy(),
+                  p1.num_cards.copy(), list(p1.remaining_hs))
+        marker = p1.checkpoint()
+        p1.update_transaction(4, 3, "9c", True)
+        p1.update_transaction(1, 0, "5h", True)
+        p1.update_call("Lh", {0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1})
+        self.assertEqual(p1.info[0]["5h"], constants.NO, "Hypothetical update was not applied")
+        p1.rollback(marker)
+        after = (p1.info, p1.public_info, p1.hs_info, p1.public_hs_info, p1.num_cards, p1.remaining_hs)
+        for expected, res in zip(before, after):
+            self.assertEqual(res, expected, "Rollback did not restore the player's knowledge")
+        p1.update_transaction(4, 3, "Tc", False)
+        self.assertEqual(p1.info[4]["Tc"], constants.NO, "Player cannot be updated after a rollback")
+
+    def test_lazy_updates(self):
+        own_hand = ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]
+        transactions = [(3, 4, "9c", True), (4, 3, "Tc", False), (1, 0, "5h", True), (2, 1, "5h", True)]
+        eager = Player.player_start_of_game(0, own_hand)
+        lazy = Player.player_start_of_game(0, own_hand)
+        for transaction in transactions:
+            eager.update_transaction(*transaction)
+            eager.info
+        for transaction in transactions:
+            lazy.update_transaction(*transaction)
+        self.assertEqual(lazy._info[3]["9c"], constants.UNSURE, "Transaction was propagated before info was read")
+        self.assertEqual(lazy.num_cards[2], 10, "Number of cards was not updated right away")
+        self.assertEqual(lazy.info, eager.info, "Queued transactions reached different info")
+        self.assertEqual(lazy.hs_info, eager.hs_info, "Queued transactions reached different half suit info")
+        self.assertEqual(lazy.public_info, eager.public_info, "Queued transactions reached different public info")
+
+
+class TestFeasibility(unittest.TestCase):
+
+    def test_global_contradiction(self):
+        info = {ID: {card: constants.NO for card in card_utils.gen_all_cards()} for ID in range(constants.NUM_PLAYERS)}
+        hs_info = {ID: {hs: 0 for hs in card_utils.gen_all_halfsuits()} for ID in range(constants.NUM_PLAYERS)}
+        num_cards = {0: 2, 1: 2, 2: 1, 3: 0, 4: 1, 5: 0}
+        info[0]["2h"] = constants.YES
+        info[0]["3h"] = constants.YES
+        for ID in [1, 2, 4]:
+            info[ID]["6h"] = constants.UNSURE
+            info[ID]["7h"] = constants.UNSURE
+        info[5]["4h"] = constants.UNSURE
+        info[5]["5h"] = constants.UNSURE
+        self.assertTrue(Player._is_consistent(info, ["Lh"], hs_info, num_cards), "Rules should not see the contradiction")
+        self.assertFalse(is_feasible(CardTable.from_dict(info), HalfSuitTable.from_dict(hs_info),
+                                     CardCounts.coerce(num_cards), ["Lh"]), "Did not catch the contradiction")
+
+    def test_exact_deduction(self):
+        own_hand = ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]
+        p1 = Player.player_start_of_game(0, own_hand, exact=True)
+        p1.update_transaction(3, 4, "9c", False)
+        p1.update_transaction(4, 3, "Tc", False)
+        p1.update_transaction(3, 4, "Jc", False)
+        p1.update_transaction(4, 3, "Qc", False)
+        for ID in [3, 4]:
+            for card in ["Kc", "Ac"]:
+                self.assertEqual(p1.info[ID][card], constants.UNSURE, "Not enough info to know about p{}'s status of {}".format(ID, card))
+        # Players 3 and 4 each need one of Kc and Ac, so nobody else can have them
+        for ID in [1, 2, 5]:
+            for card in ["Kc", "Ac"]:
+                self.assertEqual(p1.info[ID][card], constants.NO, "Did not deduce p{} has no {}".format(ID, card))
+
+
+class TestTransposition(unittest.TestCase):
+
+    def test_hash_follows_changes(self):
+        own_hand = ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]
+        p1 = Player.player_start_of_game(0, own_hand, cache=TranspositionCache())
+        start_hash = p1._engine().hash
+        marker = p1.checkpoint()
+        p1.update_transaction(3, 4, "9c", True)
+        p1.update_call("Lh", {0: 3, 1: 0, 2: 0, 3: 1, 4: 1, 5: 1})
+        engine = p1._engine()
+        self.assertEqual(engine.hash, table_hash(engine._cells, engine._hs, engine._counts, engine._remaining),
+                         "Incremental hash does not match the tables")
+        self.assertNotEqual(engine.hash, start_hash, "Hash did not change")
+        p1.rollback(marker)
+        self.assertEqual(p1._engine().hash, start_hash, "Rollback did not restore the hash")
+
+    def test_repeated_position_hits_cache(self):
+        own_hand = ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]
+        cache = TranspositionCache()
+        p1 = Player.player_start_of_game(0, own_hand, cache=cache)
+        p2 = Player.player_start_of_game(0, own_hand)
+        marker = p1.checkpoint()
+        for player in [p1, p2]:
+            player.update_transaction(3, 4, "9c", True)
+            player.update_transaction(4, 3, "Tc", False)
+        expected = p1.info.copy()
+        self.assertEqual(expected, p2.info, "Cached propagator deduced something else")
+        p1.rollback(marker)
+        hits = cache.hits
+        p1.update_transaction(3, 4, "9c", True)
+        p1.update_transaction(4, 3, "Tc", False)
+        self.assertEqual(p1.info, expected, "Cached result is different")
+        self.assertGreater(cache.hits, hits, "Repeated position was propagated again")
+
+    def test_cache_is_bounded(self):
+        cache = TranspositionCache(capacity=2)
+        for key in range(3):
+            cache.put(key, ())
+        self.assertEqual(len(cache), 2, "Cache grew past its capacity")
+        self.assertIsNone(cache.get(0), "Least recently used result was not dropped")
+        self.assertEqual(cache.get(2), (), "Newest result was dropped")
+        self.assertEqual((cache.hits, cache.misses), (1, 1), "Wrong hit statistics")
+
+
+class TestSymmetry(unittest.TestCase):
+
+    def test_canonical_form_of_relabeled_state(self):
+        p1 = Player.player_start_of_game(0, ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"])
+        p1.update_transaction(3, 4, "9c", True)
+        p1.update_transaction(4, 3, "Tc", False)
+        # The same game with hearts and spades swapped, seen from 2 seats further on
+        relabel = {"h": "s", "s": "h", "c": "c", "d": "d"}
+        swap = lambda card: card if card in ["SJ", "BJ"] else card[0] + relabel[card[1]]
+        p2 = Player.player_start_of_game(2, [swap(c) for c in ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]])
+        p2.update_transaction(5, 0, swap("9c"), True)
+        p2.update_transaction(0, 5, swap("Tc"), False)
+        state1 = canonicalize(p1.info, p1.hs_info, p1.num_cards, p1.remaining_hs)
+        state2 = canonicalize(p2.info, p2.hs_info, p2.num_cards, p2.remaining_hs)
+        self.assertEqual(state1.key, state2.key, "Relabeled states have different canonical forms")
+        np.testing.assert_array_equal(state1.from_canonical(state1.to_canonical(p1.info.array)), p1.info.array)
+        p1.update_call("Lh", {0: 2, 1: 1, 2: 1, 3: 1, 4: 1, 5: 0})
+        state3 = canonicalize(p1.info, p1.hs_info, p1.num_cards, p1.remaining_hs)
+        self.assertNotEqual(state1.key, state3.key, "Different states have the same canonical form")
+
+    def test_store_is_reused(self):
+        hand = ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]
+        asks = [(3, 4, "9c", True), (4, 3, "Tc", False), (1, 0, "5h", True)]
+        expected = Player.player_start_of_game(0, hand)
+        for ask in asks:
+            expected.update_transaction(*ask)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "store.npy")
+            store = PropagationStore(path, capacity=64)
+            p1 = Player.player_start_of_game(0, hand, cache=store)
+            for ask in asks:
+                p1.update_transaction(*ask)
+                p1.info
+            self.assertEqual(p1.info, expected.info, "Player with a store deduced something else")
+            self.assertGreater(len(store), 0, "Nothing was stored")
+            store.flush()
+            del store
+            reopened = PropagationStore(path, readonly=True)
+            p2 = Player.player_start_of_game(0, hand, cache=reopened)
+            for ask in asks:
+                p2.update_transaction(*ask)
+                p2.info
+            self.assertEqual(p2.info, expected.info, "Stored results were applied wrongly")
+            self.assertEqual(reopened.misses, 0, "A later run did not reuse the stored results")
+            del reopened
+
+
+class TestProbability(unittest.TestCase):
+
+    def test_start_of_game(self):
+        p1 = Player.player_start_of_game(0, card_utils.ALL_CARDS[:9])
+        engine = ProbabilityEngine(p1.info, p1.hs_info, p1.num_cards, p1.remaining_hs)
+        deals = factorial(45) // factorial(9) ** 5
+        self.assertAlmostEqual(engine.total / deals, 1.0, 9, "Wrong number of deals")
+        np.testing.assert_allclose(engine.probabilities[1:, 9:], 0.2)
+        np.testing.assert_array_equal(engine.probabilities[:, :9], p1.info.array[:, :9] == constants.YES)
+
+    def test_endgame(self):
+        p1 = Player.player_start_of_game(0, ["2h", "3h"])
+        p1.num_cards = {0: 2, 1: 2, 2: 0, 3: 2, 4: 0, 5: 0}
+        p1.remaining_hs = ["Lh"]
+        for c in card_utils.gen_all_cards():
+            for ID in range(constants.NUM_PLAYERS):
+                if c not in card_utils.find_cards("Lh") or ID in [2, 4, 5]:
+                    p1.info[ID][c] = constants.NO
+        p1.info[1]["4h"] = constants.NO
+        # Player 1 has 2 of 5h, 6h and 7h, and player 3 has the other one and 4h
+        probabilities = p1.card_probabilities()
+        for card in ["5h", "6h", "7h"]:
+            self.assertAlmostEqual(probabilities[1, card_utils.card_id(card)], 2 / 3, 9, "Wrong probability")
+            self.assertAlmostEqual(probabilities[3, card_utils.card_id(card)], 1 / 3, 9, "Wrong probability")
+        self.assertAlmostEqual(probabilities[3, card_utils.card_id("4h")], 1, 9, "Wrong probability")
+        self.assertEqual(p1._list_best_options(), [(3, "4h")], "Did not choose the most likely ask")
+
+    def test_inconsistent(self):
+        p1 = Player.player_start_of_game(0, ["2h", "3h"])
+        p1.info[1]["4h"] = constants.NO
+        p1.info[3]["4h"] = constants.NO
+        p1.info[5]["4h"] = constants.NO
+        p1.info[2]["4h"] = constants.NO
+        p1.info[4]["4h"] = constants.NO
+        with self.assertRaises(InfoDictException):
+            p1.card_probabilities()
+
+    def test_sample_deals(self):
+        p1 = Player.player_start_of_game(0, ["2h", "3h"])
+        p1.num_cards = {0: 2, 1: 2, 2: 0, 3: 2, 4: 0, 5: 0}
+        p1.remaining_hs = ["Lh"]
+        for c in card_utils.gen_all_cards():
+            for ID in range(constants.NUM_PLAYERS):
+                if c not in card_utils.find_cards("Lh") or ID in [2, 4, 5]:
+                    p1.info[ID][c] = constants.NO
+        p1.info[1]["4h"] = constants.NO
+        deals = p1.sample_deals(3000, np.random.default_rng(0))
+        self.assertEqual(deals.shape, (3000, constants.DECK_SIZE), "Wrong shape of deals")
+        lh = [card_utils.card_id(card) for card in card_utils.find_cards("Lh")]
+        self.assertTrue(np.all(np.delete(deals, lh, axis=1) == -1), "Called cards were dealt")
+        self.assertTrue(np.all(deals[:, card_utils.card_id("4h")] == 3), "Dealt a card to a player without it")
+        for ID, count in p1.num_cards.items():
+            self.assertTrue(np.all((deals == ID).sum(axis=1) == count), "Wrong number of cards")
+        self.assertAlmostEqual(np.mean(deals[:, card_utils.card_id("5h")] == 1), 2 / 3, 1, "Deals are not uniform")
+
+    def test_sample_deals_minimum(self):
+        p1 = Player.player_start_of_game(0, card_utils.ALL_CARDS[:9])
+        p1.hs_info[1]["Lh"] = 3
+        engine = ProbabilityEngine(p1.info, p1.hs_info, p1.num_cards, p1.remaining_hs)
+        deals = engine.sample_deals(2000, np.random.default_rng(0))
+        lh = [card_utils.card_id(card) for card in card_utils.find_cards("Lh")]
+        self.assertTrue(np.all((deals[:, lh] == 1).sum(axis=1) >= 3), "Broke a half suit minimum")
+        for ID in range(constants.NUM_PLAYERS):
+            self.assertTrue(np.all((deals == ID).sum(axis=1) == 9), "Wrong number of cards")
+        frequencies = np.stack([np.mean(deals == ID, axis=0) for ID in range(constants.NUM_PLAYERS)])
+        np.testing.assert_allclose(frequencies, engine.probabilities, atol=0.05)
+
+    def test_engine_cache(self):
+        p1 = Player.player_start_of_game(0, ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"])
+        engine = p1._probabilities()
+        p1.make_optimal_ask()
+        self.assertIs(p1._probabilities(), engine, "Engine was rebuilt without new knowledge")
+        p1.update_transaction(1, 3, "3h", False)
+        self.assertIsNot(p1._probabilities(), engine, "Engine was kept after new knowledge")
+        self.assertEqual(p1.card_probabilities()[3, card_utils.card_id("3h")], 0, "Probabilities are out of date")
+
+    def test_sample_deals_seeded(self):
+        deals = []
+        for _ in range(2):
+            p1 = Player.player_start_of_game(0, card_utils.ALL_CARDS[:9], rng=random.Random(0))
+            deals.append(p1.sample_deals(50))
+        self.assertTrue(np.array_equal(deals[0], deals[1]), "The same seed drew different deals")
+
+
+class TestISMCTS(unittest.TestCase):
+
+    def test_simulation(self):
+        deal = [-1] * constants.DECK_SIZE
+        hands = {0: ["2h", "3h", "4h"], 1: ["5h", "6h"], 2: ["7h"], 3: ["2c", "3c"], 4: ["4c", "5c"], 5: ["6c", "7c"]}
+        for ID, cards in hands.items():
+            for card in cards:
+                deal[card_utils.card_id(card)] = ID
+        simulation = Simulation(deal, 0)
+        self.assertFalse(simulation.ask(3, card_utils.card_id("5h")), "Ask for a card the target does not have")
+        self.assertEqual(simulation.turn, 3, "Turn did not pass to the player asked")
+        simulation.turn = 0
+        self.assertTrue(simulation.ask(1, card_utils.card_id("5h")), "Ask for a card the target has")
+        self.assertTrue(simulation.ask(1, card_utils.card_id("6h")), "Ask for a card the target has")
+        # Team 0 has all of the low hearts, so the half suit is done
+        self.assertEqual(simulation.score, [1, 0], "Half suit was not won")
+        self.assertEqual(simulation.num_cards[:3], [0, 0, 0], "Cards of a done half suit were not removed")
+        self.assertEqual(simulation.turn, 4, "Turn did not pass to a teammate with cards")
+        self.assertFalse(simulation.finished(), "Both teams have low clubs")
+        self.assertAlmostEqual(simulation.result(), (1 + 2 / 6) / 2, 9, "Wrong result")
+
+    def test_make_ask(self):
+        hand = ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"]
+        search = ISMCTS(iterations=50, rng=random.Random(0))
+        p1 = Player.player_start_of_game(0, hand, strategy=search)
+        target, card = p1.make_optimal_ask()
+        self.assertTrue(p1._check_legal_ask(target, card), "Illegal ask")
+        self.assertEqual(search.last_iterations, 50, "Wrong number of iterations")
+        engine = p1._probabilities()
+        search.make_ask(p1)
+        self.assertIs(p1._probabilities(), engine, "The search did not reuse the player's probability engine")
+        # The ask was visited, so the subtree of one of its outcomes is reused
+        action = search.root.actions[(target, card_utils.card_id(card))]
+        success, child = next(iter(action.outcomes.items()))
+        p1.update_transaction(0, target, card, success)
+        self.assertIs(search._advance(), child, "The tree was not reused")
+
+    def test_time_limit(self):
+        search = ISMCTS(iterations=None, time_limit=0.05, rng=random.Random(0))
+        p1 = Player.player_start_of_game(0, ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"], strategy=search)
+        p1.make_optimal_ask()
+        self.assertGreater(search.last_iterations, 0, "No iterations were run")
+        with self.assertRaises(ValueError):
+            ISMCTS(iterations=None)
+
+    def test_game_with_search(self):
+        results = []
+        for _ in range(2):
+            rng = random.Random(0)
+            game = FishGame.start_random_game(rng=rng, strategies={0: ISMCTS(iterations=20, rng=rng)})
+            self.assertFalse(game.run_whole_game(), "Game went on too long")
+            results.append((game.team0_score, game.team1_score, game.turns))
+        self.assertEqual(results[0], results[1], "The same seed played a different game")
+
+
+class TestEndgame(unittest.TestCase):
+
+    @staticmethod
+    def hands(cards_by_player):
+        hands = [0] * constants.NUM_PLAYERS
+        for ID, cards in cards_by_player.items():
+            for card in cards:
+                hands[ID] |= 1 << card_utils.card_id(card)
+        return tuple(hands)
+
+    def test_settle(self):
+        hands = self.hands({0: ["2h", "3h", "4h"], 2: ["5h", "6h", "7h"], 1: ["2c"], 3: ["3c"], 5: ["4c"]})
+        hands, turn, called0, called1 = settle(hands, 0)
+        self.assertEqual((called0, called1), (1, 0), "Low hearts were not called")
+        self.assertEqual(hands, self.hands({1: ["2c"], 3: ["3c"], 5: ["4c"]}), "Called cards were not removed")
+        self.assertEqual(turn, 0, "Turn changed although no team has cards")
+
+    def test_solve(self):
+        hands = self.hands({0: ["2h"], 1: ["3h", "4h", "2c"], 2: ["5h", "6h", "7h"], 3: ["3c", "4c", "5c"],
+                            4: ["6c"], 5: ["7c"]})
+        solver = EndgameSolver()
+        # The team with the turn takes every half suit that is left
+        self.assertEqual(solver.solve(hands, 0), 2, "Team 0 has the turn")
+        self.assertEqual(solver.solve(hands, 1), 0, "Team 1 has the turn")
+        self.assertTrue(solver.exact, "Value was not exact")
+        self.assertIn((settle(hands, 0)[0], 0), solver._memo, "Solved position was not memoized")
+        self.assertIsNone(EndgameSolver(node_limit=1).solve(hands, 0), "Node limit was ignored")
+        self.assertEqual(play_ask(hands, 0, 1, card_utils.card_id("3h"))[1], 0, "Turn passed after a success")
+        self.assertEqual(play_ask(hands, 0, 3, card_utils.card_id("3h"))[1], 3, "Turn did not pass after a failure")
+        # A position that repeats on the line is only estimated, and the estimate is not memoized
+        settled = settle(hands, 0)[0]
+        solver = EndgameSolver()
+        value, exact = solver._search(settled, 0, {(settled, 0)})
+        self.assertAlmostEqual(value, 5 / 6, 9, "Repetition was not valued by the share of the cards")
+        self.assertFalse(exact, "Estimated value was exact")
+        self.assertEqual(solver._memo, {}, "Estimated value was memoized")
+
+    def test_make_ask(self):
+        p1 = Player.player_start_of_game(0, ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"])
+        self.assertIsNone(EndgameSolver(rng=random.Random(0)).make_ask(p1), "Played with every card left")
+        target, card = EndgameSolver(max_cards=constants.DECK_SIZE, samples=5, rng=random.Random(0)).make_ask(p1)
+        self.assertTrue(p1._check_legal_ask(target, card), "Illegal ask")
+
+    def test_best_call(self):
+        p1 = Player.player_start_of_game(0, ["2h", "3h", "4h", "5h", "6h", "2d", "Ad", "8c", "SJ"])
+        call = EndgameSolver(rng=random.Random(0)).best_call(p1, "Lh")
+        self.assertEqual(sorted(card for _, card in call), sorted(card_utils.HS_CARD_NAMES[card_utils.HS_IDS["Lh"]]), "Wrong cards")
+        self.assertTrue(all(ID % 2 == 0 for ID, _ in call), "Called a card to an opponent")
+        self.assertIn((0, "2h"), call, "Called a card the player has to someone else")
+
+    def test_endgame_handoff(self):
+        game = FishGame.start_random_game(rng=random.Random(0))
+        self.assertEqual(game.endgame.max_cards, constants.ENDGAME_CARDS, "Solver is not on by default")
+        self.assertTrue(all(player.endgame is game.endgame for player in game.players), "Solver is not shared")
+        cards_left = []
+        make_ask = game.endgame.make_ask
+
+        def recording_make_ask(player):
+            ask = make_ask(player)
+            if ask is not None:
+                cards_left.append(sum(player.num_cards.values()))
+            return ask
+        game.endgame.make_ask = recording_make_ask
+        self.assertFalse(game.run_whole_game(), "Game went on too long")
+        self.assertTrue(cards_left, "Solver never chose an ask")
+        self.assertLessEqual(max(cards_left), constants.ENDGAME_CARDS, "Solver played with too many cards left")
+        self.assertIsNone(FishGame.start_random_game(rng=random.Random(0), endgame_cards=None).endgame,
+                          "Solver could not be turned off")
+
+    def test_force_calls(self):
+        for seed in range(3):
+            game = FishGame.start_random_game(rng=random.Random(seed))
+            self.assertFalse(game.run_whole_game(), "Game went on too long")
+            num_cards = game.players[0].num_cards
+            team = 0 if num_cards[0] + num_cards[2] + num_cards[4] else 1
+            game.force_calls(team)
+            self.assertEqual(game.team0_score + game.team1_score, 9, "Not every half suit was called")
+
+
 class TestGame(unittest.TestCase):
 
     def test_init_random_game(self):
@@ -324,6 +797,18 @@ class TestGame(unittest.TestCase):
             self.assertEqual(specific_game.players[i].info[1]["Jh"], constants.NO,
                              "Player {} doesn't know about the transaction".format(i))
 
+    @unittest.skipIf(constants.NUM_PLAYERS != 6, "only works if 6 players")
+    def test_shared_public_knowledge(self):
+        specific_game = FishGame([["2h", "9h"], ["3h", "Th"], ["4h", "Jh"], ["5h", "Qh"], ["6h", "Kh"], ["7h", "Ah"]],
+                                 0, 0, 0)
+        for player in specific_game.players:
+            self.assertIs(player.public, specific_game.public, "Player does not share the game's public knowledge")
+        specific_game.report_ask(0, 1, "3h", True)
+        self.assertEqual(specific_game.public.public_info[0]["3h"], constants.YES, "Public info not updated")
+        self.assertEqual(specific_game.public.num_cards[0], 10, "Number of cards updated more than once")
+        self.assertEqual(specific_game.players[1].info[1]["Th"], constants.YES, "Private info lost the player's own hand")
+        self.assertEqual(specific_game.players[1].info[0]["Th"], constants.NO, "Private info lost the player's own hand")
+
     def test_play_random_fish_game(self):
         game = FishGame.start_random_game()
         max_turns = 500
@@ -332,13 +817,168 @@ class TestGame(unittest.TestCase):
             print("Game went on >{} turns".format(max_turns))
 
 
+class TestBatchGame(unittest.TestCase):
+
+    def assertSameKnowledge(self, batch, game, msg):
+        for ID, player in enumerate(game.players):
+            self.assertTrue(np.array_equal(batch.knowledge()[0, ID], player.info.array), msg)
+            self.assertTrue(np.array_equal(batch.hs_info[0, ID], player.hs_info.array), msg)
+
+    def test_start_random_games(self):
+        batch = BatchFishGame.start_random_games(50, np.random.default_rng(0))
+        self.assertTrue(np.all(batch.num_cards == 9), "Not every player has 9 cards")
+        dealt = np.bitwise_or.reduce(batch.hands, axis=1)
+        self.assertTrue(np.all(dealt == card_utils.FULL_MASK), "Not every card was dealt")
+
+    @unittest.skipIf(constants.NUM_PLAYERS != 6, "only works if 6 players")
+    def test_asks_match_fish_game(self):
+        game = FishGame([["2h", "9h"], ["3h", "Th"], ["4h", "Jh"], ["5h", "Qh"], ["6h", "Kh"], ["7h", "Ah"]], 0, 0, 0)
+        batch = BatchFishGame.from_games([game])
+        self.assertSameKnowledge(batch, game, "Starting knowledge is different")
+        for ID_ask, ID_target, card, success in [(0, 1, "3h", True), (1, 0, "Jh", False), (2, 5, "7h", True)]:
+            game.report_ask(ID_ask, ID_target, card, success)
+            res = batch.report_asks(np.array([0]), np.array([ID_ask]), np.array([ID_target]),
+                                    np.array([card_utils.card_id(card)]))
+            self.assertEqual(res[0], success, "Ask had the wrong result")
+            self.assertSameKnowledge(batch, game, "Knowledge is different after {} asked for {}".format(ID_ask, card))
+
+    @unittest.skipIf(constants.NUM_PLAYERS != 6, "only works if 6 players")
+    def test_calls_match_fish_game(self):
+        game = FishGame([["9h"], ["Th"], ["Jh", "2h", "3h", "4h", "5h", "6h", "7h"], ["Qh"], ["Kh"], ["Ah"]], 0, 0, 0)
+        batch = BatchFishGame.from_games([game])
+        caller, hs = batch.find_calls()
+        self.assertEqual(caller[0], 2, "Did not find the player who can call")
+        self.assertEqual([card_utils.hs_name(hs[0]), 0, True], game.check_call(), "Did not find the same call")
+        game.report_call("Lh")
+        batch.report_calls(np.array([0]), caller, hs)
+        self.assertEqual(batch.team0_score[0], 1, "Call was not scored")
+        self.assertSameKnowledge(batch, game, "Knowledge is different after the call")
+
+    @staticmethod
+    def cycling_ask(hand, targets, turns):
+        """
+        Returns the (target, card id) ask that a deterministic policy makes on turn number turns:
+        the legal asks in order of target and card, taken in turn
+        """
+        wanted = 0
+        for hs_mask in card_utils.HS_MASKS:
+            if hand & hs_mask:
+                wanted |= hs_mask & ~hand
+        asks = [(target, c) for target in targets for c in card_utils.iter_mask(wanted)]
+        return asks[turns % len(asks)]
+
+    class CyclingAsk:
+        """
+        Strategy that makes the ask of cycling_ask, counting the turns from the asks it is told about
+        """
+        def __init__(self):
+            self.turns = 0
+
+        def make_ask(self, player):
+            hand = card_utils.cards_to_mask(player.own_cards())
+            targets = [t for t in range(1 - player.ID % 2, constants.NUM_PLAYERS, 2) if player.num_cards[t]]
+            target, c = TestBatchGame.cycling_ask(hand, targets, self.turns)
+            return target, card_utils.card_name(c)
+
+        def update_transaction(self, ID_ask, ID_target, card, success):
+            self.turns += 1
+
+        def update_call(self, hs, card_count_hs):
+            pass
+
+    @staticmethod
+    def cycling_policy(batch, askers):
+        # heuristic_policy, except that it falls back to the ask of cycling_ask instead of a random one
+        games = np.arange(len(askers))
+        targets, cards = heuristic_policy(batch, askers)
+        guarenteed = batch.yes[games, askers, targets] & batch_game.CARD_BITS[cards] != 0
+        for g in np.flatnonzero(~guarenteed):
+            ID = askers[g]
+            opponents = [t for t in range(1 - ID % 2, constants.NUM_PLAYERS, 2) if batch.hands[g, t]]
+            targets[g], cards[g] = TestBatchGame.cycling_ask(int(batch.hands[g, ID]), opponents, batch.turns[g])
+        return targets, cards
+
+    @unittest.skipIf(constants.NUM_PLAYERS != 6, "only works if 6 players")
+    def test_games_match_fish_game(self):
+        games = []
+        # The games of seeds 60 and 78 end with a team out of cards before every half suit is called
+        for seed in [0, 1, 2, 60, 78]:
+            game = FishGame.start_random_game(rng=random.Random(seed), endgame_cards=None,
+                                              strategies={ID: self.CyclingAsk() for ID in range(constants.NUM_PLAYERS)})
+            games.append(game)
+        batch = BatchFishGame.from_games(games)
+        for game in games:
+            self.assertFalse(game.run_whole_game(), "Game went on too long")
+        self.assertFalse(batch.run_all_games(self.cycling_policy).any(), "Batch game went on too long")
+        self.assertEqual(batch.final_team0_score.tolist(), [game.team0_score for game in games], "Team 0 scores differ")
+        self.assertEqual(batch.final_team1_score.tolist(), [game.team1_score for game in games], "Team 1 scores differ")
+        self.assertEqual(batch.final_turns.tolist(), [game.turns for game in games], "Numbers of turns differ")
+
+    def test_play_random_batch(self):
+        batch = BatchFishGame.start_random_games(20, np.random.default_rng(0))
+        timed_out = batch.run_all_games(heuristic_policy, max_turns=500)
+        self.assertEqual(len(batch.ids), 0, "Not every game was retired")
+        self.assertTrue(np.all(batch.final_team0_score + batch.final_team1_score <= 9), "Too many points were scored")
+        self.assertTrue(np.all(timed_out == (batch.final_turns > 500)), "Games that went on too long were not flagged")
+
+
+class TestSelfPlay(unittest.TestCase):
+
+    def test_replay_from_seed(self):
+        first = play_game(7, max_turns=100)
+        self.assertEqual(play_game(7, max_turns=100), first, "Game did not replay from its seed")
+
+    def test_run_self_play(self):
+        results = list(run_self_play(2, seed=3, processes=1, max_turns=100))
+        self.assertEqual(len({result.seed for result in results}), 2, "Games did not get their own seeds")
+        summary = summarize(results)
+        self.assertEqual(summary["games"], 2, "Summary did not count every game")
+        self.assertEqual(summary["team0_wins"] + summary["team1_wins"] + summary["ties"], 2, "Summary lost a game")
+
+
+class TestTournament(unittest.TestCase):
+
+    def test_elo(self):
+        self.assertAlmostEqual(score_to_elo(0.5), 0, 9, "Even score is not 0 Elo")
+        self.assertAlmostEqual(score_to_elo(elo_to_score(100)), 100, 6, "Conversions do not invert")
+        self.assertGreater(elo_to_score(100), 0.6, "Stronger player does not score more")
+
+    def test_match_stats(self):
+        stats = MatchStats()
+        stats.add(PairResult(0, (5, 4), (4, 5), 100, 0))
+        stats.add(PairResult(1, (6, 7), (3, 2), 100, 0))
+        self.assertEqual((stats.games, stats.wins, stats.losses), (4, 3, 1), "Wrong totals")
+        self.assertAlmostEqual(stats.score, 0.75, 9, "Wrong score")
+        self.assertAlmostEqual(stats.half_suit_diff, 2, 9, "Wrong half suit differential")
+        low, high = stats.elo_interval()
+        self.assertLess(low, stats.elo, "Elo is below its interval")
+        self.assertGreater(high, stats.elo, "Elo is above its interval")
+
+    def test_sprt(self):
+        lower, upper = sprt_bounds(0.05, 0.05)
+        self.assertAlmostEqual(lower, -upper, 9, "Symmetric errors give symmetric bounds")
+        strong, weak = MatchStats(), MatchStats()
+        for seed in range(200):
+            strong.add(PairResult(seed, (5, 5) if seed % 3 else (5, 4), (4, 4) if seed % 3 else (4, 5), 100, 0))
+            weak.add(PairResult(seed, (4, 4) if seed % 3 else (5, 4), (5, 5) if seed % 3 else (4, 5), 100, 0))
+        self.assertGreater(strong.llr(0, 30), upper, "A clearly stronger policy was not accepted")
+        self.assertLess(weak.llr(0, 30), lower, "A clearly weaker policy was not rejected")
+
+    def test_run_match(self):
+        # Both games of a pair play the same deal from either side, so a policy against itself always splits them
+        stats, decision = run_match(POLICIES["greedy"], POLICIES["greedy"], max_pairs=2, processes=1)
+        self.assertEqual(stats.pairs, 2, "Wrong number of pairs")
+        self.assertEqual(stats.wins, stats.losses, "Mirror games did not split")
+        self.assertIsNone(decision, "Decided without evidence")
+
+
 class TestModel(unittest.TestCase):
 
     def test_generate_state_vector(self):
         own_hand = ["2h", "3h", "4h", "5h", "6h", "7h", "8h", "9h", "Th"]
         player = Player.player_start_of_game(0, own_hand)
-        state_vector_res = FishDecisionMaker.generate_state_vector(player.info, player.hs_info, player.num_cards,
-                                                                   player.public_info, 0)
+        state_vector_res = encoding.generate_state_vector(player.info, player.hs_info, player.num_cards,
+                                                          player.public_info, 0)
         state_vector_expected = []
         for i in range(constants.NUM_PLAYERS):
             for c in card_utils.gen_all_cards():
@@ -355,12 +995,273 @@ class TestModel(unittest.TestCase):
         state_vector_expected += [0 for i in range(9 * (constants.NUM_PLAYERS - 1))]
         state_vector_expected += [9 for i in range(constants.NUM_PLAYERS)]
         self.assertEqual(len(state_vector_res), len(state_vector_expected), "Length of state vector not correct")
-        self.assertEqual(state_vector_res, state_vector_expected, "State vector not correct")
+        self.assertEqual(state_vector_res.tolist(), state_vector_expected, "State vector not correct")
+
+    def test_generate_state_batch(self):
+        game = FishGame.start_random_game()
+        game.report_ask(0, 1, game.player_cards[1][0], True)
+        players = game.players
+        buffer = np.zeros((len(players), constants.SIZE_STATES), dtype=np.float32)
+        batch = encoding.generate_state_batch(
+            [p.info.array for p in players], [p.hs_info.array for p in players],
+            [p.num_cards.array for p in players], [p.public_info.array for p in players],
+            [p.ID for p in players], out=buffer)
+        self.assertIs(batch, buffer, "Batch was not written into the given buffer")
+        for p in players:
+            row = np.zeros(constants.SIZE_STATES, dtype=np.float32)
+            encoding.generate_state_vector(p.info, p.hs_info, p.num_cards, p.public_info, p.ID, out=row)
+            self.assertTrue(np.array_equal(batch[p.ID], row), "Batch state of player {} not correct".format(p.ID))
+
+    def test_import_without_tensorflow(self):
+        res = subprocess.run([sys.executable, "-c", "import sys, model, game, frozen_model; sys.exit('tensorflow' in sys.modules)"],
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(res.returncode, 0, "Importing model or game imported tensorflow")
 
     def test_generate_action_number(self):
-        action_res = FishDecisionMaker.generate_action_number(2, 5, "BJ")
+        action_res = encoding.generate_action_number(2, 5, "BJ")
         self.assertEqual(action_res, 107)
+        actions = encoding.generate_action_numbers(np.array([2, 0]), np.array([5, 1]),
+                                                   np.array([card_utils.card_id("BJ"), 0]))
+        self.assertEqual(actions.tolist(), [107, 0], "Batch action numbers not correct")
+
+
+class TestReplayMemory(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        memory = ReplayMemory(capacity=3, state_size=2)
+        for i in range(5):
+            memory.add([i, -i], i, float(i), i == 4)
+        self.assertEqual(len(memory), 3, "Memory grew past its capacity")
+        self.assertEqual(sorted(memory.actions.tolist()), [2, 3, 4], "Oldest transitions were not overwritten")
+        memory.add_batch(np.array([[5, 5], [6, 6]]), np.array([5, 6]), np.array([5., 6.]), np.array([False, True]))
+        self.assertEqual(sorted(memory.actions.tolist()), [4, 5, 6], "Batch did not overwrite the oldest transitions")
+        states, actions, rewards, dones = memory.sample(10, np.random.default_rng(0))
+        self.assertEqual(states.shape, (10, 2), "Sampled states have the wrong shape")
+        self.assertTrue(np.all(states[:, 0] == actions), "Sampled fields do not belong to the same transitions")
+
+    def test_memmap_persistence(self):
+        with tempfile.TemporaryDirectory() as path:
+            memory = ReplayMemory(capacity=4, state_size=2, path=path)
+            memory.add([1, 2], 3, 1.5, True)
+            memory.flush()
+            del memory
+            reopened = ReplayMemory(capacity=4, state_size=2, path=path)
+            self.assertEqual(len(reopened), 1, "Reopened memory lost its transitions")
+            self.assertEqual(reopened.states[0].tolist(), [1, 2], "Reopened memory lost its states")
+            self.assertEqual(reopened.position, 1, "Reopened memory does not continue where it left off")
+            del reopened
+
+
+class TestInference(unittest.TestCase):
+
+    @staticmethod
+    def predict(states):
+        # Scores every action by its number, so the highest legal action number is chosen
+        return np.tile(np.arange(constants.SIZE_ACTIONS, dtype=np.float32), (len(states), 1))
+
+    def test_legal_action_mask(self):
+        p1 = Player.player_start_of_game(3, ["5h", "7h", "Jh", "2d", "Ad", "8c", "SJ", "6s", "6c"])
+        mask = legal_action_mask(p1)
+        asks = {encoding.action_to_ask(p1.ID, action) for action in np.flatnonzero(mask)}
+        self.assertEqual(asks, set(legal_asks(p1)), "Mask does not match the legal asks")
+        self.assertEqual(encoding.action_to_ask(2, encoding.generate_action_number(2, 5, "BJ")),
+                         (5, card_utils.card_id("BJ")), "action_to_ask does not invert generate_action_number")
+
+    def test_batching(self):
+        masks = np.zeros((10, constants.SIZE_ACTIONS), dtype=bool)
+        for i in range(10):
+            masks[i, [i, 20 + i]] = True
+        masks[9] = False
+        states = np.zeros((10, constants.SIZE_STATES), dtype=np.int8)
+        server = InferenceServer(self.predict, max_batch=8, max_delay=0.05)
+
+        async def decide_all():
+            async with server:
+                return await asyncio.gather(*(server.decide(states[i], masks[i]) for i in range(10)),
+                                            return_exceptions=True)
+        results = asyncio.run(decide_all())
+        self.assertEqual(results[:9], [20 + i for i in range(9)], "Wrong legal actions chosen")
+        self.assertIsInstance(results[9], ValueError, "A state with no legal action was answered")
+        self.assertEqual(server.stats.batches, 2, "Full batch was not run without waiting")
+        self.assertEqual(server.stats.batch_sizes[8], 1, "Batch was not filled to max_batch")
+
+    def test_threaded_games(self):
+        with InferenceServer(self.predict, max_delay=0.001) as server:
+            game = FishGame.start_random_game(rng=random.Random(0), endgame_cards=None,
+                                              strategies={ID: InferenceStrategy(server) for ID in range(0, 6, 2)})
+            self.assertFalse(game.run_whole_game(), "Game went on too long")
+        self.assertGreater(server.stats.requests, 0, "Server was not used")
+
+
+class TestFrozenModel(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.model = FrozenModel([(rng.standard_normal((constants.SIZE_STATES, 64)) * 0.05, rng.standard_normal(64),
+                                   "relu"),
+                                  (rng.standard_normal((64, constants.SIZE_ACTIONS)) * 0.1,
+                                   rng.standard_normal(constants.SIZE_ACTIONS), "linear")])
+        self.states = rng.integers(-1, 2, (16, constants.SIZE_STATES)).astype(np.int8)
+
+    def test_predict(self):
+        q_values = self.model.predict(self.states)
+        self.assertEqual(q_values.shape, (16, constants.SIZE_ACTIONS), "Wrong output shape")
+        kernel, bias, _ = self.model.layers[0]
+        expected = np.maximum(self.states @ kernel + bias, 0) @ self.model.layers[1][0] + self.model.layers[1][1]
+        self.assertTrue(np.allclose(q_values, expected, atol=1e-4), "Wrong Q values")
+        self.assertTrue(np.allclose(self.model.predict(self.states[3]), q_values[3], atol=1e-5),
+                        "A single state does not give the same Q values as in a batch")
+        with self.assertRaises(ValueError):
+            FrozenModel([(kernel, bias, "swish")])
+
+    def test_save_load(self):
+        q_values = self.model.predict(self.states)
+        with tempfile.TemporaryDirectory() as d:
+            sizes, memory = {}, {}
+            for weights, tolerance in (("float32", 1e-6), ("float16", 1e-2), ("int8", 5e-2)):
+                path = os.path.join(d, weights + ".npz")
+                self.model.save(path, weights)
+                sizes[weights] = os.path.getsize(path)
+                loaded = FrozenModel.load(path)
+                self.assertEqual(loaded.weights, weights, "Weights were not kept as they were stored")
+                memory[weights] = loaded.nbytes
+                self.assertLess(np.abs(loaded.predict(self.states) - q_values).max(),
+                                tolerance * np.abs(q_values).max(),
+                                "{} weights changed the Q values too much".format(weights))
+            with self.assertRaises(ValueError):
+                self.model.save(os.path.join(d, "bad.npz"), "int4")
+        self.assertLess(sizes["int8"], sizes["float16"], "int8 file is not smaller")
+        self.assertLess(sizes["float16"], sizes["float32"], "float16 file is not smaller")
+        self.assertLess(memory["int8"], memory["float16"], "int8 weights do not take less memory")
+        self.assertLess(memory["float16"], memory["float32"], "float16 weights do not take less memory")
+
+    @unittest.skipIf(importlib.util.find_spec("tensorflow") is None, "needs tensorflow")
+    def test_matches_keras(self):
+        from tensorflow import keras
+        import model
+        decision_maker = model.FishDecisionMaker(keras.layers.InputLayer(input_shape=(constants.SIZE_STATES,)),
+                                                 keras.layers.Dense(64, activation="relu"),
+                                                 keras.layers.Dense(constants.SIZE_ACTIONS),
+                                                 optimizer="adam", loss="mse")
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "model.npz")
+            decision_maker.export_numpy(path)
+            q_values = FrozenModel.load(path).predict(self.states)
+        expected = decision_maker.predict(self.states.astype(np.float32), verbose=0)
+        self.assertTrue(np.allclose(q_values, expected, atol=1e-4), "Q values differ from keras")
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        results = benchmarks.run_benchmarks(["generate_state_vector"], scale=0.001)
+        self.assertEqual(list(results), ["generate_state_vector"], "Did not run only the chosen scenario")
+        for key in ["ops_per_sec", "p50_us", "p99_us", "peak_memory_kb"]:
+            self.assertGreater(results["generate_state_vector"][key], 0, "{} was not measured".format(key))
+
+    def test_compare_with_baseline(self):
+        baseline = {"a": {"p50_us": 10.0}, "b": {"p50_us": 10.0}}
+        results = {"a": {"p50_us": 11.0}, "b": {"p50_us": 13.0}, "c": {"p50_us": 100.0}}
+        self.assertEqual(benchmarks.compare(results, baseline, 0.2), [("b", 10.0, 13.0)], "Wrong regressions flagged")
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_stats_disabled_by_default(self):
+        game = FishGame.start_random_game(rng=random.Random(0))
+        game.run_whole_game()
+        self.assertIsNone(game.stats, "Game collected stats without being asked to")
+
+    def test_game_stats(self):
+        plain = FishGame.start_random_game(rng=random.Random(0))
+        plain.run_whole_game()
+        game = FishGame.start_random_game(rng=random.Random(0), stats=True)
+        game.run_whole_game()
+        self.assertEqual((game.team0_score, game.team1_score, game.turns),
+                         (plain.team0_score, plain.team1_score, plain.turns), "Stats changed how the game played")
+        stats = game.stats
+        self.assertEqual(stats.turns, game.turns, "Wrong number of turns")
+        self.assertEqual(stats.phase_calls["get_move"], game.turns, "Every turn should time one move")
+        self.assertGreater(stats.phase_time["report_ask"], 0, "report_ask was not timed")
+        # The public tables are propagated lazily, so the last events wait for a read
+        game.public.flush()
+        self.assertEqual(stats.public.events, game.turns + stats.phase_calls["report_call"],
+                         "Every ask and call is one public event")
+        for player_stats in stats.players:
+            self.assertGreater(player_stats.checks, 0, "Rule checks were not counted")
+            self.assertGreater(player_stats.resolved, 0, "Resolved entries were not counted")
+
+
+class TestTranscript(unittest.TestCase):
+
+    def test_records_round_trip(self):
+        for ask in [(0, 3, "2c", True), (5, 2, "BJ", False), (4, 1, "Ah", True)]:
+            self.assertEqual(transaction.decode_word(transaction.encode_ask(*ask)), ask, "Ask changed")
+        for call in [("Lc", 0, True), ("8J", 1, False)]:
+            self.assertEqual(transaction.decode_word(transaction.encode_call(*call)), call, "Call changed")
+
+    def test_replay_games(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "games.fish")
+            games = []
+            with transaction.TranscriptWriter(path) as writer:
+                for seed in range(3):
+                    game = FishGame.start_random_game(rng=random.Random(seed), transcript=writer)
+                    hands = [list(game.player_cards[ID]) for ID in range(constants.NUM_PLAYERS)]
+                    game.run_whole_game()
+                    games.append((hands, game.turn, game.team0_score, game.team1_score))
+            transcripts = list(transaction.read_transcripts(path))
+        self.assertEqual(len(transcripts), 3, "Wrong number of games read")
+        for (hands, _, team0_score, team1_score), transcript in zip(games, transcripts):
+            self.assertEqual(transcript.deal.player_cards, hands, "Deal changed")
+            score = [transcript.deal.team0_score, transcript.deal.team1_score]
+            for event in transcript.events:
+                if isinstance(event, transaction.Call):
+                    score[event.team if event.success else 1 - event.team] += 1
+            self.assertEqual(score, [team0_score, team1_score], "Calls do not add up to the score")
+            asks = [event for event in transcript.events if isinstance(event, transaction.Transaction)]
+            self.assertTrue(asks, "No asks were recorded")
+
+    def test_truncated_transcript(self):
+        with tempfile.TemporaryFile() as f:
+            with transaction.TranscriptWriter(f) as writer:
+                writer.start_game([card_utils.ALL_CARDS[9 * i:9 * (i + 1)] for i in range(6)], 0)
+                writer.write_ask(0, 1, "2c", False)
+            f.write(b"\x00")
+            f.seek(0)
+            with self.assertRaises(TranscriptException):
+                list(transaction.iter_records(f))
+
+
+class TestReplay(unittest.TestCase):
+
+    def test_replay_matches_live_game(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "games.fish")
+            with transaction.TranscriptWriter(path) as writer:
+                game = FishGame.start_random_game(rng=random.Random(1), transcript=writer)
+                live_states = []
+                report_ask = game.report_ask
+
+                def record_ask(ID_ask, ID_target, card, success):
+                    p = game.players[ID_ask]
+                    live_states.append(encoding.generate_state_vector(p.info, p.hs_info, p.num_cards, p.public_info,
+                                                                      ID_ask))
+                    report_ask(ID_ask, ID_target, card, success)
+                game.report_ask = record_ask
+                game.run_whole_game()
+            (transitions,) = replay.replay_transcripts(path, processes=1)
+            (seat_transitions,) = replay.replay_transcripts(path, seats=[2], processes=1)
+        np.testing.assert_array_equal(transitions.states, np.array(live_states))
+        np.testing.assert_array_equal(seat_transitions.states, transitions.states[transitions.seats == 2])
+        for ID in range(constants.NUM_PLAYERS):
+            dones = transitions.dones[transitions.seats == ID]
+            if len(dones):
+                self.assertTrue(dones[-1] and not dones[:-1].any(), "Only a player's last ask should be done")
 
+        memory = ReplayMemory(capacity=1000)
+        self.assertEqual(replay.fill_memory(memory, [transitions]), len(live_states), "Wrong number of transitions")
+        self.assertEqual(len(memory), len(live_states), "Transitions were not added to the memory")
 
 if __name__ == "__main__":
-    unittest.main(verbosity=2)
\ No newline at end of file
+    unittest.main(verbosity=2)